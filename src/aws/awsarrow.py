@@ -0,0 +1,11 @@
+# pyarrow is optional, only the Arrow and Parquet files need it
+def import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow is required for the .arrow and .parquet files, "
+            "install it with: pip install pyarrow"
+        ) from e
+    return pa, pq
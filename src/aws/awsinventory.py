@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import boto3
+
+# Local inventory of the bucket keys
+S3_INVENTORY_FILE = f"{Path().resolve()}/src/data/s3_inventory.db"
+
+
+class S3Inventory:
+    """
+    A local, persisted inventory of the keys of an S3 bucket with their sizes and
+    ETags, so the uploads can skip the objects that already exist without a request.
+
+    The objects are keyed by the SHA-256 of their content, an object with the same
+    key and size is the same file. The inventory is built with a paginated
+    list_objects_v2 and updated after every successful upload. A bucket is synced
+    once a listing filled its inventory, an inventory that only has the uploads of
+    this machine is not synced, the objects uploaded from elsewhere are missing.
+
+    The inventory is a SQLite database in WAL mode, every process opens its own
+    connection and the threads of a process share it.
+
+    Args:
+        file_name (str): The path of the SQLite database.
+    """
+
+    def __init__(self, file_name: str = S3_INVENTORY_FILE) -> None:
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            file_name, timeout=60, check_same_thread=False
+        )
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS objects (
+                    bucket TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    etag TEXT,
+                    PRIMARY KEY (bucket, key)
+                )
+                """)
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS syncs (
+                    bucket TEXT PRIMARY KEY,
+                    synced_at REAL NOT NULL
+                )
+                """)
+
+    @staticmethod
+    def is_synced(file_name: str, bucket_name: str) -> bool:
+        """Check if an inventory file has a listing of the bucket, never creating it."""
+        if not os.path.exists(file_name):
+            return False
+        inventory = S3Inventory(file_name)
+        try:
+            return inventory.synced(bucket_name)
+        finally:
+            inventory.close()
+
+    @classmethod
+    def build(cls, file_name: str, s3_client: boto3.client, bucket_name: str) -> int:
+        """
+        Build an inventory file with a full listing of the bucket.
+
+        The inventory is built in a temporary file that replaces the file only when
+        the listing is complete, a failed listing leaves the file as it was.
+
+        Returns:
+            int: The number of objects in the bucket.
+        """
+        temp_file = f"{file_name}.tmp"
+        inventory = cls(temp_file)
+        try:
+            total = inventory.refresh(s3_client, bucket_name)
+            inventory.close()
+            os.replace(temp_file, file_name)
+            return total
+        finally:
+            inventory.close()
+            for temp_name in (temp_file, f"{temp_file}-wal", f"{temp_file}-shm"):
+                if os.path.exists(temp_name):
+                    os.remove(temp_name)
+
+    def refresh(self, s3_client: boto3.client, bucket_name: str) -> int:
+        """
+        Replace the inventory of the bucket with a full listing of the bucket.
+
+        Args:
+            s3_client (boto3.client): The S3 client.
+            bucket_name (str): The name of the bucket.
+
+        Returns:
+            int: The number of objects in the bucket.
+        """
+        paginator = s3_client.get_paginator("list_objects_v2")
+        objects = (
+            (bucket_name, item["Key"], item["Size"], item.get("ETag"))
+            for page in paginator.paginate(Bucket=bucket_name)
+            for item in page.get("Contents", [])
+        )
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM objects WHERE bucket = ?", (bucket_name,)
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)", objects
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO syncs VALUES (?, ?)", (bucket_name, time.time())
+            )
+        return len(self)
+
+    def synced(self, bucket_name: str) -> bool:
+        """Check if the inventory has a full listing of the bucket."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM syncs WHERE bucket = ?", (bucket_name,)
+            ).fetchone()
+        return row is not None
+
+    def get(self, bucket_name: str, key: str) -> dict:
+        """
+        Get an object of the inventory.
+
+        Returns:
+            dict: The size and etag of the object, None if it is not in the bucket.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, etag FROM objects WHERE bucket = ? AND key = ?",
+                (bucket_name, key),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"size": row[0], "etag": row[1]}
+
+    def contains(self, bucket_name: str, key: str, size: int = None) -> bool:
+        """Check if the object is in the bucket, with the same size if it is set."""
+        entry = self.get(bucket_name, key)
+        return entry is not None and (size is None or entry["size"] == size)
+
+    def put(self, bucket_name: str, key: str, size: int, etag: str = None) -> None:
+        """Add or update an object of the inventory."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)",
+                (bucket_name, key, size, etag),
+            )
+
+    def delete(self, bucket_name: str, key: str) -> None:
+        """Remove an object from the inventory."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM objects WHERE bucket = ? AND key = ?", (bucket_name, key)
+            )
+
+    def close(self) -> None:
+        """Close the database connection, it can be closed more than once."""
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM objects").fetchone()[
+                0
+            ]
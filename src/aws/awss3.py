@@ -1,17 +1,41 @@
 import argparse
+import csv
 import os
+import queue
 import sys
 import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 
 import boto3
+import pandas as pd
+from awsarrow import import_pyarrow
+from awsinventory import S3_INVENTORY_FILE, S3Inventory
 from awssession import AwsSession
+from awstransfer import S3Transfer
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 
 # Load .env variables
 _ = load_dotenv(dotenv_path=f"{Path().resolve()}/src/.env")
 
+# Connections of the S3 client, shared by the listing and transfer threads
+MAX_POOL_CONNECTIONS = 32
+
+# Upper bounds of the listing shards, the keys are SHA-256 hex digests, the first
+# shard has every key up to "1" and the last every key after "f"
+SHARD_BOUNDS = list("123456789abcdef")
+
+# Columns of the listing files
+LISTING_COLUMNS = ["FILE_NAME", "SIZE", "ETAG", "LAST_MODIFIED"]
+
+# Directory of the downloaded files
+DOWNLOAD_DIRECTORY = f"{Path().resolve()}/src/data/0_raw"
+
+# Keys of a delete_objects request, the maximum of the API
+DELETE_BATCH_SIZE = 1000
+
 
 class AwsS3:
     """
@@ -30,7 +54,9 @@ class AwsS3:
         if AwsS3._instance is not None:
             raise Exception("This class is a singleton!")
         else:
-            AwsS3._instance: boto3.Session = AwsSession.getInstance().client("s3")
+            AwsS3._instance: boto3.Session = AwsSession.getInstance().client(
+                "s3", config=Config(max_pool_connections=MAX_POOL_CONNECTIONS)
+            )
 
     @staticmethod
     def getInstance() -> boto3.client:
@@ -50,29 +76,185 @@ class ControllerAwsS3:
 
     This class provides methods for listing, uploading,
     downloading, and deleting files in an S3 bucket.
+
+    Args:
+        inventory (S3Inventory, optional): The local inventory of the bucket, the
+        files already in the bucket are not uploaded again.
     """
 
-    def __init__(self):
+    def __init__(self, inventory: S3Inventory = None):
         """
         Initializes an instance of the AwsS3 class.
         """
         self.awss3 = AwsS3.getInstance()
+        self.inventory = inventory
+
+    def list_objects(self, bucket_name: str, start_after: str = None, end: str = None):
+        """
+        List the objects of a bucket, page by page, as a generator.
+
+        Args:
+            bucket_name (str): The name of the bucket.
+            start_after (str, optional): List the keys after this key.
+            end (str, optional): Stop at the first key after this key.
+
+        Yields:
+            list: The objects of each page, at most 1000.
+        """
+        paginator = self.awss3.get_paginator("list_objects_v2")
+        arguments = {"Bucket": bucket_name}
+        if start_after:
+            arguments["StartAfter"] = start_after
+        try:
+            for page in paginator.paginate(**arguments):
+                objects = page.get("Contents", [])
+                if end is not None and objects and objects[-1]["Key"] > end:
+                    yield [item for item in objects if item["Key"] <= end]
+                    return
+                if objects:
+                    yield objects
+        except ClientError as e:
+            raise e
+
+    def list_objects_sharded(self, bucket_name: str, workers: int = 16):
+        """
+        List the objects of a bucket listing 16 ranges of keys concurrently, the
+        pages are yielded as they arrive, not in key order.
+
+        The ranges are (, "1"], ("1", "2"], ..., ("f", ), the pages wait in a bounded
+        queue, so the memory doesn't grow with the size of the bucket.
+
+        Args:
+            bucket_name (str): The name of the bucket.
+            workers (int): The number of ranges listed at the same time.
+
+        Yields:
+            list: The objects of each page, at most 1000.
+        """
+        ranges = list(zip([None] + SHARD_BOUNDS, SHARD_BOUNDS + [None]))
+        pages = queue.Queue(maxsize=2 * workers)
+        stop = threading.Event()
+        done = object()
+
+        def list_range(start_after, end):
+            try:
+                for objects in self.list_objects(bucket_name, start_after, end):
+                    if stop.is_set():
+                        return
+                    pages.put(objects)
+            except Exception as e:
+                pages.put(e)
+            finally:
+                pages.put(done)
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        for start_after, end in ranges:
+            executor.submit(list_range, start_after, end)
+        pending = len(ranges)
+        try:
+            while pending:
+                objects = pages.get()
+                if objects is done:
+                    pending -= 1
+                elif isinstance(objects, Exception):
+                    raise objects
+                else:
+                    yield objects
+        finally:
+            # Unblock the ranges still listing if the listing stops early
+            stop.set()
+            while pending:
+                if pages.get() is done:
+                    pending -= 1
+            executor.shutdown(wait=True)
+
+    def save_objects(self, pages, file_name: str) -> int:
+        """
+        Write a listing to a CSV file, or a Parquet file if the file name ends with
+        .parquet, one page at a time.
+
+        Args:
+            pages (iterable): The pages of the listing, see list_objects.
+            file_name (str): The path of the file.
+
+        Returns:
+            int: The number of objects written.
+        """
+        total = 0
+
+        def rows(objects):
+            return [
+                (
+                    item["Key"],
+                    item["Size"],
+                    item.get("ETag", "").strip('"'),
+                    item["LastModified"].isoformat(),
+                )
+                for item in objects
+            ]
+
+        if file_name.endswith(".parquet"):
+            pa, pq = import_pyarrow()
+
+            schema = pa.schema(
+                [
+                    ("FILE_NAME", pa.string()),
+                    ("SIZE", pa.int64()),
+                    ("ETAG", pa.string()),
+                    ("LAST_MODIFIED", pa.string()),
+                ]
+            )
+            with pq.ParquetWriter(file_name, schema) as writer:
+                for objects in pages:
+                    columns = list(zip(*rows(objects)))
+                    writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                    total += len(objects)
+            return total
+        with open(file_name, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(LISTING_COLUMNS)
+            for objects in pages:
+                writer.writerows(rows(objects))
+                total += len(objects)
+        return total
+
+    def exists(self, bucket_name: str, object_name: str, size: int = None) -> bool:
+        """
+        Check if an object is in a bucket, with the same size if it is set.
 
-    def list_objects(self, bucket_name: str) -> dict:
-        """List all objects in a bucket."""
+        A synced inventory answers without a request, otherwise it is a HEAD request
+        of the object.
+        """
+        if self.inventory is not None and self.inventory.synced(bucket_name):
+            return self.inventory.contains(bucket_name, object_name, size)
         try:
-            return self.awss3.list_objects(Bucket=bucket_name)
+            response = self.awss3.head_object(Bucket=bucket_name, Key=object_name)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise e
+        return size is None or response["ContentLength"] == size
+
+    def sync_inventory(self, bucket_name: str) -> int:
+        """Rebuild the inventory with a full listing of the bucket."""
+        try:
+            return self.inventory.refresh(self.awss3, bucket_name)
         except ClientError as e:
             raise e
 
     def upload_file(
         self, file_name: str, bucket_name: str, object_name: str = None
     ) -> dict:
-        """Upload a file to a bucket."""
+        """Upload a file to a bucket, if it is not already in the bucket."""
         if object_name is None:
             object_name = os.path.basename(file_name)
+        if self.inventory is not None and self.exists(
+            bucket_name, object_name, os.path.getsize(file_name)
+        ):
+            print(f"{object_name} is already in the bucket")
+            return None
         try:
-            return self.awss3.upload_file(
+            response = self.awss3.upload_file(
                 file_name,
                 bucket_name,
                 object_name,
@@ -80,6 +262,10 @@ class ControllerAwsS3:
             )
         except ClientError as e:
             raise e
+        if self.inventory is not None:
+            # The managed upload doesn't return the ETag, the size is enough to skip
+            self.inventory.put(bucket_name, object_name, os.path.getsize(file_name))
+        return response
 
     def download_file(
         self, file_name: str, bucket_name: str, object_name: str = None
@@ -88,15 +274,15 @@ class ControllerAwsS3:
         if object_name is None:
             object_name = os.path.basename(file_name)
         try:
-            object_summary = boto3.resource("s3").ObjectSummary(
-                bucket_name, object_name
-            )
-            with open(f"{Path().resolve()}/src/data/0_raw/{file_name}", "wb") as f:
+            size = self.awss3.head_object(Bucket=bucket_name, Key=object_name)[
+                "ContentLength"
+            ]
+            with open(f"{DOWNLOAD_DIRECTORY}/{file_name}", "wb") as f:
                 return self.awss3.download_fileobj(
                     bucket_name,
                     object_name,
                     f,
-                    Callback=ProgressPercentage(file_name, object_summary.size),
+                    Callback=ProgressPercentage(file_name, size),
                 )
         except ClientError as e:
             raise e
@@ -104,9 +290,119 @@ class ControllerAwsS3:
     def delete_file(self, bucket_name: str, object_name: str) -> dict:
         """Delete a file from a bucket."""
         try:
-            return boto3.resource("s3").Object(bucket_name, object_name).delete()
+            response = self.awss3.delete_object(Bucket=bucket_name, Key=object_name)
         except ClientError as e:
             raise e
+        if self.inventory is not None:
+            self.inventory.delete(bucket_name, object_name)
+        return response
+
+    def upload_dir(self, directory: str, bucket_name: str, workers: int = 16) -> dict:
+        """
+        Upload the files of a directory to a bucket from a pool of threads, the hidden
+        files are ignored and the files already in the bucket are not uploaded again.
+
+        Returns:
+            dict: The number of files uploaded and skipped, and the errors.
+        """
+        files = [
+            (entry.path, entry.name)
+            for entry in os.scandir(directory)
+            if entry.is_file() and not entry.name.startswith(".")
+        ]
+        transfer = S3Transfer(
+            self.awss3, bucket_name, max_workers=workers, inventory=self.inventory
+        )
+        try:
+            futures = transfer.upload_many(files)
+            wait(futures)
+        finally:
+            transfer.shutdown()
+        errors = [future.exception() for future in futures if future.exception()]
+        uploaded = sum(
+            1 for future in futures if not future.exception() and future.result()
+        )
+        return {
+            "uploaded": uploaded,
+            "skipped": len(futures) - uploaded - len(errors),
+            "errors": errors,
+        }
+
+    def download_many(
+        self,
+        object_names: list,
+        bucket_name: str,
+        directory: str = DOWNLOAD_DIRECTORY,
+        workers: int = 16,
+    ) -> dict:
+        """
+        Download many files from a bucket from a pool of threads.
+
+        Returns:
+            dict: The number of files downloaded and the errors.
+        """
+
+        def download(object_name):
+            self.awss3.download_file(
+                bucket_name, object_name, os.path.join(directory, object_name)
+            )
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(download, name) for name in object_names]
+        errors = [future.exception() for future in futures if future.exception()]
+        return {"downloaded": len(futures) - len(errors), "errors": errors}
+
+    def delete_many(
+        self, object_names: list, bucket_name: str, workers: int = 4
+    ) -> dict:
+        """
+        Delete many files from a bucket, with delete_objects requests of 1000 keys.
+
+        Returns:
+            dict: The number of files deleted and the errors.
+        """
+
+        def delete(batch):
+            try:
+                response = self.awss3.delete_objects(
+                    Bucket=bucket_name,
+                    Delete={
+                        "Objects": [{"Key": name} for name in batch],
+                        "Quiet": True,
+                    },
+                )
+            except ClientError as e:
+                return [{"Key": name, "Message": str(e)} for name in batch]
+            errors = response.get("Errors", [])
+            if self.inventory is not None:
+                failed = {error["Key"] for error in errors}
+                for name in batch:
+                    if name not in failed:
+                        self.inventory.delete(bucket_name, name)
+            return errors
+
+        batches = [
+            object_names[i : i + DELETE_BATCH_SIZE]
+            for i in range(0, len(object_names), DELETE_BATCH_SIZE)
+        ]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            errors = [
+                error for batch in executor.map(delete, batches) for error in batch
+            ]
+        return {"deleted": len(object_names) - len(errors), "errors": errors}
+
+
+def read_manifest(file_name: str) -> list:
+    """
+    Read the object names of a manifest: a CSV or Parquet file with a FILE_NAME
+    column, as written by --list --output, or a text file with one name per line.
+    """
+    if file_name.endswith(".csv"):
+        return pd.read_csv(file_name, usecols=["FILE_NAME"])["FILE_NAME"].tolist()
+    if file_name.endswith(".parquet"):
+        return pd.read_parquet(file_name, columns=["FILE_NAME"])["FILE_NAME"].tolist()
+    with open(file_name) as f:
+        return [line.strip() for line in f if line.strip()]
 
 
 class ProgressPercentage:
@@ -172,6 +468,13 @@ def main():
         help="list all objects in the bucket",
         action=argparse.BooleanOptionalAction,
     )
+    # 1.1. write the list of objects to a CSV or Parquet file
+    parser.add_argument(
+        "--output",
+        type=str,
+        metavar="out",
+        help="write the list of objects to a CSV or Parquet file",
+    )
     # 2. upload a file to a bucket
     parser.add_argument(
         "--upload", type=str, metavar="up", help="upload a file to a bucket"
@@ -185,6 +488,52 @@ def main():
         "--delete", type=str, metavar="del", help="delete a file from a bucket"
     )
 
+    # 5. upload the files of a directory to a bucket
+    parser.add_argument(
+        "--upload-dir",
+        type=str,
+        metavar="updir",
+        help="upload the files of a directory to a bucket",
+    )
+    # 6. download the files of a manifest from a bucket
+    parser.add_argument(
+        "--download-many",
+        type=str,
+        metavar="manifest",
+        help="download the files of a manifest (CSV, Parquet or text) from a bucket",
+    )
+    # 7. delete the files of a manifest from a bucket
+    parser.add_argument(
+        "--delete-many",
+        type=str,
+        metavar="manifest",
+        help="delete the files of a manifest (CSV, Parquet or text) from a bucket",
+    )
+    # 8. threads of the bulk transfers
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        metavar="w",
+        help="number of concurrent transfers of the bulk modes",
+    )
+    # 9. skip the confirmation of --delete-many
+    parser.add_argument(
+        "--yes",
+        type=str,
+        metavar="y",
+        help="delete the files of --delete-many without asking for confirmation",
+        action=argparse.BooleanOptionalAction,
+    )
+    # 10. rebuild the local inventory of the bucket
+    parser.add_argument(
+        "--sync-inventory",
+        type=str,
+        metavar="sync",
+        help="rebuild the local inventory of the bucket keys",
+        action=argparse.BooleanOptionalAction,
+    )
+
     args: argparse.Namespace = parser.parse_args()
 
     # args: argparse.Namespace = parser.parse_args(["--list"])
@@ -195,15 +544,28 @@ def main():
     # args: argparse.Namespace = parser.parse_args(["--delete", "bike.jpg"])
 
     # Create an instance of the ControllerAwsS3 class
-    ctlAwsS3 = ControllerAwsS3()
+    # The inventory is only opened once it exists, an empty one is never listed
+    inventory = (
+        S3Inventory(S3_INVENTORY_FILE)
+        if args.sync_inventory or os.path.exists(S3_INVENTORY_FILE)
+        else None
+    )
+    ctlAwsS3 = ControllerAwsS3(inventory=inventory)
 
     if args.list:
         # List all objects in the bucket
-        response: dict = ctlAwsS3.list_objects(
+        pages = ctlAwsS3.list_objects_sharded(
             bucket_name=os.getenv("BUCKET_NAME", None)
         )
-        key_objects = [object["Key"] for object in response.get("Contents")]
-        print(f"Objects in the bucket: {key_objects}")
+        if args.output:
+            total: int = ctlAwsS3.save_objects(pages, args.output)
+            print(f"Objects in the bucket: {total}, saved to {args.output}")
+        else:
+            total = 0
+            for objects in pages:
+                print("\n".join(object["Key"] for object in objects))
+                total += len(objects)
+            print(f"Objects in the bucket: {total}")
     elif args.upload:
         # Upload a file to the bucket
         response: dict = ctlAwsS3.upload_file(
@@ -222,6 +584,46 @@ def main():
             bucket_name=os.getenv("BUCKET_NAME", None), object_name=args.delete
         )
         print()
+    elif args.upload_dir:
+        # Upload the files of a directory to the bucket
+        response: dict = ctlAwsS3.upload_dir(
+            directory=args.upload_dir,
+            bucket_name=os.getenv("BUCKET_NAME", None),
+            workers=args.workers,
+        )
+        print(
+            f"Uploaded: {response['uploaded']}, Skipped: {response['skipped']}, "
+            f"Errors: {len(response['errors'])}"
+        )
+    elif args.download_many:
+        # Download the files of a manifest from the bucket
+        response: dict = ctlAwsS3.download_many(
+            object_names=read_manifest(args.download_many),
+            bucket_name=os.getenv("BUCKET_NAME", None),
+            workers=args.workers,
+        )
+        print(
+            f"Downloaded: {response['downloaded']}, "
+            f"Errors: {len(response['errors'])}"
+        )
+    elif args.delete_many:
+        # Delete the files of a manifest from the bucket
+        object_names: list = read_manifest(args.delete_many)
+        bucket_name: str = os.getenv("BUCKET_NAME", None)
+        if not args.yes:
+            print(f"{len(object_names)} files to delete, first: {object_names[:5]}")
+            answer = input(f"Delete them from the bucket {bucket_name}? [y/N] ")
+            if answer.strip().lower() not in ("y", "yes"):
+                print("Nothing deleted")
+                return
+        response: dict = ctlAwsS3.delete_many(
+            object_names=object_names, bucket_name=bucket_name
+        )
+        print(f"Deleted: {response['deleted']}, Errors: {len(response['errors'])}")
+    elif args.sync_inventory:
+        # Rebuild the local inventory of the bucket
+        total: int = ctlAwsS3.sync_inventory(bucket_name=os.getenv("BUCKET_NAME", None))
+        print(f"Objects in the inventory: {total}")
     else:
         parser.print_help()
 
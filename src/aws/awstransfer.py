@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+
+# The actas are small images, a single PUT each, only big files use multipart
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 16 * 1024 * 1024
+
+
+class S3Transfer:
+    """
+    A transfer layer to upload many files to an S3 bucket from a shared thread pool.
+
+    The files of every acta are submitted to the same pool, so the uploads of
+    different actas run concurrently instead of one PUT round-trip after another.
+
+    Args:
+        s3_client (boto3.client): The S3 client, thread safe, shared by the workers.
+        bucket_name (str): The name of the bucket.
+        max_workers (int): The number of uploads in flight.
+        max_concurrency (int): The threads of a multipart upload.
+        multipart_threshold (int): The size in bytes from which a file is uploaded in
+        parts.
+        multipart_chunksize (int): The size in bytes of each part.
+        progress (callable): A factory of progress callbacks, called with the file
+        name, None disables the progress.
+        on_upload (callable): Called with the object name, the file size and the
+        seconds of each successful upload.
+        inventory (S3Inventory): The inventory of the bucket, the files already in the
+        bucket are not uploaded again and the uploaded files are added to it.
+        on_skip (callable): Called with the object name of each file not uploaded
+        because it is in the inventory.
+    """
+
+    def __init__(
+        self,
+        s3_client: boto3.client,
+        bucket_name: str,
+        max_workers: int = 16,
+        max_concurrency: int = 4,
+        multipart_threshold: int = MULTIPART_THRESHOLD,
+        multipart_chunksize: int = MULTIPART_CHUNKSIZE,
+        progress=None,
+        on_upload=None,
+        inventory=None,
+        on_skip=None,
+    ) -> None:
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.progress = progress
+        self.on_upload = on_upload
+        self.inventory = inventory
+        self.on_skip = on_skip
+        self.config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="s3transfer"
+        )
+        self._lock = threading.Lock()
+        self._futures = set()
+
+    def upload_file(self, file_name: str, object_name: str = None) -> bool:
+        """
+        Upload a file to the bucket from the calling thread.
+
+        Returns:
+            bool: False if the file was already in the bucket according to the
+            inventory.
+        """
+        if object_name is None:
+            object_name = os.path.basename(file_name)
+        size = os.path.getsize(file_name)
+        if self.inventory is not None and self.inventory.contains(
+            self.bucket_name, object_name, size
+        ):
+            if self.on_skip is not None:
+                self.on_skip(object_name)
+            return False
+        start = time.perf_counter()
+        etag = None
+        if size < self.config.multipart_threshold:
+            # A single PUT, its response has the ETag of the object
+            with open(file_name, "rb") as f:
+                response = self.s3_client.put_object(
+                    Bucket=self.bucket_name, Key=object_name, Body=f
+                )
+            etag = response.get("ETag")
+            if self.progress:
+                self.progress(file_name)(size)
+        else:
+            self.s3_client.upload_file(
+                file_name,
+                self.bucket_name,
+                object_name,
+                Config=self.config,
+                Callback=self.progress(file_name) if self.progress else None,
+            )
+        seconds = time.perf_counter() - start
+        if self.inventory is not None:
+            self.inventory.put(self.bucket_name, object_name, size, etag)
+        if self.on_upload is not None:
+            self.on_upload(object_name, size, seconds)
+        return True
+
+    def submit(self, file_name: str, object_name: str = None, callback=None) -> Future:
+        """
+        Upload a file to the bucket from the thread pool.
+
+        Args:
+            file_name (str): The path of the file.
+            object_name (str): The key of the object, by default the file name.
+            callback (callable): Called with the future when the upload finishes,
+            before wait() returns.
+
+        Returns:
+            Future: The future of the upload.
+        """
+        future = self.executor.submit(self.upload_file, file_name, object_name)
+        with self._lock:
+            self._futures.add(future)
+        if callback is not None:
+            future.add_done_callback(callback)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future: Future) -> None:
+        with self._lock:
+            self._futures.discard(future)
+
+    def upload_many(self, files: list, on_done=None) -> list:
+        """
+        Upload a batch of files from the thread pool.
+
+        Args:
+            files (list): The (file_name, object_name) of each file.
+            on_done (callable): Called with the list of exceptions of the batch,
+            empty if every file was uploaded, once the last file finishes.
+
+        Returns:
+            list: The futures of the uploads.
+        """
+        if not files:
+            if on_done is not None:
+                on_done([])
+            return []
+        pending = [len(files)]
+        errors = []
+        lock = threading.Lock()
+
+        def done(future: Future) -> None:
+            with lock:
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                pending[0] -= 1
+                last = pending[0] == 0
+            if last and on_done is not None:
+                on_done(errors)
+
+        return [
+            self.submit(file_name, object_name, callback=done)
+            for file_name, object_name in files
+        ]
+
+    def upload_files(self, files: list) -> list:
+        """
+        Upload a batch of files and wait for them.
+
+        Returns:
+            list: The exceptions of the batch, empty if every file was uploaded.
+        """
+        futures = self.upload_many(files)
+        wait(futures)
+        return [future.exception() for future in futures if future.exception()]
+
+    def wait(self) -> None:
+        """Wait until every submitted upload finishes."""
+        while True:
+            with self._lock:
+                futures = list(self._futures)
+            if not futures:
+                return
+            wait(futures)
+            # The callbacks of a future run right after its waiters are notified
+            time.sleep(0.001)
+
+    def shutdown(self) -> None:
+        """Wait for the uploads and stop the thread pool."""
+        self.executor.shutdown(wait=True)
@@ -1,9 +1,14 @@
 # Create a function to get the files hash and file name from a directory
 import hashlib
 import os
+import sys
+from pathlib import Path
 
 import pandas as pd
 
+sys.path.append(f"{Path().resolve()}/src/scraping/elecciones")
+from digest_set import HASH_FILE_NAME, DigestSet  # noqa: E402
+
 
 def get_files_hash(data_directory: str) -> pd.DataFrame:
     """
@@ -111,9 +116,39 @@ def validate_simple_proof_20240306_s3(
     return False
 
 
+# Create a function to get the files from SIMPLE_PROOF_20240306_S3 data not stored locally  # noqa: E501
+def missing_from_digest_set(
+    validation_directory: str, digest_set_file: str
+) -> pd.DataFrame:
+    """
+    Get the files of the SIMPLE_PROOF_20240306_S3 data whose content is not in the
+    local digest set, without reading or hashing the local files.
+
+    Args:
+        validation_directory (str): The directory containing the data.
+        digest_set_file (str): The path of the digest set file.
+
+    Returns:
+        pandas.DataFrame: A dataframe containing the files not stored locally.
+    """  # noqa: E501
+    digest_set = DigestSet(digest_set_file)
+    df = load_simple_proof_20240306_s3(validation_directory)
+    # Only the files named <hash>.jpeg can be checked by its name
+    stored = df["FILE_NAME"].map(
+        lambda file_name: bool(HASH_FILE_NAME.match(file_name))
+        and file_name in digest_set
+    )
+    digest_set.close()
+    return df[~stored]
+
+
 if __name__ == "__main__":
     # Validate the data from SIMPLE_PROOF_20240306_S3 data and the hash of the files
     if validate_simple_proof_20240306_s3("2_validation", "0_raw"):
         print("\nThe data is valid")
     else:
         print("\nThe data is not valid")
+
+    # Files in S3 bucket not stored locally in any directory
+    df_missing = missing_from_digest_set("2_validation", "src/data/digests.bin")
+    print("\nFiles in S3 bucket not stored locally:", df_missing.shape[0])
@@ -1,10 +1,29 @@
 import argparse
 import os
-import subprocess
+import sys
 import threading
 import time
 from pathlib import Path
 
+sys.path.append(f"{Path().resolve()}/src/aws")
+from awsinventory import S3_INVENTORY_FILE, S3Inventory  # noqa: E402
+from awss3 import AwsS3  # noqa: E402
+from awstransfer import S3Transfer  # noqa: E402
+from dirwatch import DirectoryWatcher  # noqa: E402
+
+# Uploads in flight of the uploader
+UPLOAD_WORKERS = 16
+
+# State of the scraping service, it resumes from it after a restart
+STATE_DB = "src/data/marzo.db"
+SCHEDULER_FILE = "src/data/marzo_scheduler.csv"
+
+# Minimum seconds of a scraping pass, the passes run back to back
+PASS_INTERVAL = 60
+
+# Requests per second to each TSE host, evenly spaced
+REQUEST_RATE = 20
+
 
 class Demon:
     """
@@ -14,90 +33,137 @@ class Demon:
     def __init__(self):
         pass
 
-    # TODO: Implement the scraping method
     @staticmethod
-    def scraping():
+    def scraping(
+        total=8562,
+        chunk_size=500,
+        request_rate=REQUEST_RATE,
+        pass_interval=PASS_INTERVAL,
+        metrics_port=9108,
+    ):
         """
-        Scrapes data from a website and saves it to a jpg file.
+        Scrapes the actas from the TSE website and saves them in the src/data/0_raw
+        directory, as a service.
+
+        Each pass is an incremental marzo run: the scheduler selects the actas due,
+        the state store keeps every acta as soon as it finishes, so a restart resumes
+        from the last persisted state. The passes run back to back in this process,
+        reusing the warm HTTP and S3 connections, with the requests evenly spaced at
+        request_rate per host instead of hourly bursts.
         """
+        # The scraper dependencies are only needed by the scraping service
+        sys.path.append(f"{Path().resolve()}/src/scraping/elecciones")
+        from tse_gob_sv import marzo
+
         while True:
+            start = time.monotonic()
             try:
-                # Scrape data from the website
-                print("Scraping data from the website")
-
-                # TODO: Call the salvador.py script to scrape data from the website
-
-                # Save the data to a jpg file
-                print("Saving data to jpg file")
-
-                # Wait for 1 seconds before scraping again
-                time.sleep(1)
+                print("Scraping the actas from the TSE website")
+                marzo(
+                    total=total,
+                    start=1,
+                    chunk_size=chunk_size,
+                    speech=False,
+                    engine="threads",
+                    scheduler_file=SCHEDULER_FILE,
+                    state_db=STATE_DB,
+                    metrics_port=metrics_port,
+                    request_rate=request_rate,
+                )
             except Exception as e:
                 print(e)
 
-    @staticmethod
-    def upload_to_s3(file):
-        print(f"\nUploading {file} to S3 bucket")
-        # Call the awss3.py script to upload the file to S3 bucket
-        subprocess.run(
-            [
-                "python",
-                f"{Path().resolve()}/src/aws/awss3.py",
-                "--upload",
-                f"{Path().resolve()}/src/data/0_raw/{file}",
-            ]
-        )
-        # Move the files to the uploaded directory
-        print(f"\nMoving {file} to 1_uploaded directory")
-        src_path = os.path.join("src/data/0_raw", file)
-        dest_path = os.path.join("src/data/1_uploaded", file)
-        os.rename(src_path, dest_path)
-        print(f"Finished uploading {file} to S3 bucket\n")
+            # Wait for the actas to be due again if the pass was short
+            elapsed = time.monotonic() - start
+            if elapsed < pass_interval:
+                time.sleep(pass_interval - elapsed)
 
     @staticmethod
-    def upload_files():
+    def upload_to_s3(file, future, in_flight, failed, lock):
         """
-        Uploads files from src/data/0_raw directory to an S3 bucket.
+        Moves an uploaded file to the uploaded directory, called by the uploader when
+        the upload of the file finishes.
         """
-        while True:
-            try:
-                # Threads to upload files to s3
-                threads = []
-
-                # Check for new files in the directory
-                files = os.listdir("src/data/0_raw")
-                # Remove .gitkeep file
-                if ".gitkeep" in files:
-                    files.remove(".gitkeep")
+        try:
+            if future.exception() is not None:
+                # The file stays in 0_raw and is uploaded again when the watcher is idle
+                print(f"Error uploading {file} to S3 bucket: {future.exception()}")
+                with lock:
+                    failed.add(file)
+                return
+            # Move the files to the uploaded directory
+            src_path = os.path.join("src/data/0_raw", file)
+            dest_path = os.path.join("src/data/1_uploaded", file)
+            os.rename(src_path, dest_path)
+            print(f"Finished uploading {file} to S3 bucket")
+        finally:
+            with lock:
+                in_flight.discard(file)
 
-                if len(files) > 0:
-
-                    # Upload only the first chunk files
-                    chunk = 100
-                    files = files[:chunk]
+    @staticmethod
+    def upload_files(workers=UPLOAD_WORKERS, poll=False):
+        """
+        Uploads files from src/data/0_raw directory to an S3 bucket.
 
-                    # For each file in the directory, upload it to S3 bucket
-                    print(f"Uploading the first {len(files)} files to S3 bucket")
+        The files are uploaded in this process by a pool of workers sharing one S3
+        client, each new file is submitted as soon as it is found, without waiting for
+        the uploads of the previous files. The new files are found with inotify as
+        soon as they are written, or polling the directory every 2 seconds if inotify
+        is not available or poll is True.
+        """
+        transfer = S3Transfer(
+            AwsS3.getInstance(),
+            os.getenv("BUCKET_NAME", None),
+            max_workers=workers,
+            # The inventory of marzo, the uploader doesn't create an empty one
+            inventory=(
+                S3Inventory(S3_INVENTORY_FILE)
+                if os.path.exists(S3_INVENTORY_FILE)
+                else None
+            ),
+        )
+        # Files submitted to the uploader and not finished yet, and failed uploads
+        in_flight = set()
+        failed = set()
+        lock = threading.Lock()
+        # Ignore hidden files, .gitkeep and the downloads in progress
+        watcher = DirectoryWatcher("src/data/0_raw", use_inotify=not poll)
+        print(f"Watching src/data/0_raw with {watcher.mode}")
+        try:
+            for file in watcher.watch(timeout=2):
+                try:
+                    with lock:
+                        if file is None:
+                            # No new files, retry the failed uploads
+                            files = list(failed)
+                            failed.clear()
+                        else:
+                            files = [file]
+                        # A file can be found twice, by the startup scan and inotify
+                        files = [
+                            file
+                            for file in files
+                            if file not in in_flight
+                            and os.path.exists(f"src/data/0_raw/{file}")
+                        ]
+                        in_flight.update(files)
+
+                    # Submit the new files to the uploader
                     for file in files:
-                        # Upload the file to S3 bucket
-                        thread = threading.Thread(
-                            target=Demon.upload_to_s3, args=(file,)
+                        print(f"Uploading {file} to S3 bucket")
+                        transfer.submit(
+                            f"{Path().resolve()}/src/data/0_raw/{file}",
+                            file,
+                            callback=lambda future, file=file: Demon.upload_to_s3(
+                                file, future, in_flight, failed, lock
+                            ),
                         )
-                        threads.append(thread)
-                        thread.start()
-
-                    # Wait for all threads to finish
-                    for thread in threads:
-                        thread.join()
 
-                else:
-                    print("No new files")
-
-                print("Wait for 2 seconds before checking again ...")
-                time.sleep(2)
-
-            except Exception as e:
-                print(e)
+                except Exception as e:
+                    print(e)
+        finally:
+            watcher.close()
+            transfer.shutdown()
 
 
 def main():
@@ -117,6 +183,15 @@ def main():
         action=argparse.BooleanOptionalAction,
     )
 
+    # Requests per second to each TSE host of the scraper
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=REQUEST_RATE,
+        metavar="r",
+        help="Requests per second to each TSE host of the scraper",
+    )
+
     # Uploads files from src/data/0_raw directory to an S3 bucket
     parser.add_argument(
         "--upload",
@@ -126,6 +201,15 @@ def main():
         action=argparse.BooleanOptionalAction,
     )
 
+    # Polls the src/data/0_raw directory instead of watching it with inotify
+    parser.add_argument(
+        "--poll",
+        type=str,
+        metavar="p",
+        help="Polls the src/data/0_raw directory instead of watching it with inotify",
+        action=argparse.BooleanOptionalAction,
+    )
+
     # Parse the command-line arguments
     args: argparse.Namespace = parser.parse_args()
 
@@ -134,10 +218,10 @@ def main():
 
     if args.scraper:
         # Call the scraping method
-        Demon.scraping()
+        Demon.scraping(request_rate=args.rate)
     elif args.upload:
         # Call the upload_files method
-        Demon.upload_files()
+        Demon.upload_files(poll=bool(args.poll))
     else:
         parser.print_help()
 
@@ -0,0 +1,386 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+# inotify events of a file closed after writing or moved into the directory
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# struct inotify_event: wd, mask, cookie and len, followed by the name
+EVENT_HEADER = struct.Struct("iIII")
+
+# Suffix of the hidden files of the downloads in progress
+PARTIAL_SUFFIX = ".part"
+
+
+def load_inotify():
+    """
+    Load the inotify functions of the C library.
+
+    Returns:
+        ctypes.CDLL: The C library, None if inotify is not available.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+def remove_partial_files(directory, suffix=PARTIAL_SUFFIX):
+    """
+    Remove the downloads in progress left behind by a killed process, the hidden
+    files of the directory with the suffix. Only call it when no download is running
+    in the directory.
+
+    Args:
+        directory (str): The directory of the downloads.
+        suffix (str): The suffix of the downloads in progress.
+
+    Returns:
+        list: The names of the removed files.
+    """
+    removed = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if (
+                entry.name.startswith(".")
+                and entry.name.endswith(suffix)
+                and entry.is_file()
+            ):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed.append(entry.name)
+    return removed
+
+
+class DirectoryWatcher:
+    """
+    Watch a directory for new files: with inotify on Linux, the files are yielded as
+    soon as they are closed after writing or moved into the directory, elsewhere the
+    directory is polled.
+
+    The hidden files are ignored, the downloads in progress are hidden files renamed
+    when they are complete. The files already in the directory are yielded first.
+
+    Args:
+        directory (str): The directory to watch.
+        poll_interval (float): The seconds between two scans without inotify.
+        use_inotify (bool): False to poll the directory even if inotify is available.
+    """
+
+    def __init__(self, directory, poll_interval=2.0, use_inotify=True):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._libc = load_inotify() if use_inotify else None
+        self._fd = None
+        if self._libc is not None:
+            self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if self._fd < 0 or (
+                self._libc.inotify_add_watch(
+                    self._fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO
+                )
+                < 0
+            ):
+                # Out of watches or instances, poll the directory instead
+                self.close()
+
+    @property
+    def mode(self):
+        return "inotify" if self._fd is not None else "polling"
+
+    def scan(self):
+        """Get the files of the directory."""
+        with os.scandir(self.directory) as entries:
+            return [
+                entry.name
+                for entry in entries
+                if not entry.name.startswith(".") and entry.is_file()
+            ]
+
+    def watch(self, timeout=2.0):
+        """
+        Yield the name of each new file, and None every timeout seconds without new
+        files, so the caller can do other work between the files.
+
+        Args:
+            timeout (float): The seconds to wait for a new file before yielding None.
+        """
+        # The backlog of files written before the watch
+        seen = set(self.scan())
+        yield from sorted(seen)
+        if self._fd is None:
+            yield from self._poll(seen, timeout)
+        else:
+            yield from self._events(timeout)
+
+    def wait(self, timeout):
+        """
+        Wait at most timeout seconds for new files.
+
+        Returns:
+            list: The names of the new files, empty if there are none, None if the
+            caller must check the directory itself (polling or lost events).
+        """
+        if self._fd is None:
+            time.sleep(min(self.poll_interval, max(timeout, 0)))
+            return None
+        readable, _, _ = select.select([self._fd], [], [], max(timeout, 0))
+        if not readable:
+            return []
+        return self._read()
+
+    def _read(self):
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset < len(buffer):
+            _, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost
+                return None
+            if name and not name.startswith(b"."):
+                names.append(os.fsdecode(name))
+        return names
+
+    def _events(self, timeout):
+        while True:
+            names = self.wait(timeout)
+            if names is None:
+                # Events were lost, the directory is scanned again
+                yield from self.scan()
+            elif names:
+                yield from names
+            else:
+                yield None
+
+    def _poll(self, seen, timeout):
+        last_yield = time.monotonic()
+        while True:
+            time.sleep(self.poll_interval)
+            files = set(self.scan())
+            new_files = files - seen
+            # The files removed from the directory are yielded again if they return
+            seen = files
+            yield from sorted(new_files)
+            if new_files:
+                last_yield = time.monotonic()
+            elif time.monotonic() - last_yield >= timeout:
+                last_yield = time.monotonic()
+                yield None
+
+    def close(self):
+        """Stop watching the directory."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class DownloadWaiter:
+    """
+    Wait for the downloads of a browser to complete in a directory: the waiter wakes
+    up on each file written to the directory, with inotify, or every poll_interval
+    seconds elsewhere, and returns as soon as the expected file is complete.
+
+    A download of Firefox is complete when the file has content and its .part file
+    is gone. The candidate files are checked by name, the directory is never listed,
+    so a wait costs the same in a directory of any size.
+
+    Args:
+        directory (str): The download directory of the browser.
+        extensions (tuple): The extensions to check without an event of the file.
+        poll_interval (float): The seconds between two checks without inotify.
+        use_inotify (bool): False to poll the files even if inotify is available.
+    """
+
+    def __init__(
+        self,
+        directory,
+        extensions=("jpeg", "jpg", "png"),
+        poll_interval=0.02,
+        use_inotify=True,
+    ):
+        self.directory = directory
+        self.extensions = extensions
+        # The watch starts now, a download completed before a wait is not missed
+        self.watcher = DirectoryWatcher(directory, poll_interval, use_inotify)
+
+    def complete(self, file_name):
+        """Check if a download finished writing its file."""
+        path = os.path.join(self.directory, file_name)
+        try:
+            if os.path.getsize(path) == 0:
+                return False
+        except OSError:
+            return False
+        return not os.path.exists(f"{path}.part")
+
+    def candidates(self, name):
+        """Get the file names a download of a name may have."""
+        return [name] + [f"{name}.{extension}" for extension in self.extensions]
+
+    def find(self, name, file_names=()):
+        """
+        Get the complete download of a name, with any extension.
+
+        Args:
+            name (str): The name of the file without the extension.
+            file_names (list): Other candidate file names, from the events.
+
+        Returns:
+            str: The file name, None if the download is not complete.
+        """
+        candidates = self.candidates(name) + [
+            file_name
+            for file_name in file_names
+            if file_name.startswith(f"{name}.") and not file_name.endswith(".part")
+        ]
+        return next((file for file in candidates if self.complete(file)), None)
+
+    def wait(self, name, timeout=10.0):
+        """
+        Wait until the download of a name is complete.
+
+        Args:
+            name (str): The name of the file without the extension.
+            timeout (float): The seconds to wait for the download.
+
+        Returns:
+            str: The path of the downloaded file.
+
+        Raises:
+            TimeoutError: If the download is not complete in timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        file_name = self.find(name)
+        while file_name is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Download not completed: {name}")
+            file_name = self.find(name, self.watcher.wait(remaining) or ())
+        return os.path.join(self.directory, file_name)
+
+    def close(self):
+        """Stop watching the directory."""
+        self.watcher.close()
+
+
+class DirectoryIndex:
+    """
+    An index of the files of a directory by their name without the extension, so
+    acta_{n}, acta_dos_{n} or missing_{url_type}_{n} is found in constant time in a
+    directory of any size.
+
+    The directory is scanned once, then the index is updated with the files written
+    since the last lookup, from the inotify events, or elsewhere with a new scan when
+    the modification time of the directory changed, checked at most every
+    poll_interval seconds. A file moved out of the directory is dropped from the
+    index when it is looked up.
+
+    Args:
+        directory (str): The directory to index.
+        poll_interval (float): The minimum seconds between two scans without inotify.
+        use_inotify (bool): False to scan the directory even if inotify is available.
+    """
+
+    def __init__(self, directory, poll_interval=2.0, use_inotify=True):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        # The watch starts before the scan, no file written in between is missed
+        self.watcher = DirectoryWatcher(directory, poll_interval, use_inotify)
+        self._files = {}
+        self._scanned_at = 0.0
+        # The modification time of the directory at the last scan, in nanoseconds
+        self._mtime = None
+        self.scan()
+
+    @staticmethod
+    def key(file_name):
+        """Get the name of a file without the extension."""
+        return file_name.split(".", 1)[0]
+
+    def scan(self):
+        """Build the index from the files of the directory."""
+        # The time is read before the files, a file written during the scan changes it
+        mtime = os.stat(self.directory).st_mtime_ns
+        files = {}
+        for file_name in self.watcher.scan():
+            files.setdefault(DirectoryIndex.key(file_name), file_name)
+        self._files = files
+        self._scanned_at = time.monotonic()
+        # A file written in the same tick of a coarse clock keeps the time, the
+        # directory is scanned once more when its time is that recent
+        recent = time.time_ns() - mtime < 1_000_000_000
+        self._mtime = None if recent else mtime
+
+    def add(self, file_name):
+        """Add a file written to the directory."""
+        self._files[DirectoryIndex.key(file_name)] = file_name
+
+    def refresh(self):
+        """Add the files written to the directory since the last lookup."""
+        if self.watcher.mode == "polling":
+            # A file added, renamed or removed changes the time of the directory
+            if (
+                time.monotonic() - self._scanned_at >= self.poll_interval
+                and os.stat(self.directory).st_mtime_ns != self._mtime
+            ):
+                self.scan()
+            return
+        while True:
+            file_names = self.watcher.wait(0)
+            if file_names is None:
+                # Events were lost, the directory is scanned again
+                self.scan()
+                return
+            if not file_names:
+                return
+            for file_name in file_names:
+                self.add(file_name)
+
+    def get(self, name):
+        """
+        Get the file of a name, with any extension.
+
+        Args:
+            name (str): The name of the file without the extension.
+
+        Returns:
+            str: The file name, None if the directory has no file with that name.
+        """
+        self.refresh()
+        file_name = self._files.get(name)
+        if file_name is not None and not os.path.exists(
+            os.path.join(self.directory, file_name)
+        ):
+            # The file was moved or removed from the directory
+            del self._files[name]
+            return None
+        return file_name
+
+    def close(self):
+        """Stop watching the directory."""
+        self.watcher.close()
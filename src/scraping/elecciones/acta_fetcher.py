@@ -0,0 +1,194 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from retry_policy import RetryPolicy
+
+# URL of the acta images by URL type
+ACTA_URLS = {
+    "uno": "https://preliminar.tse.gob.sv/administracion/img/get-acta/{acta}",
+    "dos": "https://divulgacion.tse.gob.sv/administracion/img/get-acta-dos/{acta}",
+}
+
+# Extension of each image type, the same Firefox gives to the saved image
+EXTENSIONS = {"image/jpeg": "jpeg", "image/png": "png"}
+
+# File name and hash of the report when the acta is not found
+NOT_FOUND_FILE = "not_found"
+NOT_FOUND_HASH = "Not Found"
+
+# HTTP Headers for the TSE requests
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.3"  # noqa: E501
+}
+
+# Chunk size to stream the images
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Connect and read timeouts of the requests, in seconds
+REQUEST_TIMEOUT = (10, 60)
+
+
+class ActaFetcher:
+    """
+    Download the acta images from the get-acta and get-acta-dos endpoints with plain
+    HTTP requests from a thread pool, without a browser.
+
+    Each image is streamed to a hidden file of the directory while it is hashed, then
+    renamed to its final name with the extension of its content type, so a file with
+    the final name is always complete. An existing file is replaced, like the browser
+    does when the save dialog asks.
+
+    Args:
+        directory (str): The directory of the images.
+        file_name (str): The name of the images without the extension, formatted with
+        the acta and the URL type.
+        url_type (str): The endpoint of the actas, "uno" or "dos".
+        workers (int): The number of downloads in flight.
+        retry_policy (RetryPolicy): The retries of the transient failures.
+    """
+
+    def __init__(
+        self,
+        directory,
+        file_name="acta_{acta}",
+        url_type="uno",
+        workers=16,
+        retry_policy=None,
+    ):
+        self.directory = directory
+        self.file_name = file_name
+        self.url_type = url_type
+        self.retry_policy = retry_policy or RetryPolicy()
+        # HTTP Session with a connection pool, the connections are reused between actas
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="acta_fetcher"
+        )
+
+    @staticmethod
+    def url(acta, url_type="uno"):
+        return ACTA_URLS[url_type].format(acta=acta)
+
+    @staticmethod
+    def extension(content_type):
+        """Get the extension of an image type, None if the content is not an image."""
+        content_type = (content_type or "").split(";")[0].strip().lower()
+        if not content_type.startswith("image/"):
+            return None
+        extension = EXTENSIONS.get(content_type) or mimetypes.guess_extension(
+            content_type
+        )
+        return extension.lstrip(".") if extension else content_type.split("/")[1]
+
+    def fetch(self, acta, url_type=None):
+        """
+        Download the image of an acta, with retries of the transient failures.
+
+        Args:
+            acta (int): The number of the acta.
+            url_type (str): The endpoint of the acta, by default the fetcher one.
+
+        Returns:
+            tuple: (acta, url_type, file_name, hash_file_tse, url_acta) the row of the
+            report, the file name is "not_found" if the acta is not an image or its
+            image could not be saved, so the not found actas pass fetches it again.
+        """
+        url_type = url_type or self.url_type
+        url_acta = ActaFetcher.url(acta, url_type)
+        self.retry_policy.record_request()
+        attempt = 1
+        while True:
+            error, status_code = None, None
+            try:
+                status_code, url_acta, file_name, hash_file_tse = self._fetch_once(
+                    acta, url_type, url_acta
+                )
+            except requests.exceptions.RequestException as e:
+                error = e
+            except OSError as e:
+                # The image could not be saved, not a failure of the TSE to retry
+                print(f"Acta error: {acta} {type(e).__name__}: {e}")
+                return acta, url_type, NOT_FOUND_FILE, NOT_FOUND_HASH, url_acta
+            reason = RetryPolicy.classify(error, status_code)
+            if reason is None and error is None:
+                return acta, url_type, file_name, hash_file_tse, url_acta
+            if reason is None or not self.retry_policy.allow(attempt):
+                print(f"Acta not found: {acta} {error or status_code}")
+                return acta, url_type, NOT_FOUND_FILE, NOT_FOUND_HASH, url_acta
+            time.sleep(self.retry_policy.backoff(attempt))
+            attempt += 1
+
+    def _fetch_once(self, acta, url_type, url_acta):
+        with self.session.get(
+            url_acta, stream=True, timeout=REQUEST_TIMEOUT
+        ) as response:
+            # The URL of the image after the redirects, as the browser reports it
+            url_acta = response.url
+            extension = ActaFetcher.extension(response.headers.get("Content-Type"))
+            if response.status_code != 200 or extension is None:
+                return response.status_code, url_acta, NOT_FOUND_FILE, NOT_FOUND_HASH
+
+            sha256 = hashlib.sha256()
+            size = 0
+            fd, temp_path = tempfile.mkstemp(
+                prefix=".", suffix=".part", dir=self.directory
+            )
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                        sha256.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+                # If the response content is empty
+                if size == 0:
+                    os.remove(temp_path)
+                    return (
+                        response.status_code,
+                        url_acta,
+                        NOT_FOUND_FILE,
+                        NOT_FOUND_HASH,
+                    )
+                file_name = (
+                    f"{self.file_name.format(acta=acta, url_type=url_type)}"
+                    f".{extension}"
+                )
+                os.replace(temp_path, os.path.join(self.directory, file_name))
+            except BaseException:
+                # Never leave a half written file
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            return response.status_code, url_acta, file_name, sha256.hexdigest()
+
+    def fetch_many(self, actas):
+        """
+        Download the images of many actas from the thread pool.
+
+        Args:
+            actas (iterable): The number of each acta, or its (acta, url_type).
+
+        Yields:
+            tuple: The row of the report of each acta, in the order of the actas.
+        """
+
+        def fetch(job):
+            if isinstance(job, tuple):
+                return self.fetch(*job)
+            return self.fetch(job)
+
+        yield from self.executor.map(fetch, actas)
+
+    def close(self):
+        """Wait for the downloads and close the connections."""
+        self.executor.shutdown(wait=True)
+        self.session.close()
@@ -0,0 +1,620 @@
+import sys
+from enum import Enum
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(f"{Path().resolve()}/src/aws")
+from awsarrow import import_pyarrow  # noqa: E402
+
+# Columns of the DataSources snapshots
+COLUMNS = ["URL", "STATUS", "UPLOADED", "DATETIME", "FILE_NAMES", "HASHES"]
+
+
+class ActaStatus(Enum):
+    PENDING = "pending"
+    DOWNLOADED = "downloaded"
+    NOT_FOUND = "not_found"
+    FORBIDDEN = "forbidden"
+    ERROR = "error"
+
+    def get_status(self, value):
+        for status in ActaStatus:
+            if status.value == value:
+                return status
+
+
+class Acta:
+
+    def __init__(
+        self,
+        url,
+        status=ActaStatus.PENDING,
+        uploaded=False,
+        datetime=None,
+        file_names=[],
+        hashes=[],
+    ):
+        self.__url = url
+        self.__status = status
+        self.__uploaded = uploaded
+        self.__datetime = datetime
+        self.__file_names = file_names
+        self.__hashes = hashes
+
+    # Getters and Setters
+    @property
+    def url(self):
+        return self.__url
+
+    @url.setter
+    def url(self, url):
+        self.__url = url
+
+    @property
+    def status(self):
+        return self.__status
+
+    @status.setter
+    def status(self, status):
+        self.__status = status
+
+    @property
+    def uploaded(self):
+        return self.__uploaded
+
+    @uploaded.setter
+    def uploaded(self, uploaded):
+        self.__uploaded = uploaded
+
+    @property
+    def datetime(self):
+        return self.__datetime
+
+    @datetime.setter
+    def datetime(self, datetime):
+        self.__datetime = datetime
+
+    @property
+    def file_names(self):
+        return self.__file_names
+
+    @file_names.setter
+    def file_names(self, file_names):
+        self.__file_names = file_names
+
+    @property
+    def hashes(self):
+        return self.__hashes
+
+    @hashes.setter
+    def hashes(self, hashes):
+        self.__hashes = hashes
+
+    def to_row(self):
+        return [
+            self.url,
+            self.status.value,
+            self.uploaded,
+            self.datetime,
+            " ".join(self.file_names),
+            " ".join(self.hashes),
+        ]
+
+    def __str__(self):
+        return f"URL: {self.url}, STATUS: {self.status}, UPLOADED: {self.uploaded}, DATETIME: {self.datetime}, FILE_NAMES: {self.file_names}, HASHES: {self.hashes}"  # noqa: E501
+
+    def __repr__(self):
+        return f"{self.url}, {self.status}, {self.uploaded}, {self.datetime}, {self.file_names}, {self.hashes}"  # noqa: E501
+
+
+# Status codes of the ActaTable, the code is the position of the status
+STATUS_CODES = list(ActaStatus)
+STATUS_VALUE_CODES = {status.value: code for code, status in enumerate(STATUS_CODES)}
+STATUS_VALUES = np.array([status.value for status in STATUS_CODES], dtype=object)
+
+
+class ActaView:
+    """
+    An Acta-like view of a row of an ActaTable, reading and writing the columns of
+    the table. It is pickled as an Acta, so the Pool workers receive plain actas.
+    """
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    @property
+    def url(self):
+        return self._table.url[self._index]
+
+    @url.setter
+    def url(self, url):
+        self._table.url[self._index] = url
+
+    @property
+    def status(self):
+        return STATUS_CODES[self._table.status[self._index]]
+
+    @status.setter
+    def status(self, status):
+        self._table.status[self._index] = STATUS_CODES.index(status)
+
+    @property
+    def uploaded(self):
+        return bool(self._table.uploaded[self._index])
+
+    @uploaded.setter
+    def uploaded(self, uploaded):
+        self._table.uploaded[self._index] = uploaded
+
+    @property
+    def datetime(self):
+        return self._table.datetime[self._index]
+
+    @datetime.setter
+    def datetime(self, datetime):
+        self._table.datetime[self._index] = datetime
+
+    @property
+    def file_names(self):
+        return self._table.get_file_names(self._index)
+
+    @file_names.setter
+    def file_names(self, file_names):
+        self._table.set_files(self._index, file_names=file_names)
+
+    @property
+    def hashes(self):
+        return self._table.get_hashes(self._index)
+
+    @hashes.setter
+    def hashes(self, hashes):
+        self._table.set_files(self._index, hashes=hashes)
+
+    def to_acta(self):
+        return Acta(
+            self.url,
+            self.status,
+            self.uploaded,
+            self.datetime,
+            self.file_names,
+            self.hashes,
+        )
+
+    def to_row(self):
+        return self.to_acta().to_row()
+
+    def __reduce__(self):
+        return (
+            Acta,
+            (
+                self.url,
+                self.status,
+                self.uploaded,
+                self.datetime,
+                self.file_names,
+                self.hashes,
+            ),
+        )
+
+    def __str__(self):
+        return str(self.to_acta())
+
+    def __repr__(self):
+        return repr(self.to_acta())
+
+
+class ActaTable:
+    """
+    Columnar representation of the actas of a DataSources.
+
+    The scalar columns are NumPy arrays, the status as codes of STATUS_CODES and the
+    uploaded flags as booleans. The variable number of files per acta is stored
+    flattened, the file names of the acta i are file_names[name_offsets[i] :
+    name_offsets[i + 1]] and its SHA-256 digests are the 32-byte rows
+    digests[digest_offsets[i] : digest_offsets[i + 1]].
+
+    The files set on a single acta are buffered and applied to the flattened
+    columns together, in one vectorized pass, the next time the columns are read.
+    """
+
+    DIGEST_SIZE = 32
+
+    def __init__(
+        self,
+        url,
+        status,
+        uploaded,
+        datetime,
+        name_offsets,
+        file_names,
+        digest_offsets,
+        digests,
+    ):
+        self.url = url
+        self.status = status
+        self.uploaded = uploaded
+        self.datetime = datetime
+        self._name_offsets = name_offsets
+        self._file_names = file_names
+        self._digest_offsets = digest_offsets
+        self._digests = digests
+        # Files set with set_files, by index, not applied to the columns yet
+        self._pending = {}
+
+    @property
+    def name_offsets(self):
+        self._flush()
+        return self._name_offsets
+
+    @name_offsets.setter
+    def name_offsets(self, name_offsets):
+        self._flush()
+        self._name_offsets = name_offsets
+
+    @property
+    def file_names(self):
+        self._flush()
+        return self._file_names
+
+    @file_names.setter
+    def file_names(self, file_names):
+        self._flush()
+        self._file_names = file_names
+
+    @property
+    def digest_offsets(self):
+        self._flush()
+        return self._digest_offsets
+
+    @digest_offsets.setter
+    def digest_offsets(self, digest_offsets):
+        self._flush()
+        self._digest_offsets = digest_offsets
+
+    @property
+    def digests(self):
+        self._flush()
+        return self._digests
+
+    @digests.setter
+    def digests(self, digests):
+        self._flush()
+        self._digests = digests
+
+    @classmethod
+    def empty(cls):
+        return cls.from_actas([])
+
+    @classmethod
+    def from_actas(cls, actas):
+        """Create a table from a list of Acta or ActaView."""
+        file_names = []
+        hashes = []
+        name_counts = []
+        digest_counts = []
+        for acta in actas:
+            names = acta.file_names
+            file_names.extend(names)
+            name_counts.append(len(names))
+            acta_hashes = acta.hashes
+            hashes.extend(acta_hashes)
+            digest_counts.append(len(acta_hashes))
+        return cls(
+            url=np.array([acta.url for acta in actas], dtype=object),
+            status=np.array(
+                [STATUS_CODES.index(acta.status) for acta in actas], dtype=np.int8
+            ),
+            uploaded=np.array([bool(acta.uploaded) for acta in actas], dtype=bool),
+            datetime=np.array([acta.datetime for acta in actas], dtype=object),
+            name_offsets=ActaTable._offsets(name_counts),
+            file_names=np.array(file_names, dtype=object),
+            digest_offsets=ActaTable._offsets(digest_counts),
+            digests=ActaTable._digests(hashes),
+        )
+
+    @classmethod
+    def from_columns(cls, url, status, uploaded, datetime, file_names, hashes):
+        """
+        Create a table from the DataSources columns, FILE_NAMES and HASHES are the
+        space joined strings of the CSV snapshots.
+        """
+        file_names = pd.Series(file_names, dtype=object).fillna("").astype(str)
+        hashes = pd.Series(hashes, dtype=object).fillna("").astype(str)
+        status = pd.Series(status, dtype=object)
+        return cls(
+            url=np.asarray(url, dtype=object),
+            status=status.map(STATUS_VALUE_CODES)
+            .fillna(STATUS_CODES.index(ActaStatus.ERROR))
+            .to_numpy(dtype=np.int8),
+            uploaded=pd.Series(uploaded, dtype=object)
+            .fillna(False)
+            .astype(bool)
+            .to_numpy(),
+            datetime=np.asarray(datetime, dtype=object),
+            name_offsets=ActaTable._offsets(
+                np.where(file_names != "", file_names.str.count(" ") + 1, 0)
+            ),
+            file_names=np.array(
+                (
+                    " ".join(file_names[file_names != ""]).split(" ")
+                    if (file_names != "").any()
+                    else []
+                ),
+                dtype=object,
+            ),
+            digest_offsets=ActaTable._offsets(
+                np.where(hashes != "", hashes.str.count(" ") + 1, 0)
+            ),
+            # bytes.fromhex skips the spaces, one call for every digest
+            digests=np.frombuffer(
+                bytes.fromhex(" ".join(hashes[hashes != ""])), dtype=np.uint8
+            ).reshape(-1, ActaTable.DIGEST_SIZE),
+        )
+
+    @staticmethod
+    def _offsets(counts):
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return offsets
+
+    @staticmethod
+    def _digests(hashes):
+        return np.frombuffer(bytes.fromhex("".join(hashes)), dtype=np.uint8).reshape(
+            -1, ActaTable.DIGEST_SIZE
+        )
+
+    def _hex_rows(self):
+        # Hex digests followed by a space, one row per digest
+        hex_digests = np.frombuffer(
+            self.digests.tobytes().hex().encode(), dtype=np.uint8
+        ).reshape(-1, ActaTable.DIGEST_SIZE * 2)
+        return np.hstack(
+            [hex_digests, np.full((len(hex_digests), 1), ord(" "), dtype=np.uint8)]
+        )
+
+    def joined_hashes(self):
+        """Get the space joined hex digests of each acta."""
+        text = self._hex_rows().tobytes().decode()
+        step = ActaTable.DIGEST_SIZE * 2 + 1
+        return [
+            text[start * step : end * step - 1] if end > start else ""
+            for start, end in zip(self.digest_offsets[:-1], self.digest_offsets[1:])
+        ]
+
+    def joined_file_names(self):
+        """Get the space joined file names of each acta."""
+        return [
+            " ".join(self.file_names[start:end])
+            for start, end in zip(self.name_offsets[:-1], self.name_offsets[1:])
+        ]
+
+    def get_file_names(self, index):
+        file_names, _ = self._pending.get(index, (None, None))
+        if file_names is not None:
+            return list(file_names)
+        start, end = self.name_offsets[index], self.name_offsets[index + 1]
+        return list(self.file_names[start:end])
+
+    def get_hashes(self, index):
+        _, hashes = self._pending.get(index, (None, None))
+        if hashes is not None:
+            return list(hashes)
+        start, end = self.digest_offsets[index], self.digest_offsets[index + 1]
+        return [digest.tobytes().hex() for digest in self.digests[start:end]]
+
+    def set_files(self, index, file_names=None, hashes=None):
+        """Replace the file names and/or the hashes of an acta, see _flush."""
+        pending_file_names, pending_hashes = self._pending.get(index, (None, None))
+        self._pending[index] = (
+            list(file_names) if file_names is not None else pending_file_names,
+            list(hashes) if hashes is not None else pending_hashes,
+        )
+
+    def _flush(self):
+        # Apply the files set with set_files, one pass for every buffered acta
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        names = [
+            (index, value[0])
+            for index, value in pending.items()
+            if value[0] is not None
+        ]
+        if names:
+            self._file_names, self._name_offsets = ActaTable._ragged_update(
+                self._file_names,
+                self._name_offsets,
+                np.array([index for index, _ in names], dtype=np.int64),
+                np.array(
+                    [name for _, values in names for name in values], dtype=object
+                ),
+                ActaTable._offsets([len(values) for _, values in names]),
+            )
+        hashes = [
+            (index, value[1])
+            for index, value in pending.items()
+            if value[1] is not None
+        ]
+        if hashes:
+            self._digests, self._digest_offsets = ActaTable._ragged_update(
+                self._digests,
+                self._digest_offsets,
+                np.array([index for index, _ in hashes], dtype=np.int64),
+                ActaTable._digests(
+                    [digest for _, values in hashes for digest in values]
+                ),
+                ActaTable._offsets([len(values) for _, values in hashes]),
+            )
+
+    @staticmethod
+    def _ragged_update(values, offsets, indexes, new_values, new_offsets):
+        """
+        Replace the rows of the indexes of a flattened column with the rows of
+        new_values, with a single gather over both arrays.
+        """
+        counts = np.diff(offsets)
+        starts = offsets[:-1].copy()
+        counts[indexes] = np.diff(new_offsets)
+        # The rows of new_values follow the rows of values in the gathered array
+        starts[indexes] = new_offsets[:-1] + len(values)
+        offsets = ActaTable._offsets(counts)
+        gather = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+        return np.concatenate([values, new_values])[gather], offsets
+
+    def take(self, indexes):
+        """Get a new table with the actas of the indexes."""
+        return ActaTable.from_actas([self[index] for index in indexes])
+
+    def update(self, indexes, actas):
+        """Replace the actas of the indexes with the processed actas."""
+        if len(indexes) == 0:
+            return
+        indexes = np.asarray(indexes, dtype=np.int64)
+        updated = ActaTable.from_actas(actas)
+        self.url[indexes] = updated.url
+        self.status[indexes] = updated.status
+        self.uploaded[indexes] = updated.uploaded
+        self.datetime[indexes] = updated.datetime
+        # The files are gathered in one vectorized pass over the whole table
+        self._file_names, self._name_offsets = ActaTable._ragged_update(
+            self.file_names,
+            self.name_offsets,
+            indexes,
+            updated.file_names,
+            updated.name_offsets,
+        )
+        self._digests, self._digest_offsets = ActaTable._ragged_update(
+            self.digests,
+            self.digest_offsets,
+            indexes,
+            updated.digests,
+            updated.digest_offsets,
+        )
+
+    def concat(self, other):
+        """Get a new table with the actas of both tables."""
+        return ActaTable(
+            url=np.concatenate([self.url, other.url]),
+            status=np.concatenate([self.status, other.status]),
+            uploaded=np.concatenate([self.uploaded, other.uploaded]),
+            datetime=np.concatenate([self.datetime, other.datetime]),
+            name_offsets=np.concatenate(
+                [self.name_offsets[:-1], other.name_offsets + self.name_offsets[-1]]
+            ),
+            file_names=np.concatenate([self.file_names, other.file_names]),
+            digest_offsets=np.concatenate(
+                [
+                    self.digest_offsets[:-1],
+                    other.digest_offsets + self.digest_offsets[-1],
+                ]
+            ),
+            digests=np.concatenate([self.digests, other.digests]),
+        )
+
+    def to_actas(self):
+        """Get a list of Acta, independent of the table."""
+        return [self[index].to_acta() for index in range(len(self))]
+
+    def status_counts(self):
+        """Count the actas of each ActaStatus."""
+        counts = np.bincount(self.status, minlength=len(STATUS_CODES))
+        return {status: int(counts[code]) for code, status in enumerate(STATUS_CODES)}
+
+    def file_counts(self):
+        """Get the number of files of each acta."""
+        return np.diff(self.name_offsets)
+
+    def to_arrow(self):
+        """
+        Get a pyarrow Table with list columns for the file names and the digests,
+        the digests are fixed size binary values of 32 bytes.
+        """
+        pa, _ = import_pyarrow()
+        digests = pa.FixedSizeBinaryArray.from_buffers(
+            pa.binary(ActaTable.DIGEST_SIZE),
+            len(self.digests),
+            [None, pa.py_buffer(np.ascontiguousarray(self.digests).tobytes())],
+        )
+        return pa.table(
+            {
+                "URL": pa.array(self.url, type=pa.string()),
+                "STATUS": pa.array(STATUS_VALUES[self.status], type=pa.string()),
+                "UPLOADED": pa.array(self.uploaded, type=pa.bool_()),
+                "DATETIME": pa.array(self.datetime, type=pa.string(), from_pandas=True),
+                "FILE_NAMES": pa.ListArray.from_arrays(
+                    pa.array(self.name_offsets, type=pa.int32()),
+                    pa.array(self.file_names, type=pa.string()),
+                ),
+                "HASHES": pa.ListArray.from_arrays(
+                    pa.array(self.digest_offsets, type=pa.int32()), digests
+                ),
+            }
+        )
+
+    @classmethod
+    def from_arrow(cls, table):
+        """
+        Create a table from a pyarrow Table of to_arrow, the digests are read
+        without a copy from the buffers of the table.
+        """
+        pa, _ = import_pyarrow()
+        table = table.combine_chunks()
+
+        def column(name):
+            chunks = table.column(name).chunks
+            return chunks[0] if chunks else pa.array([], table.schema.field(name).type)
+
+        file_names = column("FILE_NAMES")
+        hashes = column("HASHES")
+        name_offsets = file_names.offsets.to_numpy().astype(np.int64)
+        digest_offsets = hashes.offsets.to_numpy().astype(np.int64)
+        # The offsets are relative to the values of the (sliced) list array
+        values = hashes.values
+        digests = np.frombuffer(values.buffers()[1], dtype=np.uint8)[
+            values.offset * ActaTable.DIGEST_SIZE :
+        ].reshape(-1, ActaTable.DIGEST_SIZE)[: len(values)]
+        return cls(
+            url=column("URL").to_numpy(zero_copy_only=False).astype(object),
+            status=pd.Series(column("STATUS").to_numpy(zero_copy_only=False))
+            .map(STATUS_VALUE_CODES)
+            .fillna(STATUS_CODES.index(ActaStatus.ERROR))
+            .to_numpy(dtype=np.int8),
+            uploaded=column("UPLOADED")
+            .fill_null(False)
+            .to_numpy(zero_copy_only=False)
+            .astype(bool),
+            datetime=column("DATETIME").to_numpy(zero_copy_only=False).astype(object),
+            name_offsets=name_offsets - name_offsets[0],
+            file_names=file_names.values.to_numpy(zero_copy_only=False)[
+                name_offsets[0] : name_offsets[-1]
+            ].astype(object),
+            digest_offsets=digest_offsets - digest_offsets[0],
+            digests=digests[digest_offsets[0] : digest_offsets[-1]],
+        )
+
+    def to_df(self):
+        return pd.DataFrame(
+            {
+                "URL": self.url,
+                "STATUS": STATUS_VALUES[self.status],
+                "UPLOADED": self.uploaded,
+                "DATETIME": self.datetime,
+                "FILE_NAMES": self.joined_file_names(),
+                "HASHES": self.joined_hashes(),
+            },
+            columns=COLUMNS,
+        )
+
+    def __getitem__(self, index):
+        return ActaView(self, index)
+
+    def __len__(self):
+        return len(self.url)
+
+    def __iter__(self):
+        return (ActaView(self, index) for index in range(len(self)))
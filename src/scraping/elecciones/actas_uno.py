@@ -1,40 +1,49 @@
+import argparse
 import csv
 import datetime
 import hashlib
 import os
+import sys
 import time
 from pathlib import Path
 
 import pandas as pd
-import pyautogui
+from acta_fetcher import NOT_FOUND_FILE, ActaFetcher
+from browser_pool import BrowserPool, download_image, setup_browser
 from dotenv import load_dotenv
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.firefox.service import Service
+
+sys.path.append(f"{Path().resolve()}/src/scraping")
+from dirwatch import DirectoryIndex, DownloadWaiter  # noqa: E402
 
 # Load .env variables
 _ = load_dotenv(dotenv_path=f"{Path().resolve()}/src/.env")
 
+# Waiter of the browser downloads, see get_download_waiter
+DOWNLOAD_WAITER = None
+
+# Index of the files of src/data/0_raw_uno, see get_directory_index
+DIRECTORY_INDEX = None
+
 
 def setup_driver():
-    options = Options()
-    options.binary_location = os.getenv("BROWSER_PATH", None)
-    service = Service(executable_path=os.getenv("BROWSER_DRIVER_PATH", None))
-    options.set_preference("browser.download.folderList", 2)
-    options.set_preference("browser.download.manager.showWhenStarting", False)
-    options.set_preference(
-        "browser.download.dir",
-        f"{os.getenv('DATA_PATH', None)}/0_raw_uno",
-    )
-    options.set_preference(
-        "browser.helperApps.neverAsk.saveToDisk", "image/jpeg, image/png"
-    )
-    options.set_preference(
-        "browser.helperApps.neverAsk.openFile", "image/jpeg, image/png"
-    )
-    driver = webdriver.Firefox(service=service, options=options)
-    return driver
+    return setup_browser(f"{os.getenv('DATA_PATH', None)}/0_raw_uno", headless=False)
+
+
+# Get the waiter of the browser downloads, it watches the directory from the start
+def get_download_waiter():
+    global DOWNLOAD_WAITER
+    if DOWNLOAD_WAITER is None:
+        DOWNLOAD_WAITER = DownloadWaiter("src/data/0_raw_uno")
+    return DOWNLOAD_WAITER
+
+
+# Get the index of the files of src/data/0_raw_uno, it is built on the first lookup
+def get_directory_index():
+    global DIRECTORY_INDEX
+    if DIRECTORY_INDEX is None:
+        DIRECTORY_INDEX = DirectoryIndex("src/data/0_raw_uno")
+    return DIRECTORY_INDEX
 
 
 def scraping_acta(driver, acta):
@@ -42,24 +51,15 @@ def scraping_acta(driver, acta):
     driver.get(url_acta)
     driver.find_element(By.CSS_SELECTOR, "body > img")
 
-    # Save image form browser using selenium like save as
-    pyautogui.hotkey("ctrl", "s")
-
-    # Type the file name and press Enter
-    pyautogui.write(f"acta_{acta}")
-    time.sleep(0.2)
-    pyautogui.press("enter")
-    # When replace file dialog appears
-    time.sleep(0.2)
-    pyautogui.press("enter")
-    pyautogui.press("enter")
+    # Save image form browser, it returns once the file is complete
+    file_path = download_image(driver, f"acta_{acta}", get_download_waiter())
+    get_directory_index().add(os.path.basename(file_path))
 
     # Current acta
     print(driver.current_url)
-    time.sleep(0.2)
 
     # Process report
-    process_report(acta, driver.current_url)
+    process_report(acta, driver.current_url, os.path.basename(file_path))
 
 
 def get_hash_file_tse(file_name):
@@ -76,24 +76,22 @@ def get_hash_file_tse(file_name):
 
 
 def get_file_name(acta):
-    # Get a file that its name startswith acta_{acta} and has any file extension
-    file_name = "not_found"
-    for file in os.listdir("src/data/0_raw_uno"):
-        if file.startswith(f"acta_{acta}."):
-            file_name = file
-            break
-    return file_name
+    # Get the file acta_{acta} with any extension, from the index
+    file_name = get_directory_index().get(f"acta_{acta}")
+    return file_name or "not_found"
 
 
-def process_report(acta, url_acta):
+def process_report(acta, url_acta, file_name=None, hash_file_tse=None):
     # Get date time iso3086 format
     date_time = datetime.datetime.now().isoformat()
 
-    # Get file name
-    file_name = get_file_name(acta)
+    # Get file name, unless the HTTP engine already knows it
+    if file_name is None:
+        file_name = get_file_name(acta)
 
     # Get hash file tse
-    hash_file_tse = get_hash_file_tse(file_name)
+    if hash_file_tse is None:
+        hash_file_tse = get_hash_file_tse(file_name)
 
     # Save the report in the directory src/data/process_report_uno.csv
     with open("src/data/process_report_uno.csv", "a", newline="") as csvfile:
@@ -164,18 +162,94 @@ def process_actas_not_found(driver):
     df.to_csv("src/data/process_report_uno.csv", index=False)
 
 
+def setup_browser_pool(drivers=None):
+    return BrowserPool(
+        "src/data/0_raw_uno", file_name="acta_{acta}", url_type="uno", drivers=drivers
+    )
+
+
+def setup_fetcher(workers=16):
+    return ActaFetcher(
+        "src/data/0_raw_uno", file_name="acta_{acta}", url_type="uno", workers=workers
+    )
+
+
+def fetch_actas(fetcher, start_acta, end_acta):
+    # Download the actas with concurrent HTTP requests, the report keeps the acta order
+    actas = range(start_acta, end_acta + 1)
+    for acta, _, file_name, hash_file_tse, url_acta in fetcher.fetch_many(actas):
+        print(url_acta)
+        process_report(acta, url_acta, file_name, hash_file_tse)
+
+
+def fetch_actas_not_found(fetcher):
+    # With pandas open the src/data/process_report_uno.csv and get the actas not found
+    df = pd.read_csv("src/data/process_report_uno.csv")
+    actas_not_found = sorted(set(df[df["FILE_NAME"] == "not_found"]["ACTA"].tolist()))
+
+    for acta, _, file_name, hash_file_tse, url_acta in fetcher.fetch_many(
+        actas_not_found
+    ):
+        if file_name == NOT_FOUND_FILE:
+            continue
+        # Update process report
+        df.loc[df["ACTA"] == acta, "FILE_NAME"] = file_name
+        df.loc[df["ACTA"] == acta, "HASH_FILE_TSE"] = hash_file_tse
+        df.loc[df["ACTA"] == acta, "DATE_TIME"] = datetime.datetime.now().isoformat()
+        df.loc[df["ACTA"] == acta, "URL"] = url_acta
+
+    # Update process report
+    df.to_csv("src/data/process_report_uno.csv", index=False)
+
+
 def main():
-    # Setup driver
-    driver = setup_driver()
+    parser = argparse.ArgumentParser(
+        prog="actas_uno",
+        description="Downloads the actas uno to the src/data/0_raw_uno directory",
+    )
+
+    # Drives a pool of headless Firefox instead of the HTTP engine
+    parser.add_argument(
+        "--browser",
+        help="Drives a pool of headless Firefox instead of the HTTP engine",
+        action=argparse.BooleanOptionalAction,
+    )
+
+    # Headless Firefox of the pool, by default one per core
+    parser.add_argument(
+        "--drivers",
+        type=int,
+        default=None,
+        metavar="d",
+        help="Headless Firefox of the pool, by default one per core",
+    )
+
+    # Concurrent downloads of the HTTP engine
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        metavar="w",
+        help="Concurrent downloads of the HTTP engine",
+    )
+
+    args: argparse.Namespace = parser.parse_args()
+
+    # Setup the browser pool or the fetcher, both download the actas the same way
+    if args.browser:
+        fetcher = setup_browser_pool(args.drivers)
+    else:
+        fetcher = setup_fetcher(args.workers)
 
     start_acta = 10100
     end_acta = start_acta + 100
     while True:
         # Process actas not found
-        process_actas_not_found(driver)
+        fetch_actas_not_found(fetcher)
 
         # Process actas
         # process_actas(driver, start_acta, end_acta)
+        # fetch_actas(fetcher, start_acta, end_acta)
 
         print("Scraping again .......................")
 
@@ -0,0 +1,120 @@
+import multiprocessing
+import time
+from contextlib import contextmanager
+
+
+class AdaptiveLimiter:
+    """
+    An AIMD concurrency limit of the TSE requests, shared by every thread and every
+    Pool worker through shared memory.
+
+    Each successful response adds increase / limit to the limit, about +increase per
+    round of requests, while the limit is in use. A throttled response (403, 429,
+    5xx, a connection error or a latency over latency_target) multiplies the limit by
+    decrease, at most once per cooldown seconds, so a burst of throttled responses
+    from the requests already in flight counts as a single signal.
+
+    A request waits on a shared condition until it fits in the limit, it is woken up
+    when a request is released or the limit grows.
+
+    Args:
+        initial (float): The limit of requests in flight at the start.
+        min_limit (int): The lowest limit.
+        max_limit (int): The highest limit.
+        increase (float): The additive increase of each round of requests.
+        decrease (float): The multiplicative decrease of a throttled response.
+        latency_target (float): The seconds from which a response is throttled.
+        cooldown (float): The minimum seconds between two decreases.
+    """
+
+    def __init__(
+        self,
+        initial=16,
+        min_limit=1,
+        max_limit=64,
+        increase=1.0,
+        decrease=0.5,
+        latency_target=10.0,
+        cooldown=1.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        # One lock for the shared values, the values are updated together
+        self._lock = multiprocessing.Lock()
+        # Notified when a request may fit in the limit
+        self._available = multiprocessing.Condition(self._lock)
+        self._limit = multiprocessing.RawValue(
+            "d", min(max(initial, min_limit), max_limit)
+        )
+        self._in_flight = multiprocessing.RawValue("i", 0)
+        self._last_decrease = multiprocessing.RawValue("d", 0.0)
+
+    @property
+    def limit(self):
+        return self._limit.value
+
+    @property
+    def in_flight(self):
+        return self._in_flight.value
+
+    def throttled(self, status_code, seconds):
+        """Check if a response is a signal to slow down, status_code None is an error."""
+        return (
+            status_code is None
+            or status_code in (403, 429)
+            or status_code >= 500
+            or seconds > self.latency_target
+        )
+
+    def _fits(self):
+        return self._in_flight.value < max(int(self._limit.value), self.min_limit)
+
+    def acquire(self):
+        """Wait until a request fits in the limit."""
+        with self._available:
+            self._available.wait_for(self._fits)
+            self._in_flight.value += 1
+
+    def release(self):
+        with self._available:
+            self._in_flight.value -= 1
+            self._available.notify()
+
+    @contextmanager
+    def slot(self):
+        """Hold a request of the limit while the block is running."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def record(self, status_code, seconds):
+        """
+        Update the limit with a response.
+
+        Args:
+            status_code (int): The status code of the response, None if it failed.
+            seconds (float): The latency of the response.
+
+        Returns:
+            bool: True if the response was throttled.
+        """
+        throttled = self.throttled(status_code, seconds)
+        with self._available:
+            limit = self._limit.value
+            if throttled:
+                now = time.time()
+                if now - self._last_decrease.value >= self.cooldown:
+                    self._limit.value = max(self.min_limit, limit * self.decrease)
+                    self._last_decrease.value = now
+            elif self._in_flight.value >= int(limit) - 1:
+                # The limit only grows while the requests in flight reach it
+                self._limit.value = min(self.max_limit, limit + self.increase / limit)
+                if int(self._limit.value) > int(limit):
+                    self._available.notify()
+        return throttled
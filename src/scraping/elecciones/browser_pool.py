@@ -0,0 +1,237 @@
+import hashlib
+import os
+import queue
+import shutil
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from acta_fetcher import NOT_FOUND_FILE, NOT_FOUND_HASH, ActaFetcher
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.firefox.options import Options
+from selenium.webdriver.firefox.service import Service
+
+sys.path.append(f"{Path().resolve()}/src/scraping")
+from dirwatch import DownloadWaiter  # noqa: E402
+
+# Save the image of the current page to the download directory, without a dialog
+DOWNLOAD_SCRIPT = """
+const link = document.createElement("a");
+link.href = window.location.href;
+link.download = arguments[0];
+document.body.appendChild(link);
+link.click();
+link.remove();
+"""
+
+# Chunk size to hash the downloaded images
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def setup_browser(download_dir, headless=True):
+    options = Options()
+    options.binary_location = os.getenv("BROWSER_PATH", None)
+    service = Service(executable_path=os.getenv("BROWSER_DRIVER_PATH", None))
+    if headless:
+        options.add_argument("-headless")
+    options.set_preference("browser.download.folderList", 2)
+    options.set_preference("browser.download.manager.showWhenStarting", False)
+    options.set_preference("browser.download.useDownloadDir", True)
+    options.set_preference(
+        "browser.download.always_ask_before_handling_new_types", False
+    )
+    options.set_preference("browser.download.dir", os.path.abspath(download_dir))
+    options.set_preference(
+        "browser.helperApps.neverAsk.saveToDisk", "image/jpeg, image/png"
+    )
+    options.set_preference(
+        "browser.helperApps.neverAsk.openFile", "image/jpeg, image/png"
+    )
+    driver = webdriver.Firefox(service=service, options=options)
+    return driver
+
+
+# Save the image of the current page as name.<extension> in the waiter directory
+def download_image(driver, name, waiter, timeout=10.0):
+    extension = ActaFetcher.extension(
+        driver.execute_script("return document.contentType;")
+    )
+    # An existing file is replaced, like the save dialog did, instead of renamed
+    for file_name in waiter.candidates(name):
+        file_path = os.path.join(waiter.directory, file_name)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    driver.execute_script(DOWNLOAD_SCRIPT, name)
+    download = waiter.wait(name, timeout)
+    # The browser may name the file with another extension, or none
+    if extension and os.path.basename(download) != f"{name}.{extension}":
+        file_path = os.path.join(waiter.directory, f"{name}.{extension}")
+        os.replace(download, file_path)
+        return file_path
+    return download
+
+
+class BrowserPool:
+    """
+    A pool of headless Firefox drivers to scrape the actas that need a real browser.
+
+    Each driver downloads to its own hidden directory, so the downloads of different
+    drivers never collide, and the complete image is moved to the directory of the
+    actas with the extension of its content type. A download is complete when its
+    file appears, see DownloadWaiter, no GUI keystrokes are involved.
+
+    The actas are split in one contiguous range per driver, a driver that finishes
+    its range steals the actas from the end of the longest remaining one.
+
+    Args:
+        directory (str): The directory of the images.
+        file_name (str): The name of the images without the extension, formatted with
+        the acta and the URL type.
+        url_type (str): The endpoint of the actas, "uno" or "dos".
+        drivers (int): The number of browsers, by default the number of cores.
+        retries (int): The retries of an acta before it is reported as not found.
+        timeout (float): The seconds to wait for a download.
+        headless (bool): False to show the browsers.
+    """
+
+    def __init__(
+        self,
+        directory,
+        file_name="acta_{acta}",
+        url_type="uno",
+        drivers=None,
+        retries=3,
+        timeout=10.0,
+        headless=True,
+    ):
+        self.directory = directory
+        self.file_name = file_name
+        self.url_type = url_type
+        self.retries = retries
+        self.timeout = timeout
+        self.download_dirs = [
+            os.path.join(directory, f".driver_{index}")
+            for index in range(drivers or os.cpu_count() or 1)
+        ]
+        for download_dir in self.download_dirs:
+            # The downloads of a previous run are discarded
+            shutil.rmtree(download_dir, ignore_errors=True)
+            os.makedirs(download_dir)
+        self.waiters = [
+            DownloadWaiter(download_dir) for download_dir in self.download_dirs
+        ]
+        # The browsers start concurrently, a start takes seconds
+        with ThreadPoolExecutor(max_workers=len(self.download_dirs)) as executor:
+            self.drivers = list(
+                executor.map(
+                    lambda download_dir: setup_browser(download_dir, headless),
+                    self.download_dirs,
+                )
+            )
+        self._lock = threading.Lock()
+        self._queues = []
+
+    def fetch(self, index, acta, url_type=None):
+        """
+        Download the image of an acta with a driver of the pool.
+
+        Args:
+            index (int): The index of the driver.
+            acta (int): The number of the acta.
+            url_type (str): The endpoint of the acta, by default the pool one.
+
+        Returns:
+            tuple: (acta, url_type, file_name, hash_file_tse, url_acta) the row of the
+            report, the file name is "not_found" if the acta is not found.
+        """
+        url_type = url_type or self.url_type
+        url_acta = ActaFetcher.url(acta, url_type)
+        for attempt in range(self.retries + 1):
+            try:
+                return self._fetch_once(index, acta, url_type, url_acta)
+            except Exception as e:
+                print(f"Acta not found: {acta} Retry #: {attempt} {type(e).__name__}")
+        return acta, url_type, NOT_FOUND_FILE, NOT_FOUND_HASH, url_acta
+
+    def _fetch_once(self, index, acta, url_type, url_acta):
+        driver = self.drivers[index]
+        driver.get(url_acta)
+        driver.find_element(By.CSS_SELECTOR, "body > img")
+        url_acta = driver.current_url
+        name = self.file_name.format(acta=acta, url_type=url_type)
+        download = download_image(driver, name, self.waiters[index], self.timeout)
+
+        sha256 = hashlib.sha256()
+        with open(download, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        file_name = os.path.basename(download)
+        os.replace(download, os.path.join(self.directory, file_name))
+        return acta, url_type, file_name, sha256.hexdigest(), url_acta
+
+    def _take(self, index):
+        # The next acta of the driver, or one stolen from the longest range
+        with self._lock:
+            own = self._queues[index]
+            if own:
+                return own.popleft()
+            victim = max(self._queues, key=len)
+            if victim:
+                return victim.pop()
+            return None
+
+    def _work(self, index, results):
+        try:
+            while True:
+                job = self._take(index)
+                if job is None:
+                    return
+                if isinstance(job, tuple):
+                    results.put(self.fetch(index, *job))
+                else:
+                    results.put(self.fetch(index, job))
+        finally:
+            results.put(None)
+
+    def fetch_many(self, actas):
+        """
+        Download the images of many actas with every driver of the pool.
+
+        Args:
+            actas (iterable): The number of each acta, or its (acta, url_type).
+
+        Yields:
+            tuple: The row of the report of each acta, in the order they finish.
+        """
+        jobs = list(actas)
+        size = -(-len(jobs) // len(self.drivers))
+        self._queues = [
+            deque(jobs[index * size : (index + 1) * size])
+            for index in range(len(self.drivers))
+        ]
+        results = queue.Queue()
+        threads = [
+            threading.Thread(target=self._work, args=(index, results), daemon=True)
+            for index in range(len(self.drivers))
+        ]
+        for thread in threads:
+            thread.start()
+        running = len(threads)
+        while running:
+            row = results.get()
+            if row is None:
+                running -= 1
+            else:
+                yield row
+
+    def close(self):
+        """Quit the browsers and remove their download directories."""
+        for driver in self.drivers:
+            driver.quit()
+        for waiter in self.waiters:
+            waiter.close()
+        for download_dir in self.download_dirs:
+            shutil.rmtree(download_dir, ignore_errors=True)
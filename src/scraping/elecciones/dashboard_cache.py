@@ -0,0 +1,119 @@
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+
+class DashboardCache:
+    """
+    A persistent cache of the TSE dashboard pages keyed by the dashboard URL.
+
+    Each entry keeps the ETag and Last-Modified validators sent by the server and
+    the file names parsed from the page, so a rerun can revalidate the page with a
+    conditional GET and reuse the file names when the server answers 304.
+
+    The cache is a SQLite database in WAL mode, every process opens its own
+    connection and the threads of a process share it.
+
+    Args:
+        file_name (str): The path of the SQLite database.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            file_name, timeout=30, check_same_thread=False
+        )
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS dashboards (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    file_names TEXT NOT NULL,
+                    datetime TEXT NOT NULL
+                )
+                """)
+
+    def get(self, url):
+        """
+        Get the cached entry of the dashboard.
+
+        Args:
+            url (str): The dashboard URL.
+
+        Returns:
+            dict: The etag, last_modified and file_names of the dashboard, None if
+            the dashboard is not cached.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT etag, last_modified, file_names FROM dashboards WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, file_names = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "file_names": file_names.split(" ") if file_names else [],
+        }
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        Get the headers to revalidate a cached entry.
+
+        Args:
+            entry (dict): The cached entry, see get.
+
+        Returns:
+            dict: The If-None-Match and If-Modified-Since headers of the entry.
+        """
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url, etag, last_modified, file_names):
+        """
+        Save the validators and the file names of the dashboard.
+
+        Pages without validators are not cached, they can't be revalidated.
+
+        Args:
+            url (str): The dashboard URL.
+            etag (str): The ETag header of the response.
+            last_modified (str): The Last-Modified header of the response.
+            file_names (list): The file names parsed from the page.
+        """
+        if not etag and not last_modified:
+            return
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO dashboards VALUES (?, ?, ?, ?, ?)",
+                (
+                    url,
+                    etag,
+                    last_modified,
+                    " ".join(file_names),
+                    datetime.now(timezone.utc).isoformat(
+                        sep="T", timespec="milliseconds"
+                    ),
+                ),
+            )
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM dashboards"
+            ).fetchone()[0]
@@ -0,0 +1,241 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import re
+import threading
+
+# File names that are already a SHA-256 digest, <hash>.jpeg
+HASH_FILE_NAME = re.compile(r"^([0-9a-f]{64})\.\w+$")
+
+
+class DigestSet:
+    """
+    A compact on-disk set of SHA-256 digests, answers "have we already stored this
+    content?" for every directory and every run.
+
+    The digests are kept as 32-byte binary records in two files:
+
+    - file_name: the records sorted, memory-mapped and searched by binary search.
+    - file_name.log: the records appended since the last merge, kept in memory.
+
+    Every process opens its own DigestSet, the records appended by the other
+    processes are read from the log when a digest is not found. merge() folds the
+    log into the sorted file, the log is locked with flock while it is merged.
+
+    Args:
+        file_name (str): The path of the sorted digests file.
+    """
+
+    DIGEST_SIZE = 32
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.log_file_name = f"{file_name}.log"
+        self._lock = threading.Lock()
+        self._file = None
+        self._mmap = None
+        self._stat = None
+        self._count = 0
+        self._log = set()
+        self._log_offset = 0
+        self._log_fd = os.open(
+            self.log_file_name, os.O_CREAT | os.O_RDWR | os.O_APPEND, 0o644
+        )
+        with self._lock:
+            self._refresh()
+
+    @staticmethod
+    def to_bytes(digest):
+        """Get the binary digest of a hex digest or a <hash>.jpeg file name."""
+        if isinstance(digest, bytes):
+            return digest
+        match = HASH_FILE_NAME.match(digest)
+        return bytes.fromhex(match.group(1) if match else digest)
+
+    def _open_sorted(self):
+        # Map the sorted file again, it was replaced by a merge
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+        self._file, self._mmap, self._count = None, None, 0
+        try:
+            self._stat = os.stat(self.file_name)
+        except FileNotFoundError:
+            self._stat = None
+            return
+        if self._stat.st_size > 0:
+            self._file = open(self.file_name, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._count = self._stat.st_size // DigestSet.DIGEST_SIZE
+
+    def _refresh(self):
+        # Read the records appended to the log by this or other processes
+        fcntl.flock(self._log_fd, fcntl.LOCK_SH)
+        try:
+            try:
+                stat = os.stat(self.file_name)
+            except FileNotFoundError:
+                stat = None
+            if (stat is None) != (self._stat is None) or (
+                stat is not None
+                and (stat.st_ino, stat.st_size)
+                != (self._stat.st_ino, self._stat.st_size)
+            ):
+                self._open_sorted()
+                # A merge folded the log into the sorted file
+                self._log.clear()
+                self._log_offset = 0
+            size = os.fstat(self._log_fd).st_size
+            size -= (size - self._log_offset) % DigestSet.DIGEST_SIZE
+            if size > self._log_offset:
+                data = os.pread(self._log_fd, size - self._log_offset, self._log_offset)
+                self._log.update(
+                    data[i : i + DigestSet.DIGEST_SIZE]
+                    for i in range(0, len(data), DigestSet.DIGEST_SIZE)
+                )
+                self._log_offset = size
+        finally:
+            fcntl.flock(self._log_fd, fcntl.LOCK_UN)
+
+    def _search(self, digest):
+        # Binary search in the memory-mapped sorted records
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = mid * DigestSet.DIGEST_SIZE
+            record = self._mmap[start : start + DigestSet.DIGEST_SIZE]
+            if record < digest:
+                lo = mid + 1
+            elif record > digest:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def _contains(self, digest):
+        return digest in self._log or self._search(digest)
+
+    def __contains__(self, digest):
+        digest = DigestSet.to_bytes(digest)
+        with self._lock:
+            if self._contains(digest):
+                return True
+            self._refresh()
+            return self._contains(digest)
+
+    def add(self, digest):
+        """
+        Add a digest to the set.
+
+        Args:
+            digest (str|bytes): The hex digest, the <hash>.jpeg file name or the
+            binary digest.
+
+        Returns:
+            bool: True if the digest was not in the set.
+        """
+        digest = DigestSet.to_bytes(digest)
+        with self._lock:
+            self._refresh()
+            if self._contains(digest):
+                return False
+            fcntl.flock(self._log_fd, fcntl.LOCK_SH)
+            try:
+                os.write(self._log_fd, digest)
+            finally:
+                fcntl.flock(self._log_fd, fcntl.LOCK_UN)
+            self._log.add(digest)
+            return True
+
+    def merge(self):
+        """Merge the log into the sorted file and truncate the log."""
+        with self._lock:
+            # Map the sorted file of a previous merge of another process
+            self._refresh()
+            fcntl.flock(self._log_fd, fcntl.LOCK_EX)
+            try:
+                size = os.fstat(self._log_fd).st_size
+                data = os.pread(self._log_fd, size, 0)
+                records = {
+                    data[i : i + DigestSet.DIGEST_SIZE]
+                    for i in range(
+                        0, size - size % DigestSet.DIGEST_SIZE, DigestSet.DIGEST_SIZE
+                    )
+                }
+                if self._mmap is not None:
+                    records.update(
+                        self._mmap[i : i + DigestSet.DIGEST_SIZE]
+                        for i in range(
+                            0,
+                            self._count * DigestSet.DIGEST_SIZE,
+                            DigestSet.DIGEST_SIZE,
+                        )
+                    )
+                DigestSet._write_sorted(self.file_name, records)
+                os.ftruncate(self._log_fd, 0)
+                self._log.clear()
+                self._log_offset = 0
+                self._open_sorted()
+            finally:
+                fcntl.flock(self._log_fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _write_sorted(file_name, records):
+        # Write to a temporary file and rename it, readers keep the old mapping
+        temp_file_name = f"{file_name}.tmp"
+        with open(temp_file_name, "wb") as f:
+            f.write(b"".join(sorted(records)))
+        os.replace(temp_file_name, file_name)
+
+    @classmethod
+    def build(cls, file_name, directories):
+        """
+        Build the digest set from the files of the directories.
+
+        The files named <hash>.jpeg use the digest of the name, any other file is
+        hashed.
+
+        Args:
+            file_name (str): The path of the sorted digests file.
+            directories (list): The directories with the stored files.
+
+        Returns:
+            DigestSet: The digest set.
+        """
+        records = set()
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    # Ignore hidden files and the downloads in progress
+                    if entry.name.startswith(".") or not entry.is_file():
+                        continue
+                    match = HASH_FILE_NAME.match(entry.name)
+                    if match:
+                        records.add(bytes.fromhex(match.group(1)))
+                        continue
+                    sha256 = hashlib.sha256()
+                    with open(entry.path, "rb") as f:
+                        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                            sha256.update(chunk)
+                    records.add(sha256.digest())
+        cls._write_sorted(file_name, records)
+        digest_set = cls(file_name)
+        digest_set.merge()
+        return digest_set
+
+    def close(self):
+        """Close the mapping and the log."""
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._file.close()
+                self._mmap = None
+            os.close(self._log_fd)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._count + len(self._log)
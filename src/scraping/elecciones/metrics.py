@@ -0,0 +1,211 @@
+import bisect
+import multiprocessing
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prefix of every metric name
+NAMESPACE = "elecciones"
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+# Help of each metric, the metrics without help are not rendered with # HELP
+HELP = {
+    "dashboard_fetch_seconds": "Latency of the TSE dashboard requests",
+    "image_fetch_seconds": "Latency of the TSE image downloads",
+    "hash_seconds": "Time hashing the images",
+    "s3_upload_seconds": "Latency of the S3 uploads",
+    "s3_upload_skipped_total": "Files not uploaded, already in the S3 inventory",
+    "downloaded_bytes_total": "Bytes downloaded from the TSE",
+    "actas_total": "Actas processed by status",
+    "throttled_total": "TSE responses that decreased the adaptive limit",
+    "retries_total": "TSE requests retried by reason",
+    "circuit_open_total": "Times the circuit of a TSE host opened",
+}
+
+# Events of the current process: None, the orchestrator registry or a worker queue
+EVENTS = None
+
+
+class Metrics:
+    """
+    A registry of counters and histograms in the orchestrating process, rendered in
+    the Prometheus text format.
+
+    The Pool workers don't share memory with the orchestrator, they put their events
+    in a multiprocessing queue (see worker_queue and set_queue) and a thread of the
+    orchestrator adds them to the registry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self._server = None
+        self._queue = None
+
+    @staticmethod
+    def key(name, labels=None):
+        return (name, tuple(sorted((labels or {}).items())))
+
+    def apply(self, event):
+        """
+        Add an event to the registry.
+
+        Args:
+            event (tuple): ("inc", name, value, labels) or ("observe", name, value,
+            labels).
+        """
+        kind, name, value, labels = event
+        key = Metrics.key(name, labels)
+        with self._lock:
+            if kind == "inc":
+                self.counters[key] = self.counters.get(key, 0) + value
+                return
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0}
+                self.histograms[key] = histogram
+            histogram["buckets"][bisect.bisect_left(BUCKETS, value)] += 1
+            histogram["sum"] += value
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        labels = list(labels) + list(extra)
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+    def render(self):
+        """Get the metrics in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, {"buckets": list(value["buckets"]), "sum": value["sum"]})
+                for key, value in self.histograms.items()
+            )
+        described = set()
+
+        def describe(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {NAMESPACE}_{name} {HELP[name]}")
+            lines.append(f"# TYPE {NAMESPACE}_{name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{NAMESPACE}_{name}{Metrics._labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ["+Inf"], histogram["buckets"]):
+                cumulative += count
+                le = Metrics._labels(labels, [("le", bound)])
+                lines.append(f"{NAMESPACE}_{name}_bucket{le} {cumulative}")
+            lines.append(
+                f"{NAMESPACE}_{name}_sum{Metrics._labels(labels)} {histogram['sum']}"
+            )
+            lines.append(
+                f"{NAMESPACE}_{name}_count{Metrics._labels(labels)} {cumulative}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve the metrics on http://host:port/metrics from a daemon thread, the server
+        is started once and keeps running between runs.
+
+        Args:
+            port (int): The port of the HTTP server.
+            host (str): The address of the HTTP server, local by default.
+        """
+        if self._server is not None:
+            return
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                # The scrapes are not logged
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def worker_queue(self):
+        """
+        Get the queue of the Pool workers, the events are added to the registry by a
+        daemon thread.
+
+        Returns:
+            multiprocessing.Queue: The queue to pass to set_queue in each worker.
+        """
+        if self._queue is None:
+            self._queue = multiprocessing.Queue(maxsize=100000)
+            threading.Thread(target=self._consume, daemon=True).start()
+        return self._queue
+
+    def _consume(self):
+        while True:
+            self.apply(self._queue.get())
+
+    def close(self):
+        """Stop the HTTP server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# Registry of the orchestrating process
+REGISTRY = Metrics()
+
+
+def set_queue(events):
+    """Send the events of the current process to the orchestrator queue, or None."""
+    global EVENTS
+    EVENTS = events
+
+
+def enable(registry):
+    """Add the events of the current process directly to the registry."""
+    global EVENTS
+    EVENTS = registry
+
+
+def _record(event):
+    events = EVENTS
+    if events is None:
+        return
+    if isinstance(events, Metrics):
+        events.apply(event)
+        return
+    try:
+        events.put_nowait(event)
+    except queue.Full:
+        # Metrics are best effort, the scraping never waits for them
+        pass
+
+
+def inc(name, value=1, labels=None):
+    """Increment a counter."""
+    _record(("inc", name, value, labels))
+
+
+def observe(name, value, labels=None):
+    """Observe a value of a histogram."""
+    _record(("observe", name, value, labels))
@@ -0,0 +1,97 @@
+import queue
+import threading
+
+from loguru import logger
+
+# Marks the end of the items of a stage
+STOP = object()
+
+
+class Stage:
+    """
+    A stage of a Pipeline, worker threads that take the items of a bounded queue.
+
+    Putting an item blocks while the queue is full, so a slow stage slows down the
+    stages that feed it instead of buffering every item in memory.
+
+    Args:
+        name (str): The name of the stage.
+        function (callable): The function called with each item.
+        workers (int): The number of worker threads.
+        queue_size (int): The maximum number of items waiting in the queue.
+    """
+
+    def __init__(self, name, function, workers, queue_size):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.threads = []
+
+    def start(self):
+        self.threads = [
+            threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is STOP:
+                return
+            try:
+                self.function(item)
+            except Exception:
+                # The stage functions handle their errors, never stop a worker
+                logger.exception(f"Unhandled error in the {self.name} stage")
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def stop(self):
+        """Wait until every item is processed and stop the workers."""
+        for _ in self.threads:
+            self.queue.put(STOP)
+        for thread in self.threads:
+            thread.join()
+
+
+class Pipeline:
+    """
+    Stages connected by bounded queues, each stage with its own number of workers.
+
+    The items only move forward: the function of a stage puts its results in the
+    next stages with put(name, item), any number of them per item.
+
+    Args:
+        stages (list): The (name, function, workers) of each stage, in order.
+        queue_size (int): The maximum number of items waiting in each stage.
+    """
+
+    def __init__(self, stages, queue_size=256):
+        self.stages = {
+            name: Stage(name, function, workers, queue_size)
+            for name, function, workers in stages
+        }
+
+    def put(self, name, item):
+        """Put an item in a stage, blocks while the stage is full."""
+        self.stages[name].put(item)
+
+    def run(self, items):
+        """
+        Put the items in the first stage and wait until every stage is done.
+
+        Args:
+            items (iterable): The items of the first stage.
+        """
+        for stage in self.stages.values():
+            stage.start()
+        stages = list(self.stages.values())
+        for item in items:
+            stages[0].put(item)
+        # A stage is done when the stages before it are done and its queue is empty
+        for stage in stages:
+            stage.stop()
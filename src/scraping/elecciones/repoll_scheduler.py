@@ -0,0 +1,216 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+
+class RepollScheduler:
+    """
+    Decides which actas are polled again on each run and in which order.
+
+    The scheduler keeps a history per acta URL: the last status, the number of
+    consecutive not found and failed (error or forbidden) results, when the acta
+    last changed (status or hashes) and when it is due again. Pending actas are
+    always polled, the actas not found yet back off exponentially unless they
+    changed recently, the failed actas back off exponentially, and the settled
+    actas (downloaded and uploaded) are polled again every settled_interval, in
+    case the TSE publishes a new image.
+
+    Args:
+        base_interval (int): Seconds between polls of an acta that keeps changing.
+        max_interval (int): Maximum seconds between polls of an acta not found or
+        failed.
+        hot_window (int): Seconds since the last change while an acta is polled
+        every base_interval.
+        settled_interval (int): Seconds between polls of a settled acta.
+    """
+
+    columns = [
+        "URL",
+        "LAST_STATUS",
+        "LAST_HASHES",
+        "NOT_FOUND_COUNT",
+        "FAILURE_COUNT",
+        "LAST_CHANGED",
+        "LAST_POLLED",
+        "NEXT_POLL",
+    ]
+
+    # Polling order by last status, lower goes first
+    priorities = {
+        "pending": 0,
+        "downloaded": 1,
+        "error": 2,
+        "forbidden": 2,
+        "not_found": 3,
+    }
+
+    # Statuses of the failed polls, retried with backoff
+    failures = ("error", "forbidden")
+
+    def __init__(
+        self,
+        base_interval=300,
+        max_interval=21600,
+        hot_window=3600,
+        settled_interval=86400,
+    ):
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.hot_window = hot_window
+        self.settled_interval = settled_interval
+        self.history = {}
+
+    @staticmethod
+    def now():
+        return datetime.now(timezone.utc)
+
+    def backoff(self, count):
+        """Get the seconds until the next poll after count consecutive misses."""
+        return min(self.base_interval * 2 ** max(count - 1, 0), self.max_interval)
+
+    def interval(self, entry, now):
+        """
+        Get the seconds until the next poll of an acta.
+
+        Args:
+            entry (dict): The history of the acta.
+            now (datetime): The current datetime.
+
+        Returns:
+            int: The seconds until the next poll.
+        """
+        # Settled actas are only checked for a new image once in a while
+        if entry["LAST_STATUS"] == "downloaded":
+            return self.settled_interval
+        # The failures back off even while the acta is recent, the TSE is refusing
+        if entry["LAST_STATUS"] in RepollScheduler.failures:
+            return self.backoff(entry["FAILURE_COUNT"])
+        # Recently published or changing actas are polled often
+        if now - entry["LAST_CHANGED"] < timedelta(seconds=self.hot_window):
+            return self.base_interval
+        if entry["LAST_STATUS"] == "not_found":
+            return self.backoff(entry["NOT_FOUND_COUNT"])
+        return self.base_interval
+
+    def observe(self, acta, now=None):
+        """
+        Update the history of an acta after it was processed.
+
+        Args:
+            acta (Acta): The processed acta.
+            now (datetime): The current datetime, by default now.
+        """
+        now = now or self.now()
+        status = acta.status.value
+        hashes = " ".join(acta.hashes)
+        entry = self.history.get(acta.url)
+        if entry is None:
+            entry = {
+                "URL": acta.url,
+                "LAST_STATUS": None,
+                "LAST_HASHES": "",
+                "NOT_FOUND_COUNT": 0,
+                "FAILURE_COUNT": 0,
+                "LAST_CHANGED": now,
+            }
+            self.history[acta.url] = entry
+        # The acta changed since the last poll
+        if entry["LAST_STATUS"] != status or entry["LAST_HASHES"] != hashes:
+            entry["LAST_CHANGED"] = now
+        entry["NOT_FOUND_COUNT"] = (
+            entry["NOT_FOUND_COUNT"] + 1 if status == "not_found" else 0
+        )
+        entry["FAILURE_COUNT"] = (
+            entry["FAILURE_COUNT"] + 1 if status in RepollScheduler.failures else 0
+        )
+        entry["LAST_STATUS"] = status
+        entry["LAST_HASHES"] = hashes
+        entry["LAST_POLLED"] = now
+        entry["NEXT_POLL"] = now + timedelta(seconds=self.interval(entry, now))
+
+    def is_due(self, acta, now=None):
+        """
+        Check if an acta has to be processed in this run.
+
+        Args:
+            acta (Acta): The acta.
+            now (datetime): The current datetime, by default now.
+
+        Returns:
+            bool: True if the acta is due.
+        """
+        now = now or self.now()
+        status = acta.status.value
+        # Downloaded actas not uploaded yet, there is work left to do
+        if status == "downloaded" and not acta.uploaded:
+            return True
+        entry = self.history.get(acta.url)
+        # Actas without history or with a new status are polled right away
+        if entry is None or entry["LAST_STATUS"] != status:
+            return True
+        return entry["NEXT_POLL"] <= now
+
+    def select(self, actas, now=None):
+        """
+        Select the actas due in this run.
+
+        Args:
+            actas (list): The actas of the DataSources.
+            now (datetime): The current datetime, by default now.
+
+        Returns:
+            list: The indexes of the due actas sorted by priority.
+        """
+        now = now or self.now()
+        due = [index for index, acta in enumerate(actas) if self.is_due(acta, now)]
+
+        # Pending actas first, then the most recently changed, then the most overdue
+        def key(index):
+            acta = actas[index]
+            entry = self.history.get(acta.url)
+            if entry is None:
+                return (0, 0.0, 0.0)
+            return (
+                self.priorities.get(acta.status.value, 0),
+                (now - entry["LAST_CHANGED"]).total_seconds(),
+                (entry["NEXT_POLL"] - now).total_seconds(),
+            )
+
+        return sorted(due, key=key)
+
+    def save(self, file_name):
+        """Save the history in a CSV file."""
+        pd.DataFrame(
+            list(self.history.values()), columns=RepollScheduler.columns
+        ).to_csv(file_name, index=False)
+
+    def load(self, file_name):
+        """Load the history from a CSV file, if it exists."""
+        if not os.path.exists(file_name):
+            return
+        # The histories saved before FAILURE_COUNT count no failure
+        df = pd.read_csv(
+            file_name,
+            usecols=lambda column: column in RepollScheduler.columns,
+            dtype={"LAST_HASHES": str},
+            keep_default_na=False,
+        )
+        for column in ["LAST_CHANGED", "LAST_POLLED", "NEXT_POLL"]:
+            df[column] = pd.to_datetime(df[column], utc=True)
+        self.history = {
+            row["URL"]: {
+                "URL": row["URL"],
+                "LAST_STATUS": row["LAST_STATUS"],
+                "LAST_HASHES": row["LAST_HASHES"],
+                "NOT_FOUND_COUNT": int(row["NOT_FOUND_COUNT"]),
+                "FAILURE_COUNT": int(row.get("FAILURE_COUNT", 0)),
+                "LAST_CHANGED": row["LAST_CHANGED"].to_pydatetime(),
+                "LAST_POLLED": row["LAST_POLLED"].to_pydatetime(),
+                "NEXT_POLL": row["NEXT_POLL"].to_pydatetime(),
+            }
+            for row in df.to_dict("records")
+        }
+
+    def __len__(self):
+        return len(self.history)
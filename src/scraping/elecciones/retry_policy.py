@@ -0,0 +1,184 @@
+import multiprocessing
+import random
+import threading
+import time
+
+import requests
+
+# Status codes of a transient failure of the server, the request is retried
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+# Errors of a transient failure of the connection, the request is retried
+RETRY_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class RetryPolicy:
+    """
+    When and after how long a failed request is retried: the transient failures
+    (connection errors, timeouts and 5xx responses) are retried with full jitter
+    exponential backoff, the other failures (404, 403, 429 and the other errors) are
+    not, the throttled requests are handled by the adaptive limit.
+
+    The retries are limited by a budget: every first attempt deposits budget_ratio
+    tokens and every retry takes one, so when the host is failing the retries are at
+    most budget_ratio of the requests instead of multiplying them.
+
+    Args:
+        max_attempts (int): The attempts of a request, the first one included.
+        base_delay (float): The maximum seconds before the first retry.
+        max_delay (float): The maximum seconds before any retry.
+        budget_ratio (float): The retries allowed per request.
+        min_budget (float): The retries allowed at the start.
+        max_budget (float): The most retries saved up in the budget.
+    """
+
+    def __init__(
+        self,
+        max_attempts=4,
+        base_delay=0.5,
+        max_delay=30.0,
+        budget_ratio=0.2,
+        min_budget=10,
+        max_budget=100,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.max_budget = max_budget
+        self._lock = threading.Lock()
+        self._tokens = min_budget
+
+    @staticmethod
+    def classify(error=None, status_code=None):
+        """
+        Get the reason to retry a request, None if it must not be retried.
+
+        Args:
+            error (Exception): The error of the request, None if it has a response.
+            status_code (int): The status code of the response.
+
+        Returns:
+            str: "connection", "timeout" or "status_<code>", None if not retryable.
+        """
+        if error is not None:
+            if isinstance(error, requests.exceptions.Timeout):
+                return "timeout"
+            if isinstance(error, RETRY_ERRORS):
+                return "connection"
+            return None
+        if status_code in RETRY_STATUS_CODES:
+            return f"status_{status_code}"
+        return None
+
+    def record_request(self):
+        """Deposit the tokens of a first attempt in the budget."""
+        with self._lock:
+            self._tokens = min(self.max_budget, self._tokens + self.budget_ratio)
+
+    def allow(self, attempt):
+        """
+        Take a retry from the budget.
+
+        Args:
+            attempt (int): The number of the attempt that failed, from 1.
+
+        Returns:
+            bool: True if the request is retried.
+        """
+        if attempt >= self.max_attempts:
+            return False
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def backoff(self, attempt):
+        """Get the seconds before a retry, full jitter over the exponential delay."""
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker of a host, shared by every thread and every Pool worker through
+    shared memory.
+
+    After failure_threshold consecutive transient failures the circuit opens and the
+    requests to the host wait reset_timeout seconds instead of hammering it, then a
+    single request probes the host: the circuit closes if it succeeds and opens again
+    if it fails.
+
+    Args:
+        failure_threshold (int): The consecutive failures that open the circuit.
+        reset_timeout (float): The seconds the circuit stays open.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, failure_threshold=10, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = multiprocessing.Lock()
+        self._state = multiprocessing.RawValue("i", CircuitBreaker.CLOSED)
+        self._failures = multiprocessing.RawValue("i", 0)
+        self._opened_at = multiprocessing.RawValue("d", 0.0)
+
+    @property
+    def state(self):
+        return self._state.value
+
+    def wait(self):
+        """
+        Wait until a request can be sent to the host.
+
+        Returns:
+            float: The seconds waited while the circuit was open.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                state = self._state.value
+                if state == CircuitBreaker.CLOSED:
+                    return waited
+                remaining = self._opened_at.value + self.reset_timeout - time.time()
+                # A new probe is sent if the last one didn't finish in reset_timeout
+                if remaining <= 0 and (
+                    state == CircuitBreaker.OPEN or remaining <= -self.reset_timeout
+                ):
+                    # This request is the probe, the others keep waiting
+                    self._state.value = CircuitBreaker.HALF_OPEN
+                    self._opened_at.value = time.time() - self.reset_timeout
+                    return waited
+            delay = min(max(remaining, 0.1), 1.0)
+            time.sleep(delay)
+            waited += delay
+
+    def record_success(self):
+        with self._lock:
+            self._failures.value = 0
+            self._state.value = CircuitBreaker.CLOSED
+
+    def record_failure(self):
+        """
+        Count a transient failure of the host.
+
+        Returns:
+            bool: True if the failure opened the circuit.
+        """
+        with self._lock:
+            self._failures.value += 1
+            if self._state.value == CircuitBreaker.HALF_OPEN or (
+                self._state.value == CircuitBreaker.CLOSED
+                and self._failures.value >= self.failure_threshold
+            ):
+                self._state.value = CircuitBreaker.OPEN
+                self._opened_at.value = time.time()
+                return True
+            return False
@@ -0,0 +1,142 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class RunStatistics:
+    """
+    The statistics of a run, computed in one vectorized pass over the columns of the
+    DataSources and recorded per run to compare the runs.
+
+    The statistics are the totals of actas of each status, uploaded and duplicated
+    (downloaded actas with the same URL), the files downloaded and uploaded, and the
+    same totals for each election, prefixed with the election name.
+
+    Args:
+        statuses (list): The status values, the position is the status code.
+    """
+
+    # The election of an acta is the number before .html of the dashboard URL
+    elections = {"4": "ALCALDE", "2": "DIP_PARLACEN"}
+
+    def __init__(self, statuses):
+        self.statuses = [status.upper() for status in statuses]
+        self.values = {}
+
+    def compute(self, url, status, uploaded, file_counts):
+        """
+        Compute the statistics.
+
+        Args:
+            url (np.ndarray): The URL of each acta.
+            status (np.ndarray): The status code of each acta.
+            uploaded (np.ndarray): The uploaded flag of each acta.
+            file_counts (np.ndarray): The number of files of each acta.
+
+        Returns:
+            dict: The statistics by name.
+        """
+        total_statuses = len(self.statuses)
+        total_elections = len(self.elections) + 1
+        downloaded = status == self.statuses.index("DOWNLOADED")
+
+        # Election code of each acta, the last code is any other dashboard
+        election = (
+            pd.Series(url, dtype=object)
+            .str.get(-6)
+            .map({key: code for code, key in enumerate(self.elections)})
+            .fillna(total_elections - 1)
+            .to_numpy(dtype=np.int64)
+        )
+
+        # One key per election and status, every total is a bincount of the keys
+        keys = election * total_statuses + status.astype(np.int64)
+        size = total_elections * total_statuses
+
+        def totals(weights=None):
+            return np.bincount(keys, weights=weights, minlength=size).reshape(
+                total_elections, total_statuses
+            )
+
+        counts = totals()
+        uploaded_counts = totals(uploaded.astype(np.int64))
+        files = totals(np.where(downloaded, file_counts, 0))
+        files_uploaded = totals(np.where(downloaded & uploaded, file_counts, 0))
+        duplicated = pd.Series(url[downloaded], dtype=object).duplicated()
+        duplicated_counts = np.bincount(
+            election[downloaded][duplicated.to_numpy()], minlength=total_elections
+        )
+
+        def election_values(prefix, rows):
+            values = {f"{prefix}TOTAL": int(counts[rows].sum())}
+            for code, name in enumerate(self.statuses):
+                values[f"{prefix}{name}"] = int(counts[rows, code].sum())
+            values[f"{prefix}UPLOADED"] = int(uploaded_counts[rows].sum())
+            values[f"{prefix}DUPLICATED"] = int(duplicated_counts[rows].sum())
+            values[f"{prefix}FILES_DOWNLOADED"] = int(files[rows].sum())
+            values[f"{prefix}FILES_UPLOADED"] = int(files_uploaded[rows].sum())
+            return values
+
+        self.values = election_values("", slice(None))
+        for code, name in enumerate(self.elections.values()):
+            self.values.update(election_values(f"{name}_", [code]))
+        return self.values
+
+    def diff(self, previous):
+        """
+        Get the change of each statistic since a previous run.
+
+        Args:
+            previous (dict): The statistics of the previous run, see last.
+
+        Returns:
+            dict: The difference by name, 0 when the previous run doesn't have it.
+        """
+        previous = previous or {}
+        return {
+            name: value - int(previous.get(name, value))
+            for name, value in self.values.items()
+        }
+
+    def save(self, file_name, start, end):
+        """
+        Append the statistics of the run to a CSV file.
+
+        Args:
+            file_name (str): The CSV file with one row per run.
+            start (str): The isoformat datetime of the start of the run.
+            end (str): The isoformat datetime of the end of the run.
+        """
+        row = pd.DataFrame([{"START": start, "END": end, **self.values}])
+        if not os.path.exists(file_name):
+            row.to_csv(file_name, index=False)
+            return
+        columns = list(pd.read_csv(file_name, nrows=0).columns)
+        if set(row.columns) <= set(columns):
+            # The row is appended with the columns of the previous runs
+            row.reindex(columns=columns).to_csv(
+                file_name, mode="a", header=False, index=False
+            )
+        else:
+            # A new statistic is a new column, the only case the file is rewritten
+            history = pd.read_csv(file_name)
+            pd.concat([history, row], ignore_index=True).to_csv(file_name, index=False)
+
+    @staticmethod
+    def last(file_name):
+        """
+        Get the statistics of the last run of a CSV file.
+
+        Returns:
+            dict: The statistics by name, None if there are no runs.
+        """
+        if not os.path.exists(file_name):
+            return None
+        history = pd.read_csv(file_name)
+        if history.empty:
+            return None
+        return history.drop(columns=["START", "END"]).iloc[-1].dropna().to_dict()
+
+    def __str__(self):
+        return ", ".join(f"{name}: {value}" for name, value in self.values.items())
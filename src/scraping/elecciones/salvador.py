@@ -1,33 +1,44 @@
+import argparse
 import os
+import sys
 import time
 from pathlib import Path
 
-import pyautogui
+from acta_fetcher import NOT_FOUND_FILE, ActaFetcher
+from browser_pool import BrowserPool, download_image, setup_browser
 from dotenv import load_dotenv
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.firefox.service import Service
+
+sys.path.append(f"{Path().resolve()}/src/scraping")
+from dirwatch import DownloadWaiter  # noqa: E402
 
 # Load .env variables
 _ = load_dotenv(dotenv_path=f"{Path().resolve()}/src/.env")
 
+# Waiter of the browser downloads, see get_download_waiter
+DOWNLOAD_WAITER = None
+
 
 def setup_driver():
-    options = Options()
-    options.binary_location = os.getenv("BROWSER_PATH", None)
-    service = Service(executable_path=os.getenv("BROWSER_DRIVER_PATH", None))
-    options.set_preference("browser.download.folderList", 2)
-    options.set_preference("browser.download.manager.showWhenStarting", False)
-    options.set_preference("browser.download.dir", os.getenv("DOWNLOAD_PATH", None))
-    options.set_preference(
-        "browser.helperApps.neverAsk.saveToDisk", "image/jpeg, image/png"
-    )
-    options.set_preference(
-        "browser.helperApps.neverAsk.openFile", "image/jpeg, image/png"
-    )
-    driver = webdriver.Firefox(service=service, options=options)
-    return driver
+    return setup_browser(os.getenv("DOWNLOAD_PATH", None), headless=False)
+
+
+# Get the waiter of the browser downloads, it watches the directory from the start
+def get_download_waiter():
+    global DOWNLOAD_WAITER
+    if DOWNLOAD_WAITER is None:
+        DOWNLOAD_WAITER = DownloadWaiter(os.getenv("DOWNLOAD_PATH", None))
+    return DOWNLOAD_WAITER
+
+
+def scraping_acta(driver, acta):
+    driver.get(f"https://preliminar.tse.gob.sv/administracion/img/get-acta/{acta}")
+    driver.find_element(By.CSS_SELECTOR, "body > img")
+
+    # Save image form browser, it returns once the file is complete
+    download_image(driver, f"acta_{acta}", get_download_waiter())
+
+    print(driver.current_url)
 
 
 def process_actas(driver, start_acta, end_acta):
@@ -36,24 +47,7 @@ def process_actas(driver, start_acta, end_acta):
     total = end_acta - acta
     while total > 0:
         try:
-            driver.get(
-                f"https://preliminar.tse.gob.sv/administracion/img/get-acta/{acta}"
-            )
-            driver.find_element(By.CSS_SELECTOR, "body > img")
-
-            # Save image form browser using selenium like save as
-            pyautogui.hotkey("ctrl", "s")
-
-            # Type the file name and press Enter
-            pyautogui.write(f"acta_{acta}")
-            time.sleep(0.2)
-            pyautogui.press("enter")
-            # When replace file dialog appears
-            time.sleep(0.2)
-            pyautogui.press("enter")
-            pyautogui.press("enter")
-
-            print(driver.current_url)
+            scraping_acta(driver, acta)
             # Next acta
             acta += 1
             # Total
@@ -87,25 +81,7 @@ def process_actas_not_found(driver):
         for line in file:
             acta = int(line)
             try:
-                driver.get(
-                    f"https://preliminar.tse.gob.sv/administracion/img/get-acta/{acta}"
-                )
-                driver.find_element(By.CSS_SELECTOR, "body > img")
-
-                # Save image form browser using selenium like save as
-                pyautogui.hotkey("ctrl", "s")
-
-                # Type the file name and press Enter
-                pyautogui.write(f"acta_{acta}")
-                time.sleep(0.2)
-                pyautogui.press("enter")
-                # When replace file dialog appears
-                time.sleep(0.2)
-                pyautogui.press("enter")
-                pyautogui.press("enter")
-
-                print(driver.current_url)
-                time.sleep(0.2)
+                scraping_acta(driver, acta)
             except Exception:
                 print(f"Acta not found: {acta}")
                 if acta not in actas_not_found:
@@ -120,12 +96,82 @@ def process_actas_not_found(driver):
             file.write(f"{acta}\n")
 
 
+def setup_browser_pool(drivers=None):
+    return BrowserPool(os.getenv("DOWNLOAD_PATH", None), drivers=drivers)
+
+
+def setup_fetcher(workers=16):
+    return ActaFetcher(os.getenv("DOWNLOAD_PATH", None), workers=workers)
+
+
+def fetch_actas(fetcher, start_acta, end_acta):
+    # Download the actas with concurrent HTTP requests
+    actas = range(start_acta, end_acta)
+    for acta, _, file_name, _, url_acta in fetcher.fetch_many(actas):
+        print(url_acta)
+        if file_name == NOT_FOUND_FILE:
+            # Save acta into a file, append
+            with open("src/data/actas_not_found.txt", "a") as file:
+                file.write(f"{acta}\n")
+
+
+def fetch_actas_not_found(fetcher):
+    with open("src/data/actas_not_found.txt", "r") as file:
+        actas = [int(line) for line in file]
+
+    actas_not_found = set()
+    for acta, _, file_name, _, url_acta in fetcher.fetch_many(actas):
+        print(url_acta)
+        if file_name == NOT_FOUND_FILE:
+            actas_not_found.add(acta)
+
+    # Save actas_not_found in src/data/actas_not_found.txt
+    with open("src/data/actas_not_found.txt", "w") as file:
+        # Sort actas_not_found ascending
+        for acta in sorted(actas_not_found):
+            file.write(f"{acta}\n")
+
+
 def main():
-    # Setup driver
-    driver = setup_driver()
+    parser = argparse.ArgumentParser(
+        prog="salvador",
+        description="Downloads the actas to the DOWNLOAD_PATH directory",
+    )
+
+    # Drives a pool of headless Firefox instead of the HTTP engine
+    parser.add_argument(
+        "--browser",
+        help="Drives a pool of headless Firefox instead of the HTTP engine",
+        action=argparse.BooleanOptionalAction,
+    )
+
+    # Headless Firefox of the pool, by default one per core
+    parser.add_argument(
+        "--drivers",
+        type=int,
+        default=None,
+        metavar="d",
+        help="Headless Firefox of the pool, by default one per core",
+    )
+
+    # Concurrent downloads of the HTTP engine
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        metavar="w",
+        help="Concurrent downloads of the HTTP engine",
+    )
+
+    args: argparse.Namespace = parser.parse_args()
 
-    # Process actas not found
-    process_actas_not_found(driver)
+    # Setup the browser pool or the fetcher and process actas not found
+    if args.browser:
+        fetcher = setup_browser_pool(args.drivers)
+    else:
+        fetcher = setup_fetcher(args.workers)
+    fetch_actas_not_found(fetcher)
+    fetcher.close()
 
     # Process actas
     # Last preocessed acta: 9994
@@ -133,6 +179,7 @@ def main():
     # Presidencia 8562, Asamblea 8562 * 3 = 25686
     # process_actas(driver, start_acta=9994, end_acta=10001)
     # process_actas(driver, start_acta=1, end_acta=201)
+    # fetch_actas(fetcher, start_acta=1, end_acta=201)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,220 @@
+import sqlite3
+import threading
+
+
+class StateStore:
+    """
+    A SQLite backend for the DataSources state, in WAL mode so the workers can
+    upsert each acta as soon as it finishes while other processes read.
+
+    Tables:
+
+    - actas: one row per acta URL with the DataSources columns, indexed by URL and
+      STATUS, in the order the actas were added.
+    - runs: the history of the runs with the totals of each one.
+    - run_statistics: every statistic of each run, see RunStatistics.
+
+    Args:
+        file_name (str): The path of the SQLite database.
+    """
+
+    columns = ["URL", "STATUS", "UPLOADED", "DATETIME", "FILE_NAMES", "HASHES"]
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            file_name, timeout=60, check_same_thread=False
+        )
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS actas (
+                    url TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    uploaded INTEGER NOT NULL,
+                    datetime TEXT,
+                    file_names TEXT NOT NULL,
+                    hashes TEXT NOT NULL
+                )
+                """)
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS actas_status ON actas (status)"
+            )
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    start_datetime TEXT NOT NULL,
+                    end_datetime TEXT,
+                    total INTEGER,
+                    downloaded INTEGER,
+                    uploaded INTEGER,
+                    not_found INTEGER,
+                    forbidden INTEGER,
+                    error INTEGER
+                )
+                """)
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS run_statistics (
+                    run_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    value INTEGER NOT NULL,
+                    PRIMARY KEY (run_id, name)
+                )
+                """)
+
+    def upsert_many(self, rows):
+        """
+        Insert or update the actas, an acta keeps its position when it is updated.
+
+        Args:
+            rows (list): The rows with the DataSources columns.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                """
+                INSERT INTO actas VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    status = excluded.status,
+                    uploaded = excluded.uploaded,
+                    datetime = excluded.datetime,
+                    file_names = excluded.file_names,
+                    hashes = excluded.hashes
+                """,
+                (
+                    (url, status, bool(uploaded), datetime, file_names, hashes)
+                    for url, status, uploaded, datetime, file_names, hashes in rows
+                ),
+            )
+
+    def upsert(self, row):
+        """Insert or update an acta, see upsert_many."""
+        self.upsert_many([row])
+
+    def rows(self):
+        """
+        Get every acta in the order they were added.
+
+        Returns:
+            list: The rows with the DataSources columns.
+        """
+        with self._lock:
+            return [
+                (url, status, bool(uploaded), datetime, file_names, hashes)
+                for url, status, uploaded, datetime, file_names, hashes in (
+                    self._connection.execute(
+                        "SELECT url, status, uploaded, datetime, file_names, hashes "
+                        "FROM actas ORDER BY rowid"
+                    )
+                )
+            ]
+
+    def status_counts(self):
+        """
+        Count the actas by status.
+
+        Returns:
+            dict: The total of actas of each status.
+        """
+        with self._lock:
+            return dict(
+                self._connection.execute(
+                    "SELECT status, COUNT(*) FROM actas GROUP BY status"
+                )
+            )
+
+    def uploaded_count(self):
+        """Count the actas uploaded."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM actas WHERE uploaded"
+            ).fetchone()[0]
+
+    def start_run(self, start):
+        """
+        Add a run to the history.
+
+        Args:
+            start (str): The isoformat datetime of the start of the run.
+
+        Returns:
+            int: The id of the run.
+        """
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "INSERT INTO runs (start_datetime) VALUES (?)", (start,)
+            ).lastrowid
+
+    def end_run(self, run_id, end, statistics=None):
+        """
+        Save the end and the totals of a run.
+
+        Args:
+            run_id (int): The id of the run.
+            end (str): The isoformat datetime of the end of the run.
+            statistics (dict): The RunStatistics of the run, by default the totals
+            are counted from the actas table.
+        """
+        if statistics:
+            counts = {
+                status: statistics.get(status.upper(), 0)
+                for status in ["downloaded", "not_found", "forbidden", "error"]
+            }
+            counts["total"] = statistics.get("TOTAL", 0)
+            uploaded = statistics.get("UPLOADED", 0)
+        else:
+            counts = self.status_counts()
+            counts["total"] = sum(counts.values())
+            uploaded = self.uploaded_count()
+        with self._lock, self._connection:
+            if statistics:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO run_statistics VALUES (?, ?, ?)",
+                    ((run_id, name, value) for name, value in statistics.items()),
+                )
+            self._connection.execute(
+                """
+                UPDATE runs SET
+                    end_datetime = ?, total = ?, downloaded = ?, uploaded = ?,
+                    not_found = ?, forbidden = ?, error = ?
+                WHERE id = ?
+                """,
+                (
+                    end,
+                    counts["total"],
+                    counts.get("downloaded", 0),
+                    uploaded,
+                    counts.get("not_found", 0),
+                    counts.get("forbidden", 0),
+                    counts.get("error", 0),
+                    run_id,
+                ),
+            )
+
+    def run_statistics(self, run_id):
+        """
+        Get the statistics of a run.
+
+        Args:
+            run_id (int): The id of the run.
+
+        Returns:
+            dict: The statistics by name.
+        """
+        with self._lock:
+            return dict(
+                self._connection.execute(
+                    "SELECT name, value FROM run_statistics WHERE run_id = ?",
+                    (run_id,),
+                )
+            )
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM actas").fetchone()[0]
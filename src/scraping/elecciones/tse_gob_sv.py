@@ -4,10 +4,13 @@ import sys
 import tempfile
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, timezone
 from enum import Enum
 from multiprocessing import Pool
 from pathlib import Path
+from urllib.parse import urlsplit
 
 import boto3
 import numpy as np
@@ -16,13 +19,42 @@ import pendulum
 import pygame
 import requests
 import sounddevice as sd
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError, PartialCredentialsError
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 from gtts import gTTS
 from loguru import logger
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 
+import metrics
+from acta_table import (
+    COLUMNS,
+    STATUS_CODES,
+    STATUS_VALUE_CODES,
+    STATUS_VALUES,
+    Acta,
+    ActaStatus,
+    ActaTable,
+)
+from adaptive_limiter import AdaptiveLimiter
+from dashboard_cache import DashboardCache
+from digest_set import DigestSet
+from pipeline import Pipeline
+from repoll_scheduler import RepollScheduler
+from retry_policy import CircuitBreaker, RetryPolicy
+from run_statistics import RunStatistics
+from state_store import StateStore
+
+sys.path.append(f"{Path().resolve()}/src/aws")
+from awsarrow import import_pyarrow  # noqa: E402
+from awsinventory import S3_INVENTORY_FILE, S3Inventory  # noqa: E402
+from awstransfer import S3Transfer  # noqa: E402
+
+sys.path.append(f"{Path().resolve()}/src/scraping")
+from dirwatch import PARTIAL_SUFFIX, remove_partial_files  # noqa: E402
+
 # Load .env variables
 _ = load_dotenv(dotenv_path=f"{Path().resolve()}/src/.env")
 
@@ -38,174 +70,188 @@ logger.add(
 # Bucket Name
 BUCKET_NAME = os.getenv("BUCKET_NAME", None)
 
-# AWS Session
-AWS_SESSION = boto3.Session(
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID", None),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY", None),
-    region_name=os.getenv("AWS_DEFAULT_REGION", None),
-)
+# Resources of the worker process, see init_worker
+WORKER_PID = None
+HTTP_SESSION = None
+S3_CLIENT = None
+S3_TRANSFER = None
+S3_INVENTORY = None
+ADAPTIVE_LIMITER = None
+DASHBOARD_CACHE = None
+DIGEST_SET = None
+STATE_STORE = None
+WORKER_CONFIG = {}
 
-# Client S3
-S3_CLIENT = AWS_SESSION.client("s3")
+# Dashboard pages cache, revalidated with conditional GET requests on each run
+DASHBOARD_CACHE_FILE = "src/data/dashboard_cache.db"
 
+# Digests of the contents already stored, in any directory and any run
+DIGEST_SET_FILE = "src/data/digests.bin"
+DIGEST_SET_DIRECTORIES = ["src/data/0_raw", "src/data/1_uploaded"]
 
-class ActaStatus(Enum):
-    PENDING = "pending"
-    DOWNLOADED = "downloaded"
-    NOT_FOUND = "not_found"
-    FORBIDDEN = "forbidden"
-    ERROR = "error"
+# History of the statistics of the marzo runs
+STATISTICS_FILE = "src/data/statistics_marzo.csv"
 
-    def get_status(self, value):
-        for status in ActaStatus:
-            if status.value == value:
-                return status
+# Uploads in flight of each process, the files of many actas share them
+UPLOAD_WORKERS = 8
 
+# HTTP Headers for the TSE requests
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.3"  # noqa: E501
+}
 
-class ActaURL(Enum):
-    ALCALDE = "https://divulgacion.tse.gob.sv/actas/ALCALDE"
-    DIP_PARLACEN = "https://divulgacion.tse.gob.sv/actas/DIP_PARLACEN"
+# Chunk size to stream the acta files
+STREAM_CHUNK_SIZE = 64 * 1024
 
+# Concurrency limit per host, the limit is shared by every thread of a process
+MAX_PER_HOST = 16
+HOST_LIMITS = {}
+HOST_SEMAPHORES = {}
+HOST_SEMAPHORES_LOCK = threading.Lock()
 
-class Acta:
+# Requests per second per host, evenly spaced, None doesn't pace the requests
+REQUEST_RATE = None
+HOST_NEXT_REQUEST = {}
 
-    def __init__(
-        self,
-        url,
-        status=ActaStatus.PENDING,
-        uploaded=False,
-        datetime=None,
-        file_names=[],
-        hashes=[],
-    ):
-        self.__url = url
-        self.__status = status
-        self.__uploaded = uploaded
-        self.__datetime = datetime
-        self.__file_names = file_names
-        self.__hashes = hashes
-
-    # Getters and Setters
-    @property
-    def url(self):
-        return self.__url
+# Connect and read timeouts of the TSE requests, in seconds
+REQUEST_TIMEOUT = (10, 60)
 
-    @url.setter
-    def url(self, url):
-        self.__url = url
+# Retries of the transient failures and circuit breakers of the hosts
+RETRY_POLICY = RetryPolicy()
+CIRCUIT_BREAKERS = {}
+CIRCUIT_BREAKERS_LOCK = threading.Lock()
 
-    @property
-    def status(self):
-        return self.__status
 
-    @status.setter
-    def status(self, status):
-        self.__status = status
+class ActaURL(Enum):
+    ALCALDE = "https://divulgacion.tse.gob.sv/actas/ALCALDE"
+    DIP_PARLACEN = "https://divulgacion.tse.gob.sv/actas/DIP_PARLACEN"
 
-    @property
-    def uploaded(self):
-        return self.__uploaded
 
-    @uploaded.setter
-    def uploaded(self, uploaded):
-        self.__uploaded = uploaded
+# Hosts of the TSE requests
+TSE_HOSTS = sorted({urlsplit(acta_url.value).hostname for acta_url in ActaURL})
 
-    @property
-    def datetime(self):
-        return self.__datetime
 
-    @datetime.setter
-    def datetime(self, datetime):
-        self.__datetime = datetime
+class DataSources:
 
-    @property
-    def file_names(self):
-        return self.__file_names
+    columns = COLUMNS
 
-    @file_names.setter
-    def file_names(self, file_names):
-        self.__file_names = file_names
+    def __init__(self):
+        self._table = ActaTable.empty()
+        self._added = []
 
     @property
-    def hashes(self):
-        return self.__hashes
-
-    @hashes.setter
-    def hashes(self, hashes):
-        self.__hashes = hashes
-
-    def __str__(self):
-        return f"URL: {self.url}, STATUS: {self.status}, UPLOADED: {self.uploaded}, DATETIME: {self.datetime}, FILE_NAMES: {self.file_names}, HASHES: {self.hashes}"  # noqa: E501
-
-    def __repr__(self):
-        return f"{self.url}, {self.status}, {self.uploaded}, {self.datetime}, {self.file_names}, {self.hashes}"  # noqa: E501
+    def table(self):
+        # Add the actas of add_acta to the table
+        if self._added:
+            self._table = self._table.concat(ActaTable.from_actas(self._added))
+            self._added = []
+        return self._table
+
+    @table.setter
+    def table(self, table):
+        self._table = table
+        self._added = []
 
+    @property
+    def actas(self):
+        return list(self.table)
 
-class DataSources:
-
-    columns = ["URL", "STATUS", "UPLOADED", "DATETIME", "FILE_NAMES", "HASHES"]
-
-    def __init__(self):
-        self.actas = []
+    @actas.setter
+    def actas(self, actas):
+        self.table = ActaTable.from_actas(actas)
 
     def add_acta(self, acta):
-        self.actas.append(acta)
+        self._added.append(acta)
 
     @logger.catch
     def to_df(self):
-        return pd.DataFrame(
-            [
-                [
-                    acta.url,
-                    acta.status.value,
-                    acta.uploaded,
-                    acta.datetime,
-                    " ".join(acta.file_names),
-                    " ".join(acta.hashes),
-                ]
-                for acta in self.actas
-            ],
-            columns=DataSources.columns,
-        )
+        return self.table.to_df()
 
     @logger.catch
     def save(self, file_name):
         logger.info(f"Saving {file_name} ...")
-        self.to_df().to_csv(file_name, index=False)
+        if file_name.endswith((".arrow", ".parquet")):
+            self.save_arrow(file_name)
+        else:
+            self.to_df().to_csv(file_name, index=False)
         logger.info(f"{file_name} saved, OK")
 
+    def save_arrow(self, file_name):
+        """
+        Save an Arrow IPC (.arrow) or Parquet (.parquet) snapshot, the file names
+        and the digests are list columns.
+        """
+        pa, pq = import_pyarrow()
+        table = self.table.to_arrow()
+        if file_name.endswith(".parquet"):
+            pq.write_table(table, file_name)
+        else:
+            with pa.OSFile(file_name, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
     def load(self, file_name):
         logger.info(f"Loading {file_name} ...")
+        if file_name.endswith((".arrow", ".parquet")):
+            self.load_arrow(file_name)
+            logger.info(f"{file_name} loaded, OK")
+            return
         df = pd.read_csv(file_name, usecols=DataSources.columns)
-        self.actas = [
-            Acta(
-                url=row["URL"],
-                status=next(
-                    (status for status in ActaStatus if status.value == row["STATUS"]),
-                    ActaStatus.ERROR,
-                ),
-                uploaded=row["UPLOADED"],
-                datetime=row["DATETIME"],
-                file_names=(
-                    row["FILE_NAMES"].split(" ")
-                    if isinstance(row["FILE_NAMES"], str)
-                    else []
-                ),
-                hashes=(
-                    row["HASHES"].split(" ")
-                    if isinstance(row["FILE_NAMES"], str)
-                    else []
-                ),
-            )
-            for _, row in df.iterrows()
-        ]
+        self.table = ActaTable.from_columns(
+            df["URL"],
+            df["STATUS"],
+            df["UPLOADED"],
+            df["DATETIME"],
+            df["FILE_NAMES"],
+            df["HASHES"].where(df["FILE_NAMES"].notna()),
+        )
         logger.info(f"{file_name} loaded, OK")
 
+    def load_arrow(self, file_name):
+        """
+        Load an Arrow IPC (.arrow) or Parquet (.parquet) snapshot, the files are
+        memory-mapped, the .arrow columns are not parsed or copied.
+        """
+        pa, pq = import_pyarrow()
+        if file_name.endswith(".parquet"):
+            table = pq.read_table(file_name, memory_map=True)
+        else:
+            # The buffers of the table keep the mapping open
+            table = pa.ipc.open_file(pa.memory_map(file_name, "r")).read_all()
+        self.table = ActaTable.from_arrow(table)
+
+    @logger.catch
+    def save_db(self, state_store):
+        logger.info(f"Saving {state_store.file_name} ...")
+        table = self.table
+        state_store.upsert_many(
+            zip(
+                table.url,
+                STATUS_VALUES[table.status],
+                table.uploaded,
+                table.datetime,
+                table.joined_file_names(),
+                table.joined_hashes(),
+            )
+        )
+        logger.info(f"{state_store.file_name} saved, OK")
+
+    def load_db(self, state_store):
+        logger.info(f"Loading {state_store.file_name} ...")
+        rows = state_store.rows()
+        self.table = ActaTable.from_columns(
+            *(zip(*rows) if rows else [[]] * len(DataSources.columns))
+        )
+        logger.info(f"{state_store.file_name} loaded, OK")
+
+    def __len__(self):
+        return len(self.table)
+
     def __str__(self):
-        return f"Total Actas: {len(self.actas)}"
+        return f"Total Actas: {len(self)}"
 
     def __repr__(self):
-        return f"Total Actas: {len(self.actas)}"
+        return f"Total Actas: {len(self)}"
 
 
 # Progress percentage upload to S3
@@ -262,6 +308,427 @@ def text_to_speech(message, language="es"):
     os.remove(archivo_temporal.name)
 
 
+# Initialize the resources of the worker process
+def init_worker(
+    pool_maxsize=10,
+    dashboard_cache_file=DASHBOARD_CACHE_FILE,
+    state_db=None,
+    metrics_queue=None,
+    upload_workers=UPLOAD_WORKERS,
+    upload_progress=False,
+    s3_inventory_file=None,
+    adaptive_limiter=None,
+    circuit_breakers=None,
+):
+    """
+    Create the keep-alive HTTP session, the S3 client and its transfer pool, the
+    dashboard cache connection, the digest set and the state store connection of the
+    current process, dashboard_cache_file=None disables the cache and state_db=None
+    the state store. The metrics of the process are sent to the metrics_queue of the
+    orchestrator. upload_progress prints the progress of each upload to stdout and
+    the files in the s3_inventory_file are not uploaded again. The TSE requests of
+    every process wait for the shared adaptive_limiter, None doesn't limit them, and
+    the shared circuit_breakers of the hosts, by default each process has its own.
+
+    It is the initializer of the Pool workers, each process gets its own resources
+    instead of the ones inherited through fork from the parent process.
+    """
+    global WORKER_PID, WORKER_CONFIG, HTTP_SESSION, S3_CLIENT, S3_TRANSFER
+    global S3_INVENTORY, ADAPTIVE_LIMITER
+    global DASHBOARD_CACHE, DIGEST_SET, STATE_STORE
+
+    config = {
+        "pool_maxsize": pool_maxsize,
+        "dashboard_cache_file": dashboard_cache_file,
+        "state_db": state_db,
+        "metrics_queue": metrics_queue,
+        "upload_workers": upload_workers,
+        "upload_progress": upload_progress,
+        "s3_inventory_file": s3_inventory_file,
+        "adaptive_limiter": adaptive_limiter,
+        "circuit_breakers": circuit_breakers,
+    }
+    # A long running process keeps its warm connections between runs
+    if WORKER_PID == os.getpid() and WORKER_CONFIG == config:
+        return
+
+    # HTTP Session with a connection pool, the connections are reused between actas
+    HTTP_SESSION = requests.Session()
+    HTTP_SESSION.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    HTTP_SESSION.mount("https://", adapter)
+    HTTP_SESSION.mount("http://", adapter)
+
+    # boto3 sessions are not thread or fork safe, one session per process
+    aws_session = boto3.Session(
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID", None),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY", None),
+        region_name=os.getenv("AWS_DEFAULT_REGION", None),
+    )
+    S3_CLIENT = aws_session.client(
+        "s3", config=Config(max_pool_connections=max(pool_maxsize, upload_workers))
+    )
+    S3_INVENTORY = S3Inventory(s3_inventory_file) if s3_inventory_file else None
+    S3_TRANSFER = S3Transfer(
+        S3_CLIENT,
+        BUCKET_NAME,
+        max_workers=upload_workers,
+        progress=ProgressPercentageUploadToS3 if upload_progress else None,
+        on_upload=lambda object_name, size, seconds: metrics.observe(
+            "s3_upload_seconds", seconds
+        ),
+        inventory=S3_INVENTORY,
+        on_skip=lambda object_name: metrics.inc("s3_upload_skipped_total"),
+    )
+
+    # SQLite connections can't be shared between processes
+    DASHBOARD_CACHE = (
+        DashboardCache(dashboard_cache_file) if dashboard_cache_file else None
+    )
+    STATE_STORE = StateStore(state_db) if state_db else None
+
+    # The memory mapping and the log file descriptor are per process
+    DIGEST_SET = DigestSet(DIGEST_SET_FILE)
+
+    # The limit and the circuits are in shared memory, every process updates them
+    ADAPTIVE_LIMITER = adaptive_limiter
+    with CIRCUIT_BREAKERS_LOCK:
+        CIRCUIT_BREAKERS.update(circuit_breakers or {})
+
+    # The metrics of a worker are added to the registry of the orchestrator
+    if metrics_queue is not None:
+        metrics.set_queue(metrics_queue)
+
+    # The resources are created again with the same config after a fork
+    WORKER_CONFIG = config
+    WORKER_PID = os.getpid()
+
+
+# Initialize the resources if they were not created by the current process
+def ensure_worker():
+    if WORKER_PID != os.getpid():
+        init_worker(**WORKER_CONFIG)
+
+
+# Get the S3 transfer pool of the current process
+def get_s3_transfer():
+    ensure_worker()
+    return S3_TRANSFER
+
+
+# Get the HTTP session of the current process
+def get_http_session():
+    ensure_worker()
+    return HTTP_SESSION
+
+
+# Get the S3 client of the current process
+def get_s3_client():
+    ensure_worker()
+    return S3_CLIENT
+
+
+# Get the dashboard cache of the current process
+def get_dashboard_cache():
+    ensure_worker()
+    return DASHBOARD_CACHE
+
+
+# Get the digest set of the current process
+def get_digest_set():
+    ensure_worker()
+    return DIGEST_SET
+
+
+# Get the state store of the current process
+def get_state_store():
+    ensure_worker()
+    return STATE_STORE
+
+
+# Set the concurrency limits and the request rate per host
+def set_host_limits(max_per_host=MAX_PER_HOST, host_limits=None, request_rate=None):
+    global MAX_PER_HOST, HOST_LIMITS, REQUEST_RATE
+    with HOST_SEMAPHORES_LOCK:
+        MAX_PER_HOST = max_per_host
+        HOST_LIMITS = dict(host_limits or {})
+        REQUEST_RATE = request_rate
+        # The semaphores are created again with the new limits
+        HOST_SEMAPHORES.clear()
+        HOST_NEXT_REQUEST.clear()
+
+
+# Wait for the next request slot of the host, one every 1 / REQUEST_RATE seconds
+def pace(host):
+    with HOST_SEMAPHORES_LOCK:
+        if REQUEST_RATE is None:
+            return
+        now = time.monotonic()
+        slot = max(now, HOST_NEXT_REQUEST.get(host, now))
+        HOST_NEXT_REQUEST[host] = slot + 1 / REQUEST_RATE
+    if slot > now:
+        time.sleep(slot - now)
+
+
+# Hold a concurrency slot of the host while the block is running
+# The request waits for its pace before taking the slot, a paced request doesn't keep
+# a slot of the host or of the adaptive limit idle
+@contextmanager
+def host_slot(host):
+    with HOST_SEMAPHORES_LOCK:
+        semaphore = HOST_SEMAPHORES.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(HOST_LIMITS.get(host, MAX_PER_HOST))
+            HOST_SEMAPHORES[host] = semaphore
+    limiter = ADAPTIVE_LIMITER
+    pace(host)
+    with semaphore, limiter.slot() if limiter is not None else nullcontext():
+        yield
+
+
+# Update the adaptive limit with the status code and latency of a TSE response
+def record_response(status_code, seconds):
+    limiter = ADAPTIVE_LIMITER
+    if limiter is not None and limiter.record(status_code, seconds):
+        metrics.inc("throttled_total", labels={"code": str(status_code)})
+
+
+# Get the circuit breaker of the host, created by the first request to the host
+def get_circuit_breaker(host):
+    with CIRCUIT_BREAKERS_LOCK:
+        breaker = CIRCUIT_BREAKERS.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker()
+            CIRCUIT_BREAKERS[host] = breaker
+        return breaker
+
+
+# Send a TSE request, retrying the transient failures with jittered backoff
+# The retries wait outside of the host slot, the circuit of the host pauses every
+# request to the host while it is open
+def send_with_retries(url, send, get_status_code):
+    host = urlsplit(url).hostname
+    breaker = get_circuit_breaker(host)
+    RETRY_POLICY.record_request()
+    attempt = 1
+    while True:
+        breaker.wait()
+        error, result = None, None
+        try:
+            result = send()
+        except Exception as e:
+            error = e
+        reason = RetryPolicy.classify(
+            error, get_status_code(result) if error is None else None
+        )
+        if reason is None:
+            # The host answered, a permanent error is not retried
+            breaker.record_success()
+            if error is not None:
+                raise error
+            return result
+        if breaker.record_failure():
+            logger.warning(f"Circuit open for {host}: {error or reason}")
+            metrics.inc("circuit_open_total", labels={"host": host})
+        if not RETRY_POLICY.allow(attempt):
+            if error is not None:
+                raise error
+            return result
+        metrics.inc("retries_total", labels={"reason": reason})
+        # The response of a failed attempt is not used
+        if hasattr(result, "close"):
+            result.close()
+        time.sleep(RETRY_POLICY.backoff(attempt))
+        attempt += 1
+
+
+# HTTP GET request limited by the concurrency of the host, with retries
+def http_get(url, **kwargs):
+    return send_with_retries(
+        url,
+        lambda: http_get_once(url, **kwargs),
+        lambda response: response.status_code,
+    )
+
+
+# HTTP GET request limited by the concurrency of the host
+def http_get_once(url, **kwargs):
+    kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+    with host_slot(urlsplit(url).hostname):
+        # The latency of the request only, the waits for the pace and the slot are over
+        start = time.perf_counter()
+        try:
+            response = get_http_session().get(url, **kwargs)
+        except requests.exceptions.RequestException:
+            record_response(None, time.perf_counter() - start)
+            raise
+        record_response(response.status_code, time.perf_counter() - start)
+        return response
+
+
+# Download a file of the acta, streaming it to the raw folder while it is hashed
+def download_acta_file(url, acta_datetime):
+    """
+    Download a file of the acta and save it as src/data/0_raw/<hash>.jpeg
+
+    The body is written in chunks to a hidden temporary file in the raw folder while
+    the SHA-256 is updated, then the file is renamed atomically to its final name, or
+    to src/data/0_duplicates/<hash>_<datetime>.jpeg if the content was already stored
+    according to the digest set.
+
+    Returns:
+        tuple: The status code and the file hash, None if the body is empty.
+    """
+    status_code, temp_path, digest = fetch_acta_file(url)
+    if temp_path is None:
+        return status_code, None
+    return status_code, persist_acta_file(temp_path, digest, acta_datetime)
+
+
+# Download a file of the acta to a temporary file while it is hashed, with retries
+def fetch_acta_file(url):
+    """
+    Returns:
+        tuple: The status code, the path of the temporary file and the SHA-256 digest,
+        the path and the digest are None if the status is not 200 or the body is empty.
+    """
+    return send_with_retries(
+        url, lambda: fetch_acta_file_once(url), lambda result: result[0]
+    )
+
+
+# Download a file of the acta to a temporary file while it is hashed
+def fetch_acta_file_once(url):
+    with host_slot(urlsplit(url).hostname):
+        # The latency of the request only, the waits for the pace and the slot are over
+        start = time.perf_counter()
+        try:
+            response = get_http_session().get(url, stream=True, timeout=REQUEST_TIMEOUT)
+        except requests.exceptions.RequestException:
+            record_response(None, time.perf_counter() - start)
+            raise
+        record_response(response.status_code, time.perf_counter() - start)
+        with response:
+            if response.status_code != 200:
+                return response.status_code, None, None
+
+            sha256 = hashlib.sha256()
+            size = 0
+            hash_seconds = 0.0
+            fd, temp_path = tempfile.mkstemp(
+                prefix=".", suffix=PARTIAL_SUFFIX, dir="src/data/0_raw"
+            )
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                        hash_start = time.perf_counter()
+                        sha256.update(chunk)
+                        hash_seconds += time.perf_counter() - hash_start
+                        f.write(chunk)
+                        size += len(chunk)
+                metrics.observe("image_fetch_seconds", time.perf_counter() - start)
+                metrics.observe("hash_seconds", hash_seconds)
+                metrics.inc("downloaded_bytes_total", size)
+            except BaseException:
+                # Never leave a half written file
+                os.remove(temp_path)
+                raise
+
+            # If the response content is empty
+            if size == 0:
+                os.remove(temp_path)
+                return response.status_code, None, None
+            return response.status_code, temp_path, sha256.digest()
+
+
+# Rename a fetched file to its final name in the raw or the duplicates folder
+def persist_acta_file(temp_path, digest, acta_datetime):
+    file_hash = digest.hex()
+    try:
+        digest_set = get_digest_set()
+        # If the content was already stored
+        if digest in digest_set:
+            os.replace(
+                temp_path,
+                f"src/data/0_duplicates/{file_hash}_{acta_datetime}.jpeg",
+            )
+        else:
+            os.replace(temp_path, f"src/data/0_raw/{file_hash}.jpeg")
+            digest_set.add(digest)
+    except BaseException:
+        # Never leave a half written file
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return file_hash
+
+
+# Get the dashboard type of the URL, None if the URL is not a dashboard
+def get_dashboard_type(url_dashboard):
+    # Check the URL Dashboard Type
+    if url_dashboard.find("-4.html") != -1:
+        # ALCALDE
+        return ActaURL.ALCALDE.value
+    if url_dashboard.find("-2.html") != -1:
+        # DIP PARLACEN
+        return ActaURL.DIP_PARLACEN.value
+    # URL Type not found
+    logger.error(f"URL Dashboard Type not found: {url_dashboard}")
+    return None
+
+
+# Set the hashes, the file names and the status of the acta from its file downloads
+# The acta is only downloaded when every file is downloaded, otherwise the status is
+# the most severe status of its files: FORBIDDEN, ERROR and then NOT_FOUND
+def record_acta_files(acta, results):
+    # List of hashes and file names of the acta
+    hashes = []
+    file_names = []
+    statuses = set()
+
+    # For each status code and file hash
+    for status_code, file_hash in results:
+        # If the status code is 200
+        if status_code == 200:
+            # If the response content is not empty
+            if file_hash:
+                hashes.append(file_hash)
+                # Append the file name to the list
+                file_names.append(f"{file_hash}.jpeg")
+            else:
+                statuses.add(ActaStatus.NOT_FOUND)
+        # If the status code is 404
+        elif status_code == 404:
+            statuses.add(ActaStatus.NOT_FOUND)
+        # If the status code is 403 or 429, the TSE is throttling the requests
+        elif status_code in (403, 429):
+            statuses.add(ActaStatus.FORBIDDEN)
+        # If the status code is different to 200, 404, 403 or 429
+        else:
+            statuses.add(ActaStatus.ERROR)
+    acta.hashes = hashes
+    acta.file_names = file_names
+    for status in (ActaStatus.FORBIDDEN, ActaStatus.ERROR, ActaStatus.NOT_FOUND):
+        if status in statuses:
+            acta.status = status
+            return acta
+    # Acta Downloaded
+    acta.status = ActaStatus.DOWNLOADED
+    return acta
+
+
+# Get the status of an acta from the error of its requests
+def get_error_status(error):
+    # A forbidden dashboard is requeued, the TSE is throttling the requests
+    if (
+        isinstance(error, requests.exceptions.HTTPError)
+        and error.response is not None
+        and error.response.status_code in (403, 429)
+    ):
+        return ActaStatus.FORBIDDEN
+    return ActaStatus.ERROR
+
+
 # Create function to download the acta
 @logger.catch
 def download_acta(acta):
@@ -273,17 +740,8 @@ def download_acta(acta):
         # URL Dashboard Request
         url_dashboard = acta.url
         # Dashboard Type
-        dashboard_type = None
-        # Check the URL Dashboard Type
-        if url_dashboard.find("-4.html") != -1:
-            # ALCALDE
-            dashboard_type = ActaURL.ALCALDE.value
-        elif url_dashboard.find("-2.html") != -1:
-            # DIP PARLACEN
-            dashboard_type = ActaURL.DIP_PARLACEN.value
-        else:
-            # URL Type not found
-            logger.error(f"URL Dashboard Type not found: {url_dashboard}")
+        dashboard_type = get_dashboard_type(url_dashboard)
+        if dashboard_type is None:
             acta.status = ActaStatus.ERROR
             return acta
 
@@ -295,58 +753,14 @@ def download_acta(acta):
             acta.status = ActaStatus.NOT_FOUND
             return acta
 
-        # List of hashes and file names of the acta
-        hashes = []
-        file_names = []
-
-        # For each file name
-        for dashboard_file_name in dashboard_file_names:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.3"  # noqa: E501
-            }
-            response = requests.get(
-                f"{dashboard_type}/{dashboard_file_name}", headers=headers
-            )
-            # If the status code is 200
-            if response.status_code == 200:
-                # If the response content is not empty
-                if response.content:
-                    file_hash = hashlib.sha256(response.content).hexdigest()
-                    hashes.append(file_hash)
-                    file_name = f"{file_hash}.jpeg"
-                    # If the file does exist
-                    if os.path.exists(f"src/data/0_raw/{file_name}"):
-                        duplicated_file_name = f"{file_hash}_{acta.datetime}.jpeg"
-                        # Save the acta file in the raw folder
-                        with open(
-                            f"src/data/0_duplicates/{duplicated_file_name}", "wb"
-                        ) as f:
-                            f.write(response.content)
-                    else:
-                        # Save the acta file in the raw folder
-                        with open(f"src/data/0_raw/{file_name}", "wb") as f:
-                            f.write(response.content)
-                    # Append the file name to the list
-                    file_names.append(file_name)
-                else:
-                    acta.status = ActaStatus.NOT_FOUND
-            # If the status code is 404
-            elif response.status_code == 404:
-                acta.status = ActaStatus.NOT_FOUND
-            # If the status code is 403
-            elif response.status_code == 403:
-                acta.status = ActaStatus.FORBIDDEN
-            # If the status code is different to 200, 404 or 403
-            else:
-                acta.status = ActaStatus.ERROR
-        # Acta Downloaded
-        acta.hashes = hashes
-        acta.file_names = file_names
-        acta.status = ActaStatus.DOWNLOADED
-        # Upload the acta file to the S3 bucket
-        acta = upload_acta_to_s3(acta)
-    except Exception:
-        acta.status = ActaStatus.ERROR
+        # Download each file of the dashboard
+        results = [
+            download_acta_file(f"{dashboard_type}/{dashboard_file_name}", acta.datetime)
+            for dashboard_file_name in dashboard_file_names
+        ]
+        record_acta_files(acta, results)
+    except Exception as e:
+        acta.status = get_error_status(e)
     # logger.info(f"Acta: {acta}")
     # Return the acta
     return acta
@@ -357,17 +771,15 @@ def download_acta(acta):
 def upload_acta_to_s3(acta):
     try:
         acta.uploaded = False
-        # For each file name
-        for file_name in acta.file_names:
-            # logger.info(f"Uploading {file_name} to S3 ...")
-            # Upload the acta file to the S3 bucket
-            S3_CLIENT.upload_file(
-                f"src/data/0_raw/{file_name}",
-                BUCKET_NAME,
-                file_name,
-                Callback=ProgressPercentageUploadToS3(f"src/data/0_raw/{file_name}"),
-            )
-            # logger.info(f"{file_name} uploaded to S3, OK")
+        # Upload the files of the acta concurrently
+        errors = get_s3_transfer().upload_files(
+            [
+                (f"src/data/0_raw/{file_name}", file_name)
+                for file_name in get_files_to_upload(acta)
+            ]
+        )
+        if errors:
+            raise errors[0]
         acta.uploaded = True
     except NoCredentialsError as e:
         logger.error(f"NoCredentialsError: No AWS credentials found. {e}")
@@ -383,20 +795,65 @@ def upload_acta_to_s3(acta):
     return acta
 
 
+# Get the file names of the acta that are not uploaded yet
+def get_files_to_upload(acta):
+    # The demon moves the stored files to 1_uploaded once they are uploaded
+    return [
+        file_name
+        for file_name in acta.file_names
+        if os.path.exists(f"src/data/0_raw/{file_name}")
+        or file_name not in get_digest_set()
+    ]
+
+
+# Upload the files of the acta from the transfer pool, without waiting for them
+def submit_acta_upload(acta, on_done):
+    acta.uploaded = False
+
+    def done(errors):
+        for error in errors:
+            logger.error(f"Exception: Error uploading file to S3. {error}")
+        acta.uploaded = not errors
+        on_done(acta)
+
+    get_s3_transfer().upload_many(
+        [
+            (f"src/data/0_raw/{file_name}", file_name)
+            for file_name in get_files_to_upload(acta)
+        ],
+        on_done=done,
+    )
+
+
 # Create function to process the actas
-def process_acta(acta, callback=None):
+# defer_upload submits the uploads to the transfer pool and finishes the acta once
+# they are done, the caller waits for them with get_s3_transfer().wait()
+def process_acta(acta, callback=None, defer_upload=False):
     # If the acta is not downloaded
     if acta.status != ActaStatus.DOWNLOADED:
         # Pedding acta
         acta.status = ActaStatus.PENDING
         # Download the acta
         acta = download_acta(acta)
-    elif acta.status == ActaStatus.DOWNLOADED and not acta.uploaded:
+    if acta.status == ActaStatus.DOWNLOADED and not acta.uploaded:
         # Upload the acta file to the S3 bucket
+        if defer_upload:
+            submit_acta_upload(acta, lambda acta: finish_acta(acta, callback))
+            return acta
         acta = upload_acta_to_s3(acta)
-    # Callback progress
-    callback()
     # Return the acta
+    return finish_acta(acta, callback)
+
+
+# Save the acta as soon as it finishes and report the progress
+def finish_acta(acta, callback=None):
+    state_store = get_state_store()
+    if state_store is not None:
+        state_store.upsert(acta.to_row())
+    metrics.inc("actas_total", labels={"status": acta.status.value})
+    # Callback progress
+    if callback is not None:
+        callback()
     return acta
 
 
@@ -411,54 +868,73 @@ def process_chunk(args):  # -> list:
     def callback(*_):
         pbar.update()
 
-    actas = [process_acta(acta, callback=callback) for acta in chunk]
+    # The uploads of the chunk run while the next actas are downloaded
+    actas = [process_acta(acta, callback=callback, defer_upload=True) for acta in chunk]
+    get_s3_transfer().wait()
 
-    # Save each acta in a dataframe and a file
     # Close the progress bar
     pbar.close()
 
-    # Save each acta in a dataframe and a file
-    pd.DataFrame(
-        [
-            [
-                acta.url,
-                acta.status.value,
-                acta.uploaded,
-                acta.datetime,
-                " ".join(acta.file_names),
-                " ".join(acta.hashes),
-            ]
-            for acta in actas
-        ],
-        columns=DataSources.columns,
-    ).to_csv(f"src/data/chunk_{index}.csv", index=False)
+    # Save each acta in a dataframe and a file, the state store has them already
+    if get_state_store() is None:
+        save_chunk(index, actas)
 
     # Return the actas
     return actas
 
 
+# Save the actas of the chunk in the src/data/chunk_{index}.csv file
+def save_chunk(index, actas):
+    pd.DataFrame([acta.to_row() for acta in actas], columns=DataSources.columns).to_csv(
+        f"src/data/chunk_{index}.csv", index=False
+    )
+
+
 # Create function to process the data sources
 @logger.catch
-def process_data_sources(data_sources, chunk_size=100):
+def process_data_sources(
+    data_sources,
+    chunk_size=100,
+    num_processes=12,
+    dashboard_cache_file=DASHBOARD_CACHE_FILE,
+    state_db=None,
+    metrics_queue=None,
+    s3_inventory_file=None,
+    adaptive_limiter=None,
+    circuit_breakers=None,
+):
     logger.info(f"Chunk Size: {chunk_size}")
 
-    # Chunks of 100 actas
-    chunks = [
-        data_sources.actas[i : i + chunk_size]
-        for i in range(0, len(data_sources.actas), chunk_size)
-    ]
+    # Chunks of 100 actas, the views are sent to the workers as plain actas
+    actas = data_sources.actas
+    chunks = [actas[i : i + chunk_size] for i in range(0, len(actas), chunk_size)]
 
     logger.info(f"Total Chunks: {len(chunks)}")
 
-    # Number of processes
-    num_processes = 12
-
     logger.info(f"Number of Processes: {num_processes}")
 
     # Process each chunk
-    with Pool(num_processes) as pool:
+    # Each worker creates its own HTTP session and S3 client
+    with Pool(
+        num_processes,
+        initializer=init_worker,
+        initargs=(
+            10,
+            dashboard_cache_file,
+            state_db,
+            metrics_queue,
+            UPLOAD_WORKERS,
+            False,
+            s3_inventory_file,
+            adaptive_limiter,
+            circuit_breakers,
+        ),
+    ) as pool:
         # Process each chunk
         results = pool.map(process_chunk, enumerate(chunks))
+        # Let the workers exit and flush their metrics
+        pool.close()
+        pool.join()
 
     # Update the data sources
     data_sources.actas = [acta for chunk in results for acta in chunk]
@@ -467,14 +943,313 @@ def process_data_sources(data_sources, chunk_size=100):
     return data_sources
 
 
+# Create function to process the data sources with the threads engine
+def process_data_sources_threads(
+    data_sources,
+    chunk_size=100,
+    max_concurrency=64,
+    max_per_host=16,
+    host_limits=None,
+    dashboard_cache_file=DASHBOARD_CACHE_FILE,
+    state_db=None,
+    s3_inventory_file=None,
+    request_rate=None,
+    adaptive_limiter=None,
+    circuit_breakers=None,
+):
+    logger.info(f"Chunk Size: {chunk_size}")
+
+    # Chunks of 100 actas, each chunk is still saved in its own file
+    # The threads update plain actas, the table is rebuilt once at the end
+    actas = data_sources.table.to_actas()
+    chunks = [actas[i : i + chunk_size] for i in range(0, len(actas), chunk_size)]
+
+    logger.info(f"Total Chunks: {len(chunks)}")
+    logger.info(f"Max Concurrency: {max_concurrency}, Max Per Host: {max_per_host}")
+
+    # Concurrency limits, global for the actas and per host for each request
+    set_host_limits(max_per_host, host_limits, request_rate)
+
+    # The threads of the engine share the HTTP session and the S3 client
+    # The S3 uploads in flight keep the per host limit
+    init_worker(
+        pool_maxsize=max_concurrency,
+        dashboard_cache_file=dashboard_cache_file,
+        state_db=state_db,
+        upload_workers=max_per_host,
+        s3_inventory_file=s3_inventory_file,
+        adaptive_limiter=adaptive_limiter,
+        circuit_breakers=circuit_breakers,
+    )
+
+    # Progress bar
+    pbar = tqdm(total=len(actas), desc="Processing Actas", ascii="░▒█")
+
+    # Callback function
+    def callback(*_):
+        pbar.update()
+
+    # The actas run in a thread pool sized to the global limit, in the chunks order
+    results = []
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [
+            [executor.submit(process_acta, acta, callback) for acta in chunk]
+            for chunk in chunks
+        ]
+        for index, chunk_futures in enumerate(futures):
+            chunk_actas = [future.result() for future in chunk_futures]
+            # Save each acta in a dataframe and a file, the state store has them already
+            if get_state_store() is None:
+                save_chunk(index, chunk_actas)
+            results.append(chunk_actas)
+
+    # Close the progress bar
+    pbar.close()
+
+    # Update the data sources
+    data_sources.actas = [acta for chunk in results for acta in chunk]
+
+    # Return the data sources
+    return data_sources
+
+
+# Engines of marzo, see marzo
+ENGINES = ("pool", "threads", "pipeline")
+
+# Workers of each stage of the pipeline engine
+STAGE_WORKERS = {"dashboard": 16, "image": 32, "persist": 2, "upload": 16}
+
+
+class ActaJob:
+    """
+    An acta in the pipeline engine, counts the files of the acta still in the image,
+    persist or upload stages.
+
+    Args:
+        acta (Acta): The acta.
+        index (int): The position of the acta in the DataSources.
+    """
+
+    def __init__(self, acta, index):
+        self.acta = acta
+        self.index = index
+        self.results = []
+        self.pending = 0
+        self.failed = False
+        self._lock = threading.Lock()
+
+    def start(self, total):
+        self.pending = total
+        self.failed = False
+
+    def done(self, failed=False):
+        """Count a finished file, True when it was the last file of the acta."""
+        with self._lock:
+            self.failed = self.failed or failed
+            self.pending -= 1
+            return self.pending == 0
+
+
+# Create function to process the data sources with the pipeline engine
+def process_data_sources_pipeline(
+    data_sources,
+    chunk_size=100,
+    stage_workers=None,
+    queue_size=256,
+    max_per_host=16,
+    host_limits=None,
+    dashboard_cache_file=DASHBOARD_CACHE_FILE,
+    state_db=None,
+    s3_inventory_file=None,
+    request_rate=None,
+    adaptive_limiter=None,
+    circuit_breakers=None,
+):
+    """
+    Process the actas in four stages connected by bounded queues: dashboard fetch,
+    image fetch and hash, local persist and S3 upload. Each stage has its own workers
+    (STAGE_WORKERS, stage_workers overrides them), so the TSE downloads don't wait for
+    the S3 uploads and a full queue slows down the stages that feed it.
+    """
+    workers = {**STAGE_WORKERS, **(stage_workers or {})}
+    logger.info(f"Chunk Size: {chunk_size}")
+    logger.info(f"Stage Workers: {workers}, Queue Size: {queue_size}")
+
+    # The threads update plain actas, the table is rebuilt once at the end
+    actas = data_sources.table.to_actas()
+    jobs = [ActaJob(acta, index) for index, acta in enumerate(actas)]
+
+    # Concurrency limits per host for each request
+    set_host_limits(max_per_host, host_limits, request_rate)
+
+    # The threads of the stages share the HTTP session and the S3 client
+    init_worker(
+        pool_maxsize=workers["dashboard"] + workers["image"],
+        dashboard_cache_file=dashboard_cache_file,
+        state_db=state_db,
+        upload_workers=workers["upload"],
+        s3_inventory_file=s3_inventory_file,
+        adaptive_limiter=adaptive_limiter,
+        circuit_breakers=circuit_breakers,
+    )
+    s3_transfer = get_s3_transfer()
+
+    # Progress bar
+    pbar = tqdm(total=len(actas), desc="Processing Actas", ascii="░▒█")
+
+    # Each chunk is still saved in its own file once all its actas finish
+    chunk_pending = {}
+    for job in jobs:
+        chunk = job.index // chunk_size
+        chunk_pending[chunk] = chunk_pending.get(chunk, 0) + 1
+    chunk_lock = threading.Lock()
+
+    def finish(job):
+        finish_acta(job.acta, pbar.update)
+        if get_state_store() is not None:
+            return
+        chunk = job.index // chunk_size
+        with chunk_lock:
+            chunk_pending[chunk] -= 1
+            if chunk_pending[chunk]:
+                return
+        start = chunk * chunk_size
+        save_chunk(chunk, actas[start : start + chunk_size])
+
+    def start_upload(job):
+        job.acta.uploaded = False
+        file_names = get_files_to_upload(job.acta)
+        if not file_names:
+            job.acta.uploaded = True
+            finish(job)
+            return
+        job.start(len(file_names))
+        for file_name in file_names:
+            pipeline.put("upload", (job, file_name))
+
+    def fetch_dashboard(job):
+        acta = job.acta
+        # Downloaded actas only need the upload
+        if acta.status == ActaStatus.DOWNLOADED:
+            start_upload(job)
+            return
+        acta.status = ActaStatus.PENDING
+        acta.datetime = datetime.now(timezone.utc).isoformat(
+            sep="T", timespec="milliseconds"
+        )
+        try:
+            dashboard_type = get_dashboard_type(acta.url)
+            if dashboard_type is None:
+                acta.status = ActaStatus.ERROR
+                finish(job)
+                return
+            dashboard_file_names = get_file_names_from_dashboard(acta.url)
+        except Exception as e:
+            acta.status = get_error_status(e)
+            finish(job)
+            return
+        if not dashboard_file_names:
+            acta.status = ActaStatus.NOT_FOUND
+            finish(job)
+            return
+        job.results = [None] * len(dashboard_file_names)
+        job.start(len(dashboard_file_names))
+        for i, dashboard_file_name in enumerate(dashboard_file_names):
+            pipeline.put("image", (job, i, f"{dashboard_type}/{dashboard_file_name}"))
+
+    def file_done(job, failed=False):
+        if not job.done(failed):
+            return
+        if job.failed:
+            job.acta.status = ActaStatus.ERROR
+            finish(job)
+            return
+        record_acta_files(job.acta, job.results)
+        if job.acta.status != ActaStatus.DOWNLOADED:
+            finish(job)
+            return
+        start_upload(job)
+
+    def fetch_image(item):
+        job, i, url = item
+        try:
+            status_code, temp_path, digest = fetch_acta_file(url)
+        except Exception:
+            file_done(job, failed=True)
+            return
+        if temp_path is None:
+            job.results[i] = (status_code, None)
+            file_done(job)
+            return
+        pipeline.put("persist", (job, i, temp_path, digest))
+
+    def persist_image(item):
+        job, i, temp_path, digest = item
+        try:
+            job.results[i] = (
+                200,
+                persist_acta_file(temp_path, digest, job.acta.datetime),
+            )
+        except Exception:
+            file_done(job, failed=True)
+            return
+        file_done(job)
+
+    def upload_image(item):
+        job, file_name = item
+        try:
+            s3_transfer.upload_file(f"src/data/0_raw/{file_name}", file_name)
+            failed = False
+        except Exception as e:
+            logger.error(f"Exception: Error uploading file to S3. {e}")
+            failed = True
+        if job.done(failed):
+            job.acta.uploaded = not job.failed
+            finish(job)
+
+    pipeline = Pipeline(
+        [
+            ("dashboard", fetch_dashboard, workers["dashboard"]),
+            ("image", fetch_image, workers["image"]),
+            ("persist", persist_image, workers["persist"]),
+            ("upload", upload_image, workers["upload"]),
+        ],
+        queue_size=queue_size,
+    )
+    pipeline.run(jobs)
+
+    # Close the progress bar
+    pbar.close()
+
+    # Update the data sources
+    data_sources.actas = actas
+
+    # Return the data sources
+    return data_sources
+
+
 # Get file names from dashboard
 def get_file_names_from_dashboard(url_dashboard):
     try:
+        # Revalidar la página en caché con una solicitud condicional
+        cache = get_dashboard_cache()
+        entry = cache.get(url_dashboard) if cache is not None else None
+
         # Realizar la solicitud HTTP GET para obtener el contenido HTML de la página
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.3"  # noqa: E501
-        }
-        respuesta = requests.get(url_dashboard, headers=headers)
+        inicio = time.perf_counter()
+        respuesta = http_get(
+            url_dashboard, headers=DashboardCache.conditional_headers(entry)
+        )
+        metrics.observe(
+            "dashboard_fetch_seconds",
+            time.perf_counter() - inicio,
+            labels={"code": str(respuesta.status_code)},
+        )
+
+        # La página no ha cambiado, se usan los nombres de archivo en caché
+        if respuesta.status_code == 304 and entry is not None:
+            return entry["file_names"]
+
         respuesta.raise_for_status()  # Verificar si la solicitud fue exitosa
 
         # Analizar el contenido HTML con BeautifulSoup
@@ -488,6 +1263,15 @@ def get_file_names_from_dashboard(url_dashboard):
         file_names = [enlace["src"].split("/")[-1] for enlace in enlaces_imagenes]
         # logger.info(f"url_dashboard: {url_dashboard}, file_names: {file_names}")
 
+        # Guardar los validadores y los nombres de archivo de la página
+        if cache is not None:
+            cache.put(
+                url_dashboard,
+                respuesta.headers.get("ETag"),
+                respuesta.headers.get("Last-Modified"),
+                file_names,
+            )
+
         # return file_names
         return file_names
 
@@ -523,21 +1307,147 @@ def init_data_sources_dip_parlacen(data_sources, TOTAL=8562, START=1):
     return data_sources
 
 
-def marzo(total=8562, start=1, chunk_size=1000, datasources_file=None, speech=True):
+# Get the adaptive limiter of the process, the limit is kept between the runs
+def get_adaptive_limiter(max_limit):
+    global ADAPTIVE_LIMITER
+    if ADAPTIVE_LIMITER is None or ADAPTIVE_LIMITER.max_limit != max_limit:
+        ADAPTIVE_LIMITER = AdaptiveLimiter(initial=max_limit / 4, max_limit=max_limit)
+    return ADAPTIVE_LIMITER
+
+
+# Build the inventory of the bucket with a paginated listing
+def build_s3_inventory(s3_inventory_file=S3_INVENTORY_FILE):
+    logger.info(f"Building {s3_inventory_file} ...")
+    try:
+        total = S3Inventory.build(
+            s3_inventory_file,
+            boto3.Session(
+                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID", None),
+                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY", None),
+                region_name=os.getenv("AWS_DEFAULT_REGION", None),
+            ).client("s3"),
+            BUCKET_NAME,
+        )
+        logger.info(f"{s3_inventory_file} built with {total} objects, OK")
+        return True
+    except (ClientError, NoCredentialsError, PartialCredentialsError) as e:
+        # Without the inventory every file is uploaded, the next run lists again
+        logger.error(f"Error listing the S3 bucket, no inventory. {e}")
+        return False
+
+
+# Convert the archived CSV snapshots to Parquet or Arrow snapshots
+def convert_snapshots(
+    directory="src/data", pattern="marzo_2*.csv", snapshot_format="parquet"
+):
+    file_names = []
+    for csv_file in sorted(Path(directory).glob(pattern)):
+        file_name = str(csv_file.with_suffix(f".{snapshot_format}"))
+        if os.path.exists(file_name):
+            continue
+        data_sources = DataSources()
+        data_sources.load(str(csv_file))
+        data_sources.save(file_name)
+        file_names.append(file_name)
+    logger.info(f"Total Snapshots Converted: {len(file_names)}")
+    return file_names
+
+
+def marzo(
+    total=8562,
+    start=1,
+    chunk_size=1000,
+    datasources_file=None,
+    speech=True,
+    engine="pool",
+    max_concurrency=64,
+    max_per_host=16,
+    host_limits=None,
+    dashboard_cache_file=DASHBOARD_CACHE_FILE,
+    scheduler_file=None,
+    state_db=None,
+    snapshot_format="csv",
+    statistics_file=STATISTICS_FILE,
+    metrics_port=None,
+    stage_workers=None,
+    queue_size=256,
+    s3_inventory_file=S3_INVENTORY_FILE,
+    request_rate=None,
+    adaptive_limit=True,
+    forbidden_retries=1,
+):
     """
     Elecciones de Diputaciones al Parlamento Centroamericano e integrantes de los Consejos Municipales
+
+    engine: "pool" processes the chunks with a multiprocessing Pool, "threads" processes
+    every acta from a single process with max_concurrency actas in flight and at most
+    max_per_host requests per host (host_limits overrides the limit of specific hosts),
+    "pipeline" splits the dashboard fetch, image fetch, persist and S3 upload in stages
+    with their own workers (stage_workers) connected by queues of queue_size items
+
+    dashboard_cache_file: SQLite cache of the dashboard pages, the pages are revalidated
+    with conditional requests and the unchanged ones are not downloaded or parsed again,
+    None disables the cache
+
+    scheduler_file: CSV history of the RepollScheduler, when it is set only the actas
+    due are processed, in priority order, instead of every acta on each run
+
+    state_db: SQLite state store, when it is set the DataSources is loaded from it,
+    each acta is saved in it as soon as it finishes and the chunk_N.csv and marzo_*.csv
+    snapshots are not written, the runs are recorded in its runs table
+
+    snapshot_format: format of the marzo_*.* snapshot, "csv", "parquet" or "arrow", the
+    Parquet and Arrow snapshots keep the file names and the digests as list columns and
+    are loaded memory-mapped (datasources_file detects the format by its extension)
+
+    statistics_file: CSV history of the RunStatistics, one row per run, each statistic
+    is logged with its change since the previous run
+
+    metrics_port: port of the local metrics endpoint, http://127.0.0.1:<port>/metrics in
+    the Prometheus text format with the latencies, the bytes downloaded and the actas
+    processed by status of every worker, None disables the metrics
+
+    s3_inventory_file: SQLite inventory of the bucket keys, built with a full listing of
+    the bucket while it has no listing of the bucket and updated on every upload, the
+    files already in the bucket are not uploaded again, None disables the inventory
+
+    request_rate: requests per second to each TSE host with the "threads" and "pipeline"
+    engines, the requests are evenly spaced instead of sent in bursts, None doesn't pace
+    the requests
+
+    adaptive_limit: the TSE requests of every worker share an AIMD concurrency limit, up
+    to max_concurrency, that grows with the successful responses and halves with the
+    403, 429, 5xx and slow responses, the limit is kept between the runs of the process
+
+    forbidden_retries: times the FORBIDDEN actas are requeued in the same run, once the
+    adaptive limit slowed down the requests
     """  # noqa: E501
 
+    # An unknown engine never falls back to another engine
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine!r}, expected one of {ENGINES}")
+
     start_datetime = datetime.now(timezone.utc).isoformat(
         sep="T", timespec="milliseconds"
     )
     logger.info(f"Start: {start_datetime}")
     logger.info("Running marzo ...")
 
+    # Remove the downloads left half written by a killed worker, no worker runs yet
+    removed = remove_partial_files("src/data/0_raw")
+    if removed:
+        logger.warning(f"Removed {len(removed)} partial downloads of src/data/0_raw")
+
     # Create a marzo DataSources
     data_sources = DataSources()
 
-    if datasources_file:
+    # Open the state store of the runs
+    state_store = StateStore(state_db) if state_db else None
+
+    if state_store is not None and len(state_store) > 0:
+        data_sources.load_db(state_store)
+        logger.info(f"DataSources loaded from {state_db}, OK")
+    elif datasources_file:
         data_sources.load(datasources_file)
         logger.info(f"DataSources loaded from {datasources_file}, OK")
     else:
@@ -546,52 +1456,153 @@ def marzo(total=8562, start=1, chunk_size=1000, datasources_file=None, speech=Tr
         init_data_sources_alcalde(data_sources, total, start)
         init_data_sources_dip_parlacen(data_sources, total, start)
 
-    # Process the data sources
-    data_sources = process_data_sources(data_sources, chunk_size=chunk_size)
+    # Save the initial DataSources, the workers update each acta
+    if state_store is not None:
+        if len(state_store) == 0:
+            data_sources.save_db(state_store)
+        run_id = state_store.start_run(start_datetime)
+
+    # Build the digest set of the contents already stored
+    if not os.path.exists(DIGEST_SET_FILE):
+        logger.info(f"Building {DIGEST_SET_FILE} ...")
+        DigestSet.build(DIGEST_SET_FILE, DIGEST_SET_DIRECTORIES).close()
+        logger.info(f"{DIGEST_SET_FILE} built, OK")
+
+    # Build the inventory of the objects already in the bucket, an inventory opened by
+    # the uploads only has the files uploaded from this machine
+    if s3_inventory_file and not S3Inventory.is_synced(s3_inventory_file, BUCKET_NAME):
+        if not build_s3_inventory(s3_inventory_file):
+            # The workers would create an empty inventory that is never rebuilt
+            s3_inventory_file = None
+
+    # Select the actas due in this run
+    if scheduler_file:
+        scheduler = RepollScheduler()
+        scheduler.load(scheduler_file)
+        due = scheduler.select(data_sources.actas)
+        logger.info(f"Actas Due: {len(due)} of {len(data_sources)}")
+        due_data_sources = DataSources()
+        due_data_sources.table = data_sources.table.take(due)
+    else:
+        due_data_sources = data_sources
 
-    # Get the total actas
-    total_actas = len(data_sources.actas)
-    logger.info(f"Total Actas: {total_actas}")
+    # Serve the metrics of the workers from this process
+    metrics_queue = None
+    if metrics_port:
+        metrics.REGISTRY.serve(metrics_port)
+        metrics.enable(metrics.REGISTRY)
+        metrics_queue = metrics.REGISTRY.worker_queue()
+        logger.info(f"Metrics: http://127.0.0.1:{metrics_port}/metrics")
 
-    # Count the actas with status downloaded
-    total_actas_downloaded = len(
-        [acta for acta in data_sources.actas if acta.status == ActaStatus.DOWNLOADED]
-    )
-    logger.info(f"Total Actas Downloaded: {total_actas_downloaded}")
+    # The TSE requests of every worker share the adaptive limit and the circuits
+    limiter = get_adaptive_limiter(max_concurrency) if adaptive_limit else None
+    breakers = {host: get_circuit_breaker(host) for host in TSE_HOSTS}
 
-    # Count the actas with status uploaded
-    total_actas_uploaded = len(
-        [acta for acta in data_sources.actas if acta.uploaded is True]
-    )
-    logger.info(f"Total Actas Uploaded: {total_actas_uploaded}")
+    # Process the data sources
+    logger.info(f"Engine: {engine}")
+
+    def process(due_data_sources):
+        if engine == "threads":
+            return process_data_sources_threads(
+                due_data_sources,
+                chunk_size=chunk_size,
+                max_concurrency=max_concurrency,
+                max_per_host=max_per_host,
+                host_limits=host_limits,
+                dashboard_cache_file=dashboard_cache_file,
+                state_db=state_db,
+                s3_inventory_file=s3_inventory_file,
+                request_rate=request_rate,
+                adaptive_limiter=limiter,
+                circuit_breakers=breakers,
+            )
+        elif engine == "pipeline":
+            return process_data_sources_pipeline(
+                due_data_sources,
+                chunk_size=chunk_size,
+                stage_workers=stage_workers,
+                queue_size=queue_size,
+                max_per_host=max_per_host,
+                host_limits=host_limits,
+                dashboard_cache_file=dashboard_cache_file,
+                state_db=state_db,
+                s3_inventory_file=s3_inventory_file,
+                request_rate=request_rate,
+                adaptive_limiter=limiter,
+                circuit_breakers=breakers,
+            )
+        else:
+            return process_data_sources(
+                due_data_sources,
+                chunk_size=chunk_size,
+                dashboard_cache_file=dashboard_cache_file,
+                state_db=state_db,
+                s3_inventory_file=s3_inventory_file,
+                metrics_queue=metrics_queue,
+                adaptive_limiter=limiter,
+                circuit_breakers=breakers,
+            )
 
-    # Count the actas with status not found
-    total_actas_not_found = len(
-        [acta for acta in data_sources.actas if acta.status == ActaStatus.NOT_FOUND]
-    )
-    logger.info(f"Total Actas Not Found: {total_actas_not_found}")
+    due_data_sources = process(due_data_sources)
 
-    # Count the actas with status forbidden
-    total_actas_forbidden = len(
-        [acta for acta in data_sources.actas if acta.status == ActaStatus.FORBIDDEN]
-    )
-    logger.info(f"Total Actas Forbidden: {total_actas_forbidden}")
+    # Requeue the forbidden actas, the adaptive limit slowed down the requests
+    for _ in range(forbidden_retries):
+        forbidden = np.flatnonzero(
+            due_data_sources.table.status == STATUS_VALUE_CODES["forbidden"]
+        )
+        if len(forbidden) == 0:
+            break
+        logger.info(f"Requeue Forbidden Actas: {len(forbidden)}")
+        forbidden_data_sources = DataSources()
+        forbidden_data_sources.table = due_data_sources.table.take(forbidden)
+        forbidden_data_sources = process(forbidden_data_sources)
+        due_data_sources.table.update(
+            forbidden, forbidden_data_sources.table.to_actas()
+        )
 
-    # Count the actas with status error
-    total_actas_error = len(
-        [acta for acta in data_sources.actas if acta.status == ActaStatus.ERROR]
-    )
-    logger.info(f"Total Actas Error: {total_actas_error}")
+    # Merge the digests stored in this run
+    digest_set = DigestSet(DIGEST_SET_FILE)
+    digest_set.merge()
+    logger.info(f"Total Digests Stored: {len(digest_set)}")
+    digest_set.close()
+
+    # Merge the processed actas and update their history
+    if scheduler_file:
+        due_actas = due_data_sources.table.to_actas()
+        data_sources.table.update(due, due_actas)
+        for acta in due_actas:
+            scheduler.observe(acta)
+        scheduler.save(scheduler_file)
+        logger.info(f"Scheduler saved in {scheduler_file}, OK")
+    else:
+        data_sources = due_data_sources
 
-    # From data_sources.to_df() count the total actas with duplicates and status downloaded
-    total_actas_duplicated = (
-        data_sources.to_df()[data_sources.to_df()["STATUS"] == "downloaded"]
-        .duplicated(subset="URL")
-        .sum()
-    )
-    logger.info(
-        f"Total Actas with Duplicates and Downloaded from data_sources.to_df(): {total_actas_duplicated}"  # noqa: E501
+    # Compute every statistic of the run in one pass over the columns
+    table = data_sources.table
+    statistics = RunStatistics([status.value for status in STATUS_CODES])
+    values = statistics.compute(
+        table.url, table.status, table.uploaded, table.file_counts()
     )
+    changes = statistics.diff(RunStatistics.last(statistics_file))
+    elections = tuple(f"{name}_" for name in RunStatistics.elections.values())
+    for name, value in values.items():
+        if not name.startswith(elections):
+            logger.info(f"{name}: {value} ({changes[name]:+d})")
+    # One line per election
+    for election in elections:
+        logger.info(
+            election[:-1]
+            + ": "
+            + ", ".join(
+                f"{name[len(election):]}: {value}"
+                for name, value in values.items()
+                if name.startswith(election)
+            )
+        )
+
+    total_actas = values["TOTAL"]
+    total_files = values["FILES_DOWNLOADED"]
+    total_files_uploaded = values["FILES_UPLOADED"]
 
     logger.info("marzo finished, OK")
     end_datetime = datetime.now(timezone.utc).isoformat(
@@ -600,8 +1611,17 @@ def marzo(total=8562, start=1, chunk_size=1000, datasources_file=None, speech=Tr
     logger.info(f"End: {end_datetime}")
 
     # Save the datasources
-    ds_file_name = f"marzo_{end_datetime}.csv"
-    data_sources.save(f"src/data/{ds_file_name}")
+    if state_store is not None:
+        state_store.end_run(run_id, end_datetime, values)
+        state_store.close()
+        ds_file_name = os.path.basename(state_db)
+    else:
+        ds_file_name = f"marzo_{end_datetime}.{snapshot_format}"
+        data_sources.save(f"src/data/{ds_file_name}")
+
+    # Record the statistics of the run
+    statistics.save(statistics_file, start_datetime, end_datetime)
+    logger.info(f"Statistics saved in {statistics_file}, OK")
 
     # Get dataframe from data_sources.to_df() with duplicates
     # data_sources.to_df()[data_sources.to_df()["STATUS"] == "downloaded"].duplicated(
@@ -609,13 +1629,6 @@ def marzo(total=8562, start=1, chunk_size=1000, datasources_file=None, speech=Tr
     # ).to_csv(f"src/data/duplicated_{ds_file_name}", index=False)
 
     # Total files downloaded
-    total_files = 0
-    total_files_uploaded = 0
-    for acta in data_sources.actas:
-        if acta.status == ActaStatus.DOWNLOADED:
-            total_files += len(acta.file_names)
-        if acta.status == ActaStatus.DOWNLOADED and acta.uploaded:
-            total_files_uploaded += len(acta.file_names)
     logger.info(f"Total Files Downloaded: {total_files}")
     logger.info(f"Total Files Uploaded: {total_files_uploaded}")
 
@@ -634,12 +1647,12 @@ def marzo(total=8562, start=1, chunk_size=1000, datasources_file=None, speech=Tr
         # Speech the message
         # text_to_speech(f"Proceso Terminado {dt_diff}")
         text_to_speech(f"Total Actas: {total_actas}")
-        # text_to_speech(f"Total Actas Descargadas: {total_actas_downloaded}")
-        # text_to_speech(f"Total Actas Cargadas: {total_actas_uploaded}")
-        # text_to_speech(f"Total Actas No Encontradas: {total_actas_not_found}")
-        # text_to_speech(f"Total Actas Prohibidas: {total_actas_forbidden}")
-        # text_to_speech(f"Total Actas con Error: {total_actas_error}")
-        # text_to_speech(f"Total Actas Duplicadas: {total_actas_duplicated}")
+        # text_to_speech(f"Total Actas Descargadas: {values['DOWNLOADED']}")
+        # text_to_speech(f"Total Actas Cargadas: {values['UPLOADED']}")
+        # text_to_speech(f"Total Actas No Encontradas: {values['NOT_FOUND']}")
+        # text_to_speech(f"Total Actas Prohibidas: {values['FORBIDDEN']}")
+        # text_to_speech(f"Total Actas con Error: {values['ERROR']}")
+        # text_to_speech(f"Total Actas Duplicadas: {values['DUPLICATED']}")
         text_to_speech(f"Total Archivos Descargados: {total_files}")
         text_to_speech(f"Total Archivos Cargados: {total_files_uploaded}")
         text_to_speech("Proceso Terminado")
@@ -668,17 +1681,28 @@ if __name__ == "__main__":
     # Total Actas: 8562 ALCALDE, 1 archivo por acta
     # Total Actas: 8562 DI PARLACEN, 4 archivos por acta
     # Total Archivos Estimados: 42810
-    ds_file_name = marzo(total=8562, start=1, chunk_size=500)
+    ds_file_name = marzo(
+        total=8562,
+        start=1,
+        chunk_size=500,
+        scheduler_file="src/data/marzo_scheduler.csv",
+        state_db="src/data/marzo.db",
+        metrics_port=9108,
+    )
     # ds_file_name = "marzo_2024-03-06T16:59:15.865+00:00.csv"
 
     while True:
         text_to_speech("Iniciando Proceso")
+        # The state store keeps the actas between runs
         ds_file_name = marzo(
             total=8562,
             start=1,
             chunk_size=500,
-            datasources_file=f"src/data/{ds_file_name}",
             speech=True,
+            scheduler_file="src/data/marzo_scheduler.csv",
+            state_db="src/data/marzo.db",
+            metrics_port=9108,
         )
-        text_to_speech("El proceso se ejecutará nuevamente en 1 hora")
-        time.sleep(3600)
+        # The scheduler decides which actas are due, the runs can be closer
+        text_to_speech("El proceso se ejecutará nuevamente en 5 minutos")
+        time.sleep(300)
@@ -1,39 +1,49 @@
+import argparse
 import csv
 import datetime
 import hashlib
 import os
-import time
+import sys
 from pathlib import Path
 
 import pandas as pd
-import pyautogui
 from dotenv import load_dotenv
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.firefox.service import Service
+
+sys.path.append(f"{Path().resolve()}/src/scraping")
+sys.path.append(f"{Path().resolve()}/src/scraping/elecciones")
+from acta_fetcher import ActaFetcher  # noqa: E402
+from browser_pool import BrowserPool, download_image, setup_browser  # noqa: E402
+from dirwatch import DirectoryIndex, DownloadWaiter  # noqa: E402
 
 # Load .env variables
 _ = load_dotenv(dotenv_path=f"{Path().resolve()}/src/.env")
 
+# Waiter of the browser downloads, see get_download_waiter
+DOWNLOAD_WAITER = None
+
+# Index of the files of src/data/0_raw, see get_directory_index
+DIRECTORY_INDEX = None
+
 
 def setup_driver():
-    options = Options()
-    options.binary_location = os.getenv("BROWSER_PATH", None)
-    service = Service(executable_path=os.getenv("BROWSER_DRIVER_PATH", None))
-    options.set_preference("browser.download.folderList", 2)
-    options.set_preference("browser.download.manager.showWhenStarting", False)
-    options.set_preference(
-        "browser.download.dir", f"{os.getenv('DATA_PATH', None)}/0_raw"
-    )
-    options.set_preference(
-        "browser.helperApps.neverAsk.saveToDisk", "image/jpeg, image/png"
-    )
-    options.set_preference(
-        "browser.helperApps.neverAsk.openFile", "image/jpeg, image/png"
-    )
-    driver = webdriver.Firefox(service=service, options=options)
-    return driver
+    return setup_browser(f"{os.getenv('DATA_PATH', None)}/0_raw", headless=False)
+
+
+# Get the waiter of the browser downloads, it watches the directory from the start
+def get_download_waiter():
+    global DOWNLOAD_WAITER
+    if DOWNLOAD_WAITER is None:
+        DOWNLOAD_WAITER = DownloadWaiter("src/data/0_raw")
+    return DOWNLOAD_WAITER
+
+
+# Get the index of the files of src/data/0_raw, it is built on the first lookup
+def get_directory_index():
+    global DIRECTORY_INDEX
+    if DIRECTORY_INDEX is None:
+        DIRECTORY_INDEX = DirectoryIndex("src/data/0_raw")
+    return DIRECTORY_INDEX
 
 
 def scraping_acta(driver, acta, url_type):
@@ -46,24 +56,17 @@ def scraping_acta(driver, acta, url_type):
     driver.get(url_acta)
     driver.find_element(By.CSS_SELECTOR, "body > img")
 
-    # Save image form browser using selenium like save as
-    pyautogui.hotkey("ctrl", "s")
-
-    # Type the file name and press Enter
-    pyautogui.write(f"missing_{url_type}_{acta}")
-    time.sleep(0.2)
-    pyautogui.press("enter")
-    # When replace file dialog appears
-    time.sleep(0.2)
-    pyautogui.press("enter")
-    pyautogui.press("enter")
+    # Save image form browser, it returns once the file is complete
+    file_path = download_image(
+        driver, f"missing_{url_type}_{acta}", get_download_waiter()
+    )
+    get_directory_index().add(os.path.basename(file_path))
 
     # Current acta
     print(driver.current_url)
-    time.sleep(0.3)
 
     # Process report
-    process_report(acta, url_type, driver.current_url)
+    process_report(acta, url_type, driver.current_url, os.path.basename(file_path))
 
 
 def get_hash_file_tse(file_name):
@@ -80,24 +83,22 @@ def get_hash_file_tse(file_name):
 
 
 def get_file_name(acta, url_type):
-    # Get a file that its name startswith missing_{url_type}_{acta} and has any file extension
-    file_name = "not_found"
-    for file in os.listdir("src/data/0_raw"):
-        if file.startswith(f"missing_{url_type}_{acta}."):
-            file_name = file
-            break
-    return file_name
+    # Get the file missing_{url_type}_{acta} with any extension, from the index
+    file_name = get_directory_index().get(f"missing_{url_type}_{acta}")
+    return file_name or "not_found"
 
 
-def process_report(acta, url_type, url_acta):
+def process_report(acta, url_type, url_acta, file_name=None, hash_file_tse=None):
     # Get date time iso3086 format
     date_time = datetime.datetime.now().isoformat()
 
-    # Get file name
-    file_name = get_file_name(acta, url_type)
+    # Get file name, unless the HTTP engine already knows it
+    if file_name is None:
+        file_name = get_file_name(acta, url_type)
 
     # Get hash file tse
-    hash_file_tse = get_hash_file_tse(file_name)
+    if hash_file_tse is None:
+        hash_file_tse = get_hash_file_tse(file_name)
 
     # Save the report in the directory src/data/process_report_missing.csv
     with open("src/data/process_report_missing.csv", "a", newline="") as csvfile:
@@ -149,12 +150,80 @@ def process_missing_actas(driver):
             )
 
 
+def get_missing_actas():
+    # With pandas open the src/data/2_validation/MISSING_FILES.csv and get missing files
+    missing_files = pd.read_csv("src/data/2_validation/MISSING_FILES.csv")
+
+    # The ACTA and URL_TYPE columns may join many actas or URL types with ":"
+    missing_actas = []
+    for acta, url_type in zip(missing_files["ACTA"], missing_files["URL_TYPE"]):
+        for a in str(acta).split(":"):
+            for u in str(url_type).split(":"):
+                missing_actas.append((a, u))
+    return missing_actas
+
+
+def setup_browser_pool(drivers=None):
+    return BrowserPool(
+        "src/data/0_raw", file_name="missing_{url_type}_{acta}", drivers=drivers
+    )
+
+
+def setup_fetcher(workers=16):
+    return ActaFetcher(
+        "src/data/0_raw", file_name="missing_{url_type}_{acta}", workers=workers
+    )
+
+
+def fetch_missing_actas(fetcher):
+    # Download the missing actas with concurrent HTTP requests
+    for acta, url_type, file_name, hash_file_tse, url_acta in fetcher.fetch_many(
+        get_missing_actas()
+    ):
+        print("Acta: ", acta, "URL_TYPE: ", url_type, url_acta)
+        process_report(acta, url_type, url_acta, file_name, hash_file_tse)
+
+
 def main():
-    # Setup driver
-    driver = setup_driver()
+    parser = argparse.ArgumentParser(
+        prog="missing_files",
+        description="Downloads the missing actas to the src/data/0_raw directory",
+    )
 
-    # Process actas not found
-    process_missing_actas(driver)
+    # Drives a pool of headless Firefox instead of the HTTP engine
+    parser.add_argument(
+        "--browser",
+        help="Drives a pool of headless Firefox instead of the HTTP engine",
+        action=argparse.BooleanOptionalAction,
+    )
+
+    # Headless Firefox of the pool, by default one per core
+    parser.add_argument(
+        "--drivers",
+        type=int,
+        default=None,
+        metavar="d",
+        help="Headless Firefox of the pool, by default one per core",
+    )
+
+    # Concurrent downloads of the HTTP engine
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        metavar="w",
+        help="Concurrent downloads of the HTTP engine",
+    )
+
+    args: argparse.Namespace = parser.parse_args()
+
+    # Setup the browser pool or the fetcher and process the missing actas
+    if args.browser:
+        fetcher = setup_browser_pool(args.drivers)
+    else:
+        fetcher = setup_fetcher(args.workers)
+    fetch_missing_actas(fetcher)
+    fetcher.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The modules are imported by their bare name, like the scripts import them
+for path in ["src/aws", "src/scraping", "src/scraping/elecciones"]:
+    sys.path.insert(0, str(ROOT / path))
@@ -0,0 +1,108 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pytest
+from acta_table import COLUMNS, Acta, ActaStatus, ActaTable
+
+
+# Get the hex digest of a value
+def digest(value):
+    return hashlib.sha256(str(value).encode()).hexdigest()
+
+
+# Create an acta with n files
+def make_acta(acta, n, status=ActaStatus.DOWNLOADED):
+    return Acta(
+        url=f"https://preliminar.tse.gob.sv/acta/{acta}",
+        status=status,
+        uploaded=acta % 2 == 0,
+        datetime=f"2026-10-17T00:00:{acta % 60:02d}",
+        file_names=[f"{digest((acta, i))}.jpeg" for i in range(n)],
+        hashes=[digest((acta, i)) for i in range(n)],
+    )
+
+
+# Get the values of an acta or an ActaView
+def values(acta):
+    return (
+        acta.url,
+        acta.status,
+        acta.uploaded,
+        acta.datetime,
+        list(acta.file_names),
+        list(acta.hashes),
+    )
+
+
+@pytest.fixture
+def actas():
+    statuses = list(ActaStatus)
+    return [
+        make_acta(acta, acta % 4, statuses[acta % len(statuses)]) for acta in range(20)
+    ]
+
+
+def test_from_actas_round_trip(actas):
+    table = ActaTable.from_actas(actas)
+    assert len(table) == len(actas)
+    assert [values(acta) for acta in table.to_actas()] == [
+        values(acta) for acta in actas
+    ]
+
+
+def test_csv_round_trip(actas, tmp_path):
+    file_name = str(tmp_path / "marzo.csv")
+    ActaTable.from_actas(actas).to_df().to_csv(file_name, index=False)
+
+    df = pd.read_csv(file_name, usecols=COLUMNS)
+    loaded = ActaTable.from_columns(*(df[column] for column in COLUMNS))
+    assert [values(acta) for acta in loaded] == [values(acta) for acta in actas]
+
+
+def test_arrow_round_trip(actas, tmp_path):
+    pytest.importorskip("pyarrow")
+    table = ActaTable.from_actas(actas)
+    loaded = ActaTable.from_arrow(table.to_arrow())
+    assert [values(acta) for acta in loaded] == [values(acta) for acta in actas]
+
+
+def test_update(actas):
+    table = ActaTable.from_actas(actas)
+    indexes = [0, 3, 7, 19]
+    updated = [make_acta(100 + index, 5 - index % 3) for index in indexes]
+    table.update(indexes, updated)
+
+    expected = list(actas)
+    for index, acta in zip(indexes, updated):
+        expected[index] = acta
+    assert [values(acta) for acta in table] == [values(acta) for acta in expected]
+    assert table.file_counts().tolist() == [len(acta.file_names) for acta in expected]
+
+
+def test_update_nothing(actas):
+    table = ActaTable.from_actas(actas)
+    table.update([], [])
+    assert [values(acta) for acta in table] == [values(acta) for acta in actas]
+
+
+def test_set_files(actas):
+    table = ActaTable.from_actas(actas)
+    table[2].hashes = [digest("new")]
+    table[2].file_names = [f"{digest('new')}.png"]
+    table[5].file_names = []
+    table[5].hashes = []
+    # The buffered files are read back before and after they are applied
+    assert table[2].hashes == [digest("new")]
+    assert table.file_counts().tolist()[2] == 1
+    assert table[5].file_names == []
+    assert len(table.digests) == len(table.file_names)
+    assert values(table[4]) == values(actas[4])
+
+
+def test_take(actas):
+    table = ActaTable.from_actas(actas)
+    taken = table.take(np.array([18, 1, 4]))
+    assert [values(acta) for acta in taken] == [
+        values(actas[index]) for index in [18, 1, 4]
+    ]
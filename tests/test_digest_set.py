@@ -0,0 +1,88 @@
+import hashlib
+
+import pytest
+from digest_set import DigestSet
+
+
+# Get the hex digest of a value
+def digest(value):
+    return hashlib.sha256(str(value).encode()).hexdigest()
+
+
+@pytest.fixture
+def file_name(tmp_path):
+    return str(tmp_path / "digests.bin")
+
+
+def test_add_and_lookup(file_name):
+    digest_set = DigestSet(file_name)
+    assert digest(1) not in digest_set
+    assert digest_set.add(digest(1))
+    assert not digest_set.add(digest(1))
+    assert digest(1) in digest_set
+    assert bytes.fromhex(digest(1)) in digest_set
+    assert f"{digest(1)}.jpeg" in digest_set
+    assert len(digest_set) == 1
+    digest_set.close()
+
+
+def test_merge(file_name):
+    digest_set = DigestSet(file_name)
+    for value in range(50):
+        digest_set.add(digest(value))
+    digest_set.merge()
+    # The log is folded into the sorted file
+    assert len(digest_set) == 50
+    with open(f"{file_name}.log", "rb") as f:
+        assert f.read() == b""
+    with open(file_name, "rb") as f:
+        records = f.read()
+    assert len(records) == 50 * DigestSet.DIGEST_SIZE
+    chunks = [
+        records[i : i + DigestSet.DIGEST_SIZE]
+        for i in range(0, len(records), DigestSet.DIGEST_SIZE)
+    ]
+    assert chunks == sorted(chunks)
+    assert all(digest(value) in digest_set for value in range(50))
+    assert digest(50) not in digest_set
+
+    # The digests added after a merge are merged with the sorted ones
+    assert digest_set.add(digest(50))
+    assert not digest_set.add(digest(10))
+    digest_set.merge()
+    assert len(digest_set) == 51
+    assert all(digest(value) in digest_set for value in range(51))
+    digest_set.close()
+
+
+def test_shared_between_instances(file_name):
+    first = DigestSet(file_name)
+    second = DigestSet(file_name)
+    first.add(digest("a"))
+    # The digests appended by another instance are read from the log
+    assert digest("a") in second
+    assert not second.add(digest("a"))
+    second.add(digest("b"))
+    second.merge()
+    # The merge of another instance replaces the sorted file
+    assert digest("b") in first
+    assert len(first) == 2
+    first.close()
+    second.close()
+
+
+def test_build(tmp_path):
+    directory = tmp_path / "raw"
+    directory.mkdir()
+    content = b"acta"
+    (directory / f"{digest('named')}.jpeg").write_bytes(b"")
+    (directory / "acta_1.png").write_bytes(content)
+    (directory / ".download.part").write_bytes(b"partial")
+    digest_set = DigestSet.build(
+        str(tmp_path / "digests.bin"), [str(directory), str(tmp_path / "missing")]
+    )
+    assert len(digest_set) == 2
+    assert digest("named") in digest_set
+    assert hashlib.sha256(content).hexdigest() in digest_set
+    assert hashlib.sha256(b"partial").hexdigest() not in digest_set
+    digest_set.close()
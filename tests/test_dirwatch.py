@@ -0,0 +1,31 @@
+import hashlib
+import os
+import tempfile
+
+from digest_set import DigestSet
+from dirwatch import PARTIAL_SUFFIX, remove_partial_files
+
+
+def test_remove_partial_files(tmp_path):
+    raw = tmp_path / "0_raw"
+    raw.mkdir()
+    content = b"complete acta"
+    file_hash = hashlib.sha256(content).hexdigest()
+    (raw / f"{file_hash}.jpeg").write_bytes(content)
+    (raw / ".gitkeep").write_bytes(b"")
+    # A download of a killed worker, written like fetch_acta_file_once does
+    partial = b"half an acta"
+    fd, partial_path = tempfile.mkstemp(prefix=".", suffix=PARTIAL_SUFFIX, dir=raw)
+    with os.fdopen(fd, "wb") as f:
+        f.write(partial)
+
+    assert remove_partial_files(str(raw)) == [os.path.basename(partial_path)]
+    assert sorted(os.listdir(raw)) == [".gitkeep", f"{file_hash}.jpeg"]
+    # The partial content never becomes a stored file
+    assert not os.path.exists(raw / f"{hashlib.sha256(partial).hexdigest()}.jpeg")
+    digest_set = DigestSet.build(str(tmp_path / "digests.bin"), [str(raw)])
+    assert file_hash in digest_set
+    assert hashlib.sha256(partial).hexdigest() not in digest_set
+    digest_set.close()
+
+    assert remove_partial_files(str(raw)) == []
@@ -0,0 +1,102 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from repoll_scheduler import RepollScheduler
+
+
+# Create an acta with the attributes the scheduler reads
+def make_acta(status, uploaded=False, hashes=(), url="https://tse.gob.sv/acta/1"):
+    return SimpleNamespace(
+        url=url,
+        status=SimpleNamespace(value=status),
+        uploaded=uploaded,
+        hashes=list(hashes),
+    )
+
+
+@pytest.fixture
+def scheduler():
+    return RepollScheduler(
+        base_interval=300, max_interval=3600, hot_window=3600, settled_interval=86400
+    )
+
+
+def test_new_actas_are_due(scheduler):
+    for status in ["pending", "downloaded", "not_found", "error", "forbidden"]:
+        assert scheduler.is_due(make_acta(status, uploaded=True))
+
+
+def test_downloaded_not_uploaded_is_due(scheduler):
+    now = scheduler.now()
+    acta = make_acta("downloaded", hashes=["a"])
+    scheduler.observe(acta, now)
+    assert scheduler.is_due(acta, now)
+
+
+def test_settled_acta_is_polled_every_settled_interval(scheduler):
+    now = scheduler.now()
+    acta = make_acta("downloaded", uploaded=True, hashes=["a"])
+    scheduler.observe(acta, now)
+    assert not scheduler.is_due(acta, now + timedelta(hours=23))
+    assert scheduler.is_due(acta, now + timedelta(days=1))
+
+
+def test_status_change_is_due(scheduler):
+    now = scheduler.now()
+    scheduler.observe(make_acta("not_found"), now)
+    assert not scheduler.is_due(make_acta("not_found"), now)
+    assert scheduler.is_due(make_acta("pending"), now)
+
+
+@pytest.mark.parametrize("status", ["error", "forbidden"])
+def test_failures_back_off(scheduler, status):
+    now = scheduler.now()
+    acta = make_acta(status)
+    intervals = []
+    for _ in range(6):
+        scheduler.observe(acta, now)
+        next_poll = scheduler.history[acta.url]["NEXT_POLL"]
+        assert not scheduler.is_due(acta, next_poll - timedelta(seconds=1))
+        assert scheduler.is_due(acta, next_poll)
+        intervals.append((next_poll - now).total_seconds())
+        now = next_poll
+    assert intervals == [300, 600, 1200, 2400, 3600, 3600]
+
+
+def test_not_found_backs_off_after_hot_window(scheduler):
+    now = scheduler.now()
+    acta = make_acta("not_found")
+    scheduler.observe(acta, now)
+    # Recently published, polled every base_interval
+    assert scheduler.history[acta.url]["NEXT_POLL"] == now + timedelta(seconds=300)
+    later = now + timedelta(hours=2)
+    scheduler.observe(acta, later)
+    assert scheduler.history[acta.url]["NEXT_POLL"] == later + timedelta(seconds=600)
+
+
+def test_save_and_load(scheduler, tmp_path):
+    now = scheduler.now()
+    scheduler.observe(make_acta("error", url="a"), now)
+    scheduler.observe(make_acta("error", url="a"), now)
+    scheduler.observe(make_acta("downloaded", True, ["h"], url="b"), now)
+    file_name = str(tmp_path / "scheduler.csv")
+    scheduler.save(file_name)
+
+    loaded = RepollScheduler()
+    loaded.load(file_name)
+    assert len(loaded) == 2
+    assert loaded.history["a"]["FAILURE_COUNT"] == 2
+    assert loaded.history["b"]["NEXT_POLL"] == scheduler.history["b"]["NEXT_POLL"]
+
+
+def test_select_order(scheduler):
+    now = scheduler.now()
+    actas = [
+        make_acta("not_found", url="a"),
+        make_acta("error", url="b"),
+        make_acta("pending", url="c"),
+    ]
+    for acta in actas:
+        scheduler.observe(acta, now - timedelta(days=1))
+    assert scheduler.select(actas, now) == [2, 1, 0]
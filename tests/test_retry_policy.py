@@ -0,0 +1,87 @@
+import time
+
+import pytest
+import requests
+from retry_policy import CircuitBreaker, RetryPolicy
+
+
+@pytest.mark.parametrize(
+    "error, status_code, reason",
+    [
+        (requests.exceptions.ConnectTimeout(), None, "timeout"),
+        (requests.exceptions.ReadTimeout(), None, "timeout"),
+        (requests.exceptions.ConnectionError(), None, "connection"),
+        (requests.exceptions.ChunkedEncodingError(), None, "connection"),
+        (requests.exceptions.InvalidURL(), None, None),
+        (None, 503, "status_503"),
+        (None, 500, "status_500"),
+        (None, 200, None),
+        (None, 403, None),
+        (None, 404, None),
+        (None, 429, None),
+    ],
+)
+def test_classify(error, status_code, reason):
+    assert RetryPolicy.classify(error, status_code) == reason
+
+
+def test_max_attempts():
+    policy = RetryPolicy(max_attempts=3, min_budget=10)
+    assert policy.allow(1)
+    assert policy.allow(2)
+    assert not policy.allow(3)
+
+
+def test_budget():
+    policy = RetryPolicy(max_attempts=10, budget_ratio=0.5, min_budget=2)
+    assert policy.allow(1)
+    assert policy.allow(1)
+    # The budget is spent, the retries wait for new requests
+    assert not policy.allow(1)
+    policy.record_request()
+    assert not policy.allow(1)
+    policy.record_request()
+    assert policy.allow(1)
+
+
+def test_backoff():
+    policy = RetryPolicy(base_delay=0.5, max_delay=3.0)
+    for attempt, limit in [(1, 0.5), (2, 1.0), (3, 2.0), (4, 3.0), (10, 3.0)]:
+        assert all(0 <= policy.backoff(attempt) <= limit for _ in range(100))
+
+
+def test_circuit_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30.0)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_success_resets_failures():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    assert not breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.2)
+    assert breaker.record_failure()
+    start = time.monotonic()
+    breaker.wait()
+    # The request waited the reset timeout and is the probe
+    assert time.monotonic() - start >= 0.15
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # A failed probe opens the circuit again
+    assert breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # A successful probe closes it
+    breaker.wait()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.wait() == 0.0
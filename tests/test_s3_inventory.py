@@ -0,0 +1,177 @@
+import os
+
+import pytest
+from awsinventory import S3Inventory
+from awstransfer import S3Transfer
+
+
+class FakePaginator:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, Bucket):
+        return self.pages
+
+
+class FakeS3Client:
+    """The calls of the S3 client used by S3Transfer and S3Inventory, in memory."""
+
+    def __init__(self, pages=()):
+        self.pages = list(pages)
+        self.puts = []
+        self.uploads = []
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return FakePaginator(self.pages)
+
+    def put_object(self, Bucket, Key, Body):
+        self.puts.append((Bucket, Key, Body.read()))
+        return {"ETag": f'"etag-{Key}"'}
+
+    def upload_file(self, file_name, bucket, key, Config=None, Callback=None):
+        self.uploads.append((bucket, key))
+
+
+@pytest.fixture
+def inventory(tmp_path):
+    inventory = S3Inventory(str(tmp_path / "s3_inventory.db"))
+    yield inventory
+    inventory.close()
+
+
+@pytest.fixture
+def image(tmp_path):
+    file_name = tmp_path / "acta.jpeg"
+    file_name.write_bytes(b"acta")
+    return str(file_name)
+
+
+def test_refresh(inventory):
+    inventory.put("bucket", "stale.jpeg", 1)
+    inventory.put("other", "kept.jpeg", 1)
+    client = FakeS3Client(
+        [
+            {"Contents": [{"Key": "a.jpeg", "Size": 4, "ETag": '"a"'}]},
+            {"Contents": [{"Key": "b.jpeg", "Size": 5}]},
+            {},
+        ]
+    )
+    assert inventory.refresh(client, "bucket") == 3
+    assert inventory.get("bucket", "a.jpeg") == {"size": 4, "etag": '"a"'}
+    assert inventory.get("bucket", "b.jpeg") == {"size": 5, "etag": None}
+    # The listing replaces the inventory of the bucket only
+    assert inventory.get("bucket", "stale.jpeg") is None
+    assert inventory.contains("other", "kept.jpeg")
+
+
+def test_contains(inventory):
+    inventory.put("bucket", "a.jpeg", 4, '"a"')
+    assert inventory.contains("bucket", "a.jpeg")
+    assert inventory.contains("bucket", "a.jpeg", 4)
+    assert not inventory.contains("bucket", "a.jpeg", 5)
+    assert not inventory.contains("bucket", "b.jpeg")
+    inventory.delete("bucket", "a.jpeg")
+    assert not inventory.contains("bucket", "a.jpeg")
+
+
+def test_upload_adds_to_inventory(inventory, image):
+    client = FakeS3Client()
+    transfer = S3Transfer(client, "bucket", inventory=inventory)
+    assert transfer.upload_file(image)
+    assert client.puts == [("bucket", "acta.jpeg", b"acta")]
+    # The ETag of the PUT response is kept
+    assert inventory.get("bucket", "acta.jpeg") == {
+        "size": 4,
+        "etag": '"etag-acta.jpeg"',
+    }
+    transfer.shutdown()
+
+
+def test_upload_skips_inventory_objects(inventory, image):
+    inventory.put("bucket", "acta.jpeg", 4)
+    client = FakeS3Client()
+    skipped = []
+    transfer = S3Transfer(client, "bucket", inventory=inventory, on_skip=skipped.append)
+    assert not transfer.upload_file(image)
+    assert client.puts == []
+    assert skipped == ["acta.jpeg"]
+    transfer.shutdown()
+
+
+def test_upload_replaces_different_size(inventory, image):
+    inventory.put("bucket", "acta.jpeg", 3)
+    client = FakeS3Client()
+    transfer = S3Transfer(client, "bucket", inventory=inventory)
+    assert transfer.upload_file(image)
+    assert len(client.puts) == 1
+    assert inventory.contains("bucket", "acta.jpeg", 4)
+    transfer.shutdown()
+
+
+def test_multipart_upload(inventory, image):
+    client = FakeS3Client()
+    transfer = S3Transfer(client, "bucket", inventory=inventory, multipart_threshold=1)
+    assert transfer.upload_file(image, "big.jpeg")
+    assert client.uploads == [("bucket", "big.jpeg")]
+    # The managed upload has no ETag
+    assert inventory.get("bucket", "big.jpeg") == {"size": 4, "etag": None}
+    transfer.shutdown()
+
+
+def test_refresh_syncs_the_bucket(inventory):
+    assert not inventory.synced("bucket")
+    inventory.refresh(FakeS3Client([{}]), "bucket")
+    assert inventory.synced("bucket")
+    assert not inventory.synced("other")
+
+
+def test_is_synced_does_not_create_the_file(tmp_path):
+    file_name = str(tmp_path / "s3_inventory.db")
+    assert not S3Inventory.is_synced(file_name, "bucket")
+    assert not os.path.exists(file_name)
+
+
+def test_build_empty_unsynced_inventory(tmp_path, image):
+    file_name = str(tmp_path / "s3_inventory.db")
+    # The uploads of the uploader open the inventory before any listing
+    inventory = S3Inventory(file_name)
+    transfer = S3Transfer(FakeS3Client(), "bucket", inventory=inventory)
+    transfer.upload_file(image)
+    transfer.shutdown()
+    inventory.close()
+    assert os.path.exists(file_name)
+    assert not S3Inventory.is_synced(file_name, "bucket")
+
+    client = FakeS3Client(
+        [{"Contents": [{"Key": f"{key}.jpeg", "Size": 4} for key in range(3)]}]
+    )
+    assert S3Inventory.build(file_name, client, "bucket") == 3
+    assert S3Inventory.is_synced(file_name, "bucket")
+    inventory = S3Inventory(file_name)
+    assert inventory.contains("bucket", "2.jpeg", 4)
+    inventory.close()
+    # The temporary files of the build are removed
+    assert sorted(os.listdir(tmp_path)) == ["acta.jpeg", "s3_inventory.db"]
+
+
+def test_failed_build_keeps_the_inventory(tmp_path):
+    file_name = str(tmp_path / "s3_inventory.db")
+    inventory = S3Inventory(file_name)
+    inventory.put("bucket", "kept.jpeg", 1)
+    inventory.close()
+
+    class FailingPaginator:
+        def paginate(self, Bucket):
+            yield {"Contents": [{"Key": "a.jpeg", "Size": 4}]}
+            raise RuntimeError("listing failed")
+
+    client = FakeS3Client()
+    client.get_paginator = lambda name: FailingPaginator()
+    with pytest.raises(RuntimeError):
+        S3Inventory.build(file_name, client, "bucket")
+    assert not S3Inventory.is_synced(file_name, "bucket")
+    assert sorted(os.listdir(tmp_path)) == ["s3_inventory.db"]
+    inventory = S3Inventory(file_name)
+    assert inventory.contains("bucket", "kept.jpeg")
+    inventory.close()